@@ -103,7 +103,7 @@ setup(
     long_description_content_type="text/markdown",
     packages=find_packages(include=['smrf', 'smrf.*']),
     install_requires=requirements,
-    python_requires='>=3.6',
+    python_requires='>=3.7',
     include_package_data=True,
     package_data={
         'smrf': [
@@ -122,7 +122,6 @@ setup(
         'Natural Language :: English',
         'License :: CC0 1.0 Universal (CC0 1.0) Public Domain Dedication',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
         'Programming Language :: Python :: 3.9'
@@ -136,7 +135,8 @@ setup(
     scripts=[
         'scripts/update_configs',
         'scripts/run_smrf',
-        'scripts/gen_maxus'
+        'scripts/gen_maxus',
+        'scripts/benchmark_smrf'
     ],
     extras_require={
         'docs': [
@@ -1,3 +1,4 @@
+import copy
 import logging
 from datetime import datetime
 
@@ -7,6 +8,9 @@ from smrf.data.load_topo import Topo
 class GriddedInput:
     TYPE = 'gridded'
 
+    # loader state that is carried from one time step to the next
+    STATE_VARIABLES = frozenset()
+
     def __init__(self, start_date, end_date, bbox, topo, config):
         """
         Base class to inherit for all gridded data input types.
@@ -74,3 +78,25 @@ class GriddedInput:
                             Topo.__name__)
         else:
             self._topo = value
+
+    def get_state(self):
+        """Get a copy of the loader state that is carried between time steps
+
+        Returns:
+            dict: state variable name and a copy of the value
+        """
+
+        return {
+            variable: copy.deepcopy(getattr(self, variable))
+            for variable in self.STATE_VARIABLES if hasattr(self, variable)
+        }
+
+    def set_state(self, state):
+        """Set the loader state from :func:`get_state`
+
+        Args:
+            state (dict): state variable name and value
+        """
+
+        for variable, value in state.items():
+            setattr(self, variable, copy.deepcopy(value))
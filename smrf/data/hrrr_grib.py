@@ -26,6 +26,10 @@ class InputGribHRRR(GriddedInput):
 
     TIME_STEP = pd.to_timedelta(20, 'minutes')
 
+    STATE_VARIABLES = frozenset([
+        'cf_memory'
+    ])
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
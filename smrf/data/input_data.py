@@ -126,18 +126,18 @@ class InputData:
                 setattr(self, variable, d[self.start_date:self.end_date])
 
     def metadata_pixel_location(self):
-        """Set the pixel location in the topo for each station
+        """Set the pixel location in the full model domain for each station
         """
 
         self.metadata['xi'] = self.metadata.apply(
             lambda row: self.find_pixel_location(
                 row,
-                self.topo.x,
+                self.topo.domain_x,
                 'utm_x'), axis=1)
         self.metadata['yi'] = self.metadata.apply(
             lambda row: self.find_pixel_location(
                 row,
-                self.topo.y,
+                self.topo.domain_y,
                 'utm_y'), axis=1)
 
     def model_domain_grid(self):
@@ -152,8 +152,10 @@ class InputData:
         dlon = np.zeros_like(dlat)
 
         # Convert the UTM extents to lat long extents
-        ur = self.get_latlon(np.max(self.topo.x), np.max(self.topo.y))
-        ll = self.get_latlon(np.min(self.topo.x), np.min(self.topo.y))
+        ur = self.get_latlon(
+            np.max(self.topo.domain_x), np.max(self.topo.domain_y))
+        ll = self.get_latlon(
+            np.min(self.topo.domain_x), np.min(self.topo.domain_y))
 
         # Put into numpy arrays for convenience later
         dlat[0], dlon[0] = ll
@@ -1,12 +1,19 @@
 
+import copy
 import logging
+import os
+import shutil
+import tempfile
 
 import numpy as np
 from netCDF4 import Dataset
 from topocalc import gradient
+from topocalc.horizon import horizon
 from topocalc.viewf import viewf
 from utm import to_latlon
 
+from smrf.utils.cache import hash_key
+
 
 class Topo:
     """
@@ -18,23 +25,52 @@ class Topo:
     - veg k
     - veg tau
 
-    Inputs to topo are the topo section of the config file
+    Inputs to topo are the topo section of the config file and the float
+    type of the images. The grid coordinates X and Y and the aspect are
+    always double precision.
 
     """
 
     IMAGES = ['dem', 'mask', 'veg_type', 'veg_height', 'veg_k', 'veg_tau']
 
-    def __init__(self, topoConfig):
+    # images calculated from the DEM and the grid coordinates
+    DERIVED_IMAGES = ['X', 'Y', 'slope_radians', 'sin_slope', 'aspect',
+                      'sky_view_factor', 'terrain_config_factor']
+
+    # images calculated when first used by gradient and viewf
+    GRADIENT_IMAGES = ['slope_radians', 'sin_slope', 'aspect']
+    VIEWF_IMAGES = ['sky_view_factor', 'terrain_config_factor']
+
+    # the aspect is kept in double as pi rounds up in single precision and
+    # would be outside of the -pi to pi range
+    DOUBLE_IMAGES = ['aspect']
+
+    # flat indices of the grid cells of a compressed topo, None for a grid
+    cells = None
+
+    # topo a tile or compressed topo is made from and the tile rows and
+    # columns, the lazy images are calculated over the source grid
+    _source = None
+
+    # horizon cosines by azimuth, built when first used
+    _horizon_library = None
+
+    # scale of the int16 horizon cosines in the horizon library, the
+    # cosines are at most 1 so the scaled cosines fit in an int16
+    HORIZON_SCALE = 2**14
+
+    def __init__(self, topoConfig, dtype=np.float64):
         self.topoConfig = topoConfig
+        self.dtype = dtype
+        self.shared_location = None
 
         self._logger = logging.getLogger(__name__)
         self._logger.info('Reading [TOPO] and making stoporad input')
 
         self.readNetCDF()
 
-        # calculate the gradient and the sky view factor
-        self.gradient()
-        self.viewf()
+        # the gradient and the sky view factor are calculated when first
+        # used, see __getattr__
 
     def readNetCDF(self):
         """
@@ -64,6 +100,14 @@ class Topo:
         self.y = f.variables['y'][:]
         [self.X, self.Y] = np.meshgrid(self.x, self.y)
 
+        # the full model domain, a tile will only cover part of the domain
+        self.domain_x = self.x
+        self.domain_y = self.y
+        self.domain_mask = self.mask
+        self.row_offset = 0
+        self.col_offset = 0
+        self.grid_shape = (self.ny, self.nx)
+
         # There is not a great NetCDF convention on direction for the y-axis.
         # So there is the possibility that the dy will be positive or negative.
         # For the gradient calculations this needs to be absolute spacing.
@@ -101,14 +145,14 @@ class Topo:
         """
 
         # netCDF files are stored typically as 32-bit float, so convert
-        # to double or int
+        # to the topo float type or int
         for v_smrf in self.IMAGES:
 
             if v_smrf in f.variables.keys():
                 if v_smrf == 'veg_type':
                     result = f.variables[v_smrf][:].astype(int)
                 else:
-                    result = f.variables[v_smrf][:].astype(np.float64)
+                    result = f.variables[v_smrf][:].astype(self.dtype)
 
             setattr(self, v_smrf, result)
 
@@ -145,6 +189,107 @@ class Topo:
 
         return x.mean(), y.mean()
 
+    def __getattr__(self, name):
+        """
+        Calculate the gradient or sky view factor images when first used so
+        runs without solar or thermal do not calculate the sky view factor.
+        A tile or compressed topo takes the images from its source so the
+        neighbourhood of the cells is included.
+        """
+
+        if name in self.GRADIENT_IMAGES + self.VIEWF_IMAGES and \
+                self._source is not None:
+            source, rows, cols = self._source
+            image = getattr(source, name)
+            if rows is None:
+                image = self.gather(image)
+            else:
+                image = image[rows, cols]
+            setattr(self, name, image)
+
+        elif name in self.GRADIENT_IMAGES:
+            self.gradient()
+        elif name in self.VIEWF_IMAGES:
+            self.viewf()
+        else:
+            raise AttributeError("'{}' object has no attribute '{}'".format(
+                type(self).__name__, name))
+
+        return self.__dict__[name]
+
+    def derived_images(self, names, function, *args):
+        """
+        Load images calculated from the DEM from the ``derived_cache`` or
+        calculate them with ``function(*args)`` and store them. The images
+        are stored in a netCDF file named by a hash of the DEM, the grid
+        spacing, the float type and the arguments. The images are stored in
+        the topo float type except for the ``DOUBLE_IMAGES``.
+
+        Args:
+            names (list): names of the images
+            function (callable): calculates the images from the DEM
+            args: arguments to the function
+
+        Returns:
+            list: images in the topo float type or double precision
+        """
+
+        location = self.topoConfig.get('derived_cache')
+        if location is None:
+            return self.image_types(names, function(*args))
+
+        key = hash_key(names, self.dem, self.dx, self.dy,
+                       np.dtype(self.dtype).str, *args)
+        path = os.path.join(location, 'topo_{}.nc'.format(key))
+
+        if os.path.isfile(path):
+            try:
+                with Dataset(path, 'r') as f:
+                    f.set_always_mask(False)
+                    images = self.image_types(
+                        names, [f.variables[v][:] for v in names])
+
+                self._logger.debug('Loaded {} from {}'.format(
+                    ', '.join(names), path))
+                return images
+
+            except (OSError, KeyError):
+                self._logger.warning('Could not load {}'.format(path))
+
+        images = self.image_types(names, function(*args))
+
+        # write to a temporary file so runs can share the cache
+        os.makedirs(location, exist_ok=True)
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with Dataset(tmp, 'w', format='NETCDF4') as f:
+            f.createDimension('y', self.ny)
+            f.createDimension('x', self.nx)
+            for v, image in zip(names, images):
+                f.createVariable(v, image.dtype, ('y', 'x'), zlib=True)
+                f.variables[v][:] = image
+        os.replace(tmp, path)
+
+        self._logger.debug('Stored {} to {}'.format(', '.join(names), path))
+
+        return images
+
+    def image_types(self, names, images):
+        """
+        Convert the derived images to the topo float type, the
+        ``DOUBLE_IMAGES`` are kept in double precision
+
+        Args:
+            names (list): names of the images
+            images (list): double precision images
+
+        Returns:
+            list: converted images
+        """
+
+        return [np.asarray(image, dtype=np.float64 if v in self.DOUBLE_IMAGES
+                           else self.dtype)
+                for v, image in zip(names, images)]
+
     def gradient(self):
         """
         Calculate the gradient and aspect
@@ -153,24 +298,432 @@ class Topo:
         func = self.topoConfig['gradient_method']
 
         # calculate the gradient and aspect
+        self.slope_radians, self.sin_slope, self.aspect = self.derived_images(
+            self.GRADIENT_IMAGES, self.calculate_gradient, func)
+
+    def calculate_gradient(self, func):
+        """
+        Calculate the slope and aspect from the DEM
+
+        Args:
+            func (str): topocalc gradient function
+
+        Returns:
+            tuple: slope, sine of the slope and aspect in radians
+        """
+
         g, a = getattr(gradient, func)(
-            self.dem, self.dx, self.dy, aspect_rad=True)
-        self.slope_radians = g
+            self.dem.astype(np.float64), self.dx, self.dy, aspect_rad=True)
 
         # following IPW convention for slope as sin(Slope)
-        self.sin_slope = np.sin(g)
-        self.aspect = a
+        return g, np.sin(g), a
 
     def viewf(self):
         """Calculate the sky view factor
         """
 
-        svf, tcf = viewf(
-            self.dem,
+        self.sky_view_factor, self.terrain_config_factor = \
+            self.derived_images(
+                self.VIEWF_IMAGES,
+                self.calculate_viewf,
+                self.topoConfig['gradient_method'],
+                self.topoConfig['sky_view_factor_angles'])
+
+    def calculate_viewf(self, gradient_method, nangles):
+        """
+        Calculate the sky view factor and terrain configuration factor from
+        the DEM
+
+        Args:
+            gradient_method (str): method of the slope and aspect
+            nangles (int): number of directions of the horizon
+
+        Returns:
+            tuple: sky view factor and terrain configuration factor
+        """
+
+        return viewf(
+            self.dem.astype(np.float64),
             self.dx,
-            nangles=self.topoConfig['sky_view_factor_angles'],
-            sin_slope=self.sin_slope,
+            nangles=nangles,
+            sin_slope=self.sin_slope.astype(np.float64),
             aspect=self.aspect)
 
-        self.sky_view_factor = svf
-        self.terrain_config_factor = tcf
+    def horizon(self, azimuth):
+        """
+        Tangents of the horizon angles of the topo cells for the sun
+        azimuth. The horizon is calculated over the grid so the terrain
+        around the cells of a compressed topo is included. With a
+        ``horizon_increment`` the cosines are interpolated from the
+        :func:`~smrf.data.load_topo.Topo.horizon_library` instead.
+
+        Args:
+            azimuth (float): sun azimuth, -180 to 180 degrees with 0 south
+
+        Returns:
+            np.ndarray: tangents of the horizon angles
+        """
+
+        if self.topoConfig.get('horizon_increment') is None:
+            return self.calculate_horizon(azimuth)
+
+        library = self.horizon_library()
+        n = len(library) - 1
+
+        # linear interpolation of the cosines between the bracketing azimuths
+        position = (azimuth + 180) / 360 * n
+        k = min(int(position), n - 1)
+        w = position - k
+
+        return np.tan((library[k] * (1 - w) + library[k + 1] * w) /
+                      self.HORIZON_SCALE)
+
+    def calculate_horizon(self, azimuth):
+        """
+        Calculate the tangents of the horizon angles for the azimuth
+
+        Args:
+            azimuth (float): sun azimuth
+
+        Returns:
+            np.ndarray: tangents of the horizon angles
+        """
+
+        return np.tan(self.horizon_cosines(azimuth))
+
+    def horizon_cosines(self, azimuth):
+        """
+        Calculate the absolute cosines of the angles to the horizon from
+        ``topocalc.horizon.horizon`` for the azimuth
+
+        Args:
+            azimuth (float): sun azimuth
+
+        Returns:
+            np.ndarray: cosines of the angles to the horizon, 0 to 1
+        """
+
+        dem = self.dem if self.cells is None else self.grid_dem
+        return np.abs(self.gather(horizon(azimuth, dem, self.dx)))
+
+    def horizon_library(self):
+        """
+        Library of the horizon cosines every ``horizon_increment`` degrees
+        of azimuth from -180 to 180, built once per DEM. The cosines are
+        kept as int16 scaled by ``HORIZON_SCALE``, unlike the tangents they
+        are bounded so the steepest horizons fit in an int16. With a
+        ``derived_cache`` the library is stored as a numpy file named by a
+        hash of the DEM and memory mapped by the next runs.
+
+        Returns:
+            np.ndarray: library of shape (number of azimuths + 1, ny, nx)
+        """
+
+        if self._horizon_library is not None:
+            return self._horizon_library
+
+        n = int(round(360 / self.topoConfig['horizon_increment']))
+
+        location = self.topoConfig.get('derived_cache')
+        path = None
+        if location is not None:
+            dem = self.dem if self.cells is None else self.grid_dem
+            key = hash_key('horizon_cosines', dem, self.cells, self.dx, n)
+            path = os.path.join(location, 'horizon_{}.npy'.format(key))
+
+            if os.path.isfile(path):
+                self._horizon_library = np.load(path, mmap_mode='r')
+                self._logger.debug(
+                    'Loaded the horizon library from {}'.format(path))
+                return self._horizon_library
+
+        self._logger.info(
+            'Building the horizon library for {} azimuths'.format(n))
+
+        library = np.empty((n + 1, self.ny, self.nx), dtype=np.int16)
+        for i, azimuth in enumerate(np.linspace(-180, 180, n + 1)[:-1]):
+            library[i] = np.round(
+                self.horizon_cosines(azimuth) * self.HORIZON_SCALE)
+        library[n] = library[0]
+
+        if path is not None:
+            # write to a temporary file so runs can share the cache
+            os.makedirs(location, exist_ok=True)
+            tmp = '{}.{}.tmp.npy'.format(path[:-4], os.getpid())
+            np.save(tmp, library)
+            os.replace(tmp, path)
+            library = np.load(path, mmap_mode='r')
+
+        self._horizon_library = library
+
+        return library
+
+    def tile(self, rows, cols):
+        """
+        Create a Topo for a window of the model domain. All images are
+        subset to the window while the domain center and the full domain
+        coordinates and mask are kept, so stations outside of the window are
+        still located in the full domain.
+
+        The images of the tile are views into the images of the domain so a
+        tile of an attached :func:`~smrf.data.load_topo.Topo.share` does not
+        copy the images. Images that are not calculated yet are calculated
+        over the domain when the tile first uses them.
+
+        Args:
+            rows (slice): rows of the domain in the tile
+            cols (slice): columns of the domain in the tile
+
+        Returns:
+            Topo: topo for the tile
+        """
+
+        tile = copy.copy(self)
+        tile._source = (self, rows, cols)
+
+        # only the calculated images so the lazy images stay lazy
+        for v in self.IMAGES + self.DERIVED_IMAGES:
+            if v in self.__dict__:
+                setattr(tile, v, getattr(self, v)[rows, cols])
+
+        tile.x = self.x[cols]
+        tile.y = self.y[rows]
+        tile.ny, tile.nx = tile.dem.shape
+        tile.grid_shape = (tile.ny, tile.nx)
+
+        tile.row_offset = self.row_offset + rows.start
+        tile.col_offset = self.col_offset + cols.start
+        tile.domain_mask = self.domain_mask.astype(bool)
+
+        # the tile images are windows and not the shared images
+        tile.shared_location = None
+        tile._horizon_library = None
+
+        return tile
+
+    def compress(self):
+        """
+        Create a Topo of only the cells in the mask. The images are gathered
+        into arrays of shape ``(1, ncells)`` so the distribute modules and
+        the C kernels run on the masked cells only. The grid coordinates
+        ``x`` and ``y``, the ``grid_shape`` and the ``grid_dem`` for the
+        neighbourhood calculations are kept so the distributed values can be
+        expanded back to the grid with
+        :func:`~smrf.data.load_topo.Topo.expand`. Images that are not
+        calculated yet are calculated over the grid when first used.
+
+        Returns:
+            Topo: topo of the masked cells
+        """
+
+        if self.cells is not None:
+            return self
+
+        compressed = copy.copy(self)
+        compressed.cells = np.flatnonzero(self.mask)
+        compressed.grid_dem = self.dem
+        compressed._source = (self, None, None)
+
+        # only the calculated images so the lazy images stay lazy
+        for v in self.IMAGES + self.DERIVED_IMAGES:
+            if v in self.__dict__:
+                setattr(compressed, v, compressed.gather(getattr(self, v)))
+
+        compressed.ny, compressed.nx = compressed.dem.shape
+
+        # the compressed images are copies and not the shared images
+        compressed.shared_location = None
+        compressed._horizon_library = None
+
+        self._logger.info('Compressed topo to {} of {} cells'.format(
+            compressed.nx, self.dem.size))
+
+        return compressed
+
+    def gather(self, image):
+        """
+        Gather the cells of a compressed topo from images of the grid. Any
+        leading axes, like time, are kept.
+
+        Args:
+            image (np.ndarray): image with the grid as the last two axes
+
+        Returns:
+            np.ndarray: image of the topo cells, the image if the topo is not
+            compressed
+        """
+
+        if self.cells is None:
+            return image
+
+        image = np.asarray(image)
+        lead = image.shape[:-2]
+        return image.reshape(lead + (-1,))[..., np.newaxis, self.cells]
+
+    def expand(self, data, fill_value=0):
+        """
+        Expand distributed values of a compressed topo to the grid, the
+        inverse of :func:`~smrf.data.load_topo.Topo.gather`
+
+        Args:
+            data (np.ndarray): values of the topo cells
+            fill_value: value of the grid cells outside of the mask
+
+        Returns:
+            np.ndarray: values on the grid, the data if the topo is not
+            compressed or the data is already on the grid
+        """
+
+        if self.cells is None:
+            return data
+
+        data = np.asarray(data)
+        if data.shape[-2:] == self.grid_shape:
+            return data
+
+        lead = data.shape[:-2]
+        grid = np.full(lead + (np.prod(self.grid_shape),), fill_value,
+                       dtype=data.dtype)
+        grid[..., self.cells] = data[..., 0, :]
+
+        return grid.reshape(lead + self.grid_shape)
+
+    def window(self, image):
+        """
+        Subset an image of the full model domain, like the maxus library,
+        to the topo which may be a tile or compressed
+
+        Args:
+            image: array or netCDF variable with the model domain as the
+                last two axes
+
+        Returns:
+            np.ndarray: image of the topo
+        """
+
+        ny, nx = self.grid_shape
+        return self.gather(image[
+            ...,
+            self.row_offset:self.row_offset + ny,
+            self.col_offset:self.col_offset + nx])
+
+    def pixel_index(self, yi, xi):
+        """
+        Index into the topo images of pixels in the model domain, like the
+        station pixels
+
+        Args:
+            yi (np.ndarray): rows of the pixels in the model domain
+            xi (np.ndarray): columns of the pixels in the model domain
+
+        Returns:
+            tuple: index of the pixels into the images and True for the
+            pixels in the topo, the index of the other pixels is not valid
+        """
+
+        ny, nx = self.grid_shape
+        yi = np.asarray(yi) - self.row_offset
+        xi = np.asarray(xi) - self.col_offset
+        in_topo = (yi >= 0) & (yi < ny) & (xi >= 0) & (xi < nx)
+
+        if self.cells is None:
+            return (yi, xi), in_topo
+
+        # position of the pixels in the sorted cells
+        flat = np.where(in_topo, yi * nx + xi, -1)
+        index = np.minimum(
+            np.searchsorted(self.cells, flat), len(self.cells) - 1)
+        in_topo &= self.cells[index] == flat
+
+        return (np.zeros_like(index), index), in_topo
+
+    @property
+    def shared_images(self):
+        """Images that are shared between processes by
+        :func:`~smrf.data.load_topo.Topo.share`
+        """
+        return [v for v in self.IMAGES + self.DERIVED_IMAGES +
+                ['domain_mask', 'grid_dem', 'cells']
+                if self.__dict__.get(v) is not None]
+
+    def share(self, location=None):
+        """
+        Publish the images to memory mapped files so the Topo can be sent to
+        other processes without copying the images. Pickling a shared Topo
+        only stores the location of the images, which are attached as read
+        only arrays when unpickled. Every process attaching to the images
+        uses the same memory, no matter the size of the domain. The source
+        of a tile or compressed topo is shared with it so the images that
+        are not calculated yet can still be calculated over the grid.
+
+        Args:
+            location (str, optional): directory to publish the images to.
+                Defaults to a new temporary directory.
+
+        Returns:
+            str: location of the shared images
+        """
+
+        if location is None:
+            location = tempfile.mkdtemp(prefix='smrf_topo_')
+        else:
+            os.makedirs(location, exist_ok=True)
+
+        for v in self.shared_images:
+            np.save(os.path.join(location, '{}.npy'.format(v)),
+                    getattr(self, v))
+
+        if self._source is not None:
+            self._source[0].share(os.path.join(location, 'source'))
+
+        self.shared_location = location
+        self._logger.debug('Shared topo images to {}'.format(location))
+
+        return location
+
+    def unshare(self):
+        """
+        Remove the shared images published by
+        :func:`~smrf.data.load_topo.Topo.share`. Processes already attached
+        to the images can still read them.
+        """
+
+        if self.shared_location is not None:
+            if self._source is not None:
+                self._source[0].unshare()
+            shutil.rmtree(self.shared_location)
+            self.shared_location = None
+
+    def attach(self, images=None):
+        """
+        Attach to the shared images as read only memory mapped arrays
+
+        Args:
+            images (list, optional): images to attach. Defaults to
+                :attr:`~smrf.data.load_topo.Topo.shared_images`
+        """
+
+        if images is None:
+            images = self.shared_images
+
+        for v in images:
+            setattr(self, v, np.asarray(np.load(
+                os.path.join(self.shared_location, '{}.npy'.format(v)),
+                mmap_mode='r')))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+
+        if self.shared_location is not None:
+            state['shared_images'] = self.shared_images
+            for v in state['shared_images']:
+                del state[v]
+
+        return state
+
+    def __setstate__(self, state):
+        shared_images = state.pop('shared_images', [])
+        self.__dict__.update(state)
+
+        if self.shared_location is not None:
+            self.attach(shared_images)
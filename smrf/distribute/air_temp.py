@@ -40,6 +40,21 @@ class ta(image_data.image_data):
         'air_temp'
     ])
 
+    DISTRIBUTE_INPUTS = (
+        'station_air_temp',
+    )
+
+    THREAD_DATA_INPUTS = frozenset([
+        'air_temp'
+    ])
+
+    # no state between time steps so a block of time steps can be distributed
+    BATCH_INPUT = 'air_temp'
+
+    DISTRIBUTE_OUTPUTS = frozenset([
+        'air_temp'
+    ])
+
     # these are variables that are operate at the end only and do not need to
     # be written during main distribute loop
     post_process_variables = {}
@@ -102,5 +117,6 @@ class ta(image_data.image_data):
         for date_time in self.date_time:
 
             data = data_queue[self.variable].get(date_time)
-            self.distribute(data)
+            with self.timing.time('distribute', self.variable, date_time):
+                self.distribute(data)
             smrf_queue[self.variable].put([date_time, self.air_temp])
@@ -54,6 +54,22 @@ class Albedo(image_data.image_data):
         'albedo_ir'
     ])
 
+    DISTRIBUTE_INPUTS = (
+        'time',
+        'illum_ang',
+        'storm_days'
+    )
+
+    BASE_THREAD_INPUTS = frozenset([
+        'illum_ang',
+        'storm_days'
+    ])
+
+    DISTRIBUTE_OUTPUTS = frozenset([
+        'albedo_vis',
+        'albedo_ir'
+    ])
+
     def __init__(self, albedoConfig):
         """
         Initialize albedo()
@@ -177,7 +193,8 @@ class Albedo(image_data.image_data):
             illum_ang = smrf_queue['illum_ang'].get(date_time)
             storm_day = smrf_queue['storm_days'].get(date_time)
 
-            self.distribute(date_time, illum_ang, storm_day)
+            with self.timing.time('distribute', self.variable, date_time):
+                self.distribute(date_time, illum_ang, storm_day)
 
             smrf_queue['albedo_vis'].put([date_time, self.albedo_vis])
             smrf_queue['albedo_ir'].put([date_time, self.albedo_ir])
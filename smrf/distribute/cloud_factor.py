@@ -43,6 +43,21 @@ class cf(image_data.image_data):
         'cloud_factor'
     ])
 
+    DISTRIBUTE_INPUTS = (
+        'station_cloud_factor',
+    )
+
+    THREAD_DATA_INPUTS = frozenset([
+        'cloud_factor'
+    ])
+
+    # no state between time steps so a block of time steps can be distributed
+    BATCH_INPUT = 'cloud_factor'
+
+    DISTRIBUTE_OUTPUTS = frozenset([
+        'cloud_factor'
+    ])
+
     def __init__(self, config):
 
         # extend the base class
@@ -102,5 +117,6 @@ class cf(image_data.image_data):
         for date_time in self.date_time:
 
             data = data_queue[self.variable].get(date_time)
-            self.distribute(data)
+            with self.timing.time('distribute', self.variable, date_time):
+                self.distribute(data)
             smrf_queue[self.variable].put([date_time, self.cloud_factor])
@@ -1,8 +1,11 @@
+import copy
 import logging
 
 import numpy as np
 
 from smrf.spatial import dk, grid, idw, kriging
+from smrf.utils.cache import hash_key
+from smrf.utils.timing import Timing
 
 
 class image_data():
@@ -46,6 +49,56 @@ class image_data():
     BASE_THREAD_VARIABLES = frozenset()
     OUTPUT_VARIABLES = {}
 
+    # queued variables and station data read by distribute_thread
+    BASE_THREAD_INPUTS = frozenset()
+    THREAD_DATA_INPUTS = frozenset()
+
+    # model state that is carried from one time step to the next
+    STATE_VARIABLES = frozenset()
+
+    # model state that is determined from the full period of input data
+    PERIOD_STATE_VARIABLES = frozenset()
+
+    # fields consumed by distribute, in the order of the arguments
+    DISTRIBUTE_INPUTS = ()
+
+    # fields produced by distribute
+    DISTRIBUTE_OUTPUTS = frozenset()
+
+    # station data distributed by distribute_batch for modules without state
+    # between time steps, None when the module distributes each time step
+    BATCH_INPUT = None
+
+    # distribution methods that can distribute a block of time steps
+    BATCH_METHODS = frozenset([
+        'idw',
+        'dk'
+    ])
+
+    # spatial interpolators by distribution method
+    INTERPOLATORS = frozenset([
+        'idw',
+        'dk',
+        'grid',
+        'kriging'
+    ])
+
+    # spatial interpolators that only depend on the stations, the topo and
+    # the options and can be shared between modules
+    SHARED_INTERPOLATORS = frozenset([
+        'idw',
+        'dk',
+        'grid'
+    ])
+
+    # prefix of the config options for each distribution method
+    INTERPOLATOR_OPTIONS = {
+        'idw': 'idw_',
+        'dk': 'dk_',
+        'grid': 'grid_',
+        'kriging': 'krig_'
+    }
+
     def __init__(self, variable):
 
         self.variable = variable
@@ -55,6 +108,29 @@ class image_data():
 
         self._logger = logging.getLogger(self.__class__.__module__)
         self._thread_variables = None
+        self._thread_inputs = None
+
+        # set by SMRF to record the wall time of the module
+        self.timing = Timing(enabled=False)
+
+        # float type of the distributed values, set from the topo
+        self.dtype = np.float64
+
+        # interpolators to use instead of calculating the weights, set when
+        # restarting from a checkpoint
+        self.interpolators = {}
+
+        # set by SMRF to keep the interpolation weights between runs
+        self.weight_store = None
+
+        # set by SMRF to share the interpolators between modules
+        self.plans = None
+
+        # set by SMRF to share the static fields derived from the topo
+        self.static_fields = None
+
+        # values distributed by distribute_batch by time step
+        self._batch = {}
 
     @property
     def thread_variables(self):
@@ -79,6 +155,124 @@ class image_data():
 
         self.thread_variables = self.thread_variables + variables
 
+    @property
+    def thread_inputs(self):
+        if self._thread_inputs is None:
+            self._thread_inputs = list(self.BASE_THREAD_INPUTS)
+
+        return self._thread_inputs
+
+    @thread_inputs.setter
+    def thread_inputs(self, value):
+        self._thread_inputs = value
+
+    def add_thread_inputs(self, variables):
+        """Add a list or single variable to the thread inputs
+
+        Args:
+            variables (list or str): List or string of variables to add
+        """
+
+        if isinstance(variables, str):
+            variables = list((variables, ))
+
+        self.thread_inputs = self.thread_inputs + variables
+
+    def get_state(self, variables=None):
+        """Get a copy of the model state held by the module
+
+        Args:
+            variables (list, optional): state variables to get. Defaults to
+                :py:attr:`STATE_VARIABLES`.
+
+        Returns:
+            dict: state variable name and a copy of the value, variables
+                that have not been set are skipped
+        """
+
+        if variables is None:
+            variables = self.STATE_VARIABLES
+
+        state = {}
+        for variable in variables:
+            if hasattr(self, variable):
+                state[variable] = copy.deepcopy(getattr(self, variable))
+
+        return state
+
+    def set_state(self, state):
+        """Set the model state from :func:`get_state`
+
+        Args:
+            state (dict): state variable name and value
+        """
+
+        for variable, value in state.items():
+            setattr(self, variable, copy.deepcopy(value))
+
+    def get_interpolators(self):
+        """Get the spatial interpolators and the weights calculated by
+        :func:`_initialize`
+
+        Returns:
+            dict: interpolator by distribution method
+        """
+
+        return {name: getattr(self, name) for name in self.INTERPOLATORS
+                if getattr(self, name, None) is not None}
+
+    def set_interpolators(self, interpolators):
+        """Set the spatial interpolators from :func:`get_interpolators` to
+        be used by :func:`_initialize` instead of calculating the weights
+
+        Args:
+            interpolators (dict): interpolator by distribution method
+        """
+
+        self.interpolators = interpolators
+
+    def get_field(self, field):
+        """Get a field produced by the module
+
+        Args:
+            field (str): field name from :py:attr:`DISTRIBUTE_OUTPUTS`
+
+        Returns:
+            the value of the field
+        """
+
+        return getattr(self, field, None)
+
+    def distribute_fields(self, fields):
+        """
+        Distribute a single time step from the fields declared in
+        :py:attr:`DISTRIBUTE_INPUTS` and return the fields declared in
+        :py:attr:`DISTRIBUTE_OUTPUTS`. Used by
+        :mod:`smrf.framework.scheduler.DistributeScheduler`.
+
+        Floating point fields are passed to the other modules as a copy in
+        :py:attr:`dtype` to follow the ``[system] precision``, the state held
+        by the module, like accumulated storm days, is not changed.
+
+        Args:
+            fields (dict): fields for the time step
+
+        Returns:
+            dict: fields produced by the module
+        """
+
+        self.distribute(*[fields[field] for field in self.DISTRIBUTE_INPUTS])
+
+        outputs = {}
+        for field in self.DISTRIBUTE_OUTPUTS:
+            value = self.get_field(field)
+            if isinstance(value, np.ndarray) and value.dtype.kind == 'f' \
+                    and value.dtype != self.dtype:
+                value = value.astype(self.dtype)
+            outputs[field] = value
+
+        return outputs
+
     @property
     def output_variables(self):
         ov = {}
@@ -169,44 +363,260 @@ class image_data():
             self.my = metadata.Y.values
 
         self.mz = metadata.elevation.values
+        self.dtype = topo.dtype
 
         if "distribution" in self.config.keys():
-            if self.config['distribution'] == 'idw':
-                # inverse distance weighting
-                self.idw = idw.IDW(
-                    self.mx, self.my, topo.X, topo.Y, mz=self.mz,
-                    GridZ=topo.dem, power=self.config['idw_power'])
+            method = self.config['distribution']
 
-            elif self.config['distribution'] == 'dk':
-                # detrended kriging
-                self.dk = dk.DK(
-                    self.mx, self.my, self.mz, topo.X, topo.Y,
-                    topo.dem,
-                    self.config)
+            if method in self.interpolators:
+                # weights restored from a checkpoint
+                interpolator = self.interpolators[method]
 
-            elif self.config['distribution'] == 'grid':
-                # linear interpolation between points
-                self.grid = grid.GRID(
-                    self.config, self.mx, self.my, topo.X,
-                    topo.Y,
-                    mz=self.mz,
-                    GridZ=topo.dem,
-                    mask=topo.mask,
-                    metadata=metadata)
-
-            elif self.config['distribution'] == 'kriging':
-                # generic kriging
-                self.kriging = kriging.KRIGE(
-                    self.mx, self.my, self.mz, topo.X,
-                    topo.Y,
-                    topo.dem,
-                    self.config)
-
-            else:
+            elif method not in self.INTERPOLATORS:
                 raise Exception(
                     "Could not determine the distribution method for "
                     "{}".format(self.variable))
 
+            elif self.plans is not None and \
+                    method in self.SHARED_INTERPOLATORS:
+                # interpolator of another module with the same stations
+                interpolator = self.plans.get(
+                    self.plan_key(topo), self._load_interpolator,
+                    topo, metadata)
+
+            else:
+                interpolator = self._load_interpolator(topo, metadata)
+
+            setattr(self, method, interpolator)
+
+    def _load_interpolator(self, topo, metadata):
+        """
+        Load the interpolator from the :py:attr:`weight_store` or create it
+        with :func:`_create_interpolator`
+
+        Args:
+            topo: :mod:`smrf.data.loadTopo.Topo` instance
+            metadata: metadata Pandas dataframe of the stations
+
+        Returns:
+            interpolator for the distribution method
+        """
+
+        if self.weight_store is not None and \
+                self.config['distribution'] != 'dk':
+            # weights calculated by a previous run
+            return self.weight_store.get(
+                self.weight_key(topo), self._create_interpolator,
+                topo, metadata)
+
+        return self._create_interpolator(topo, metadata)
+
+    def plan_key(self, topo):
+        """
+        Key of the interpolator in the :py:attr:`plans` shared between
+        modules. Same as :func:`weight_key` except for detrended kriging,
+        which also depends on the ``detrend_slope``.
+
+        Args:
+            topo: :mod:`smrf.data.loadTopo.Topo` instance
+
+        Returns:
+            str: key of the interpolator
+        """
+
+        key = self.weight_key(topo)
+        if self.config['distribution'] == 'dk':
+            key = hash_key(key, self.config['detrend_slope'])
+
+        return key
+
+    def weight_key(self, topo):
+        """
+        Key of the interpolation weights in the :py:attr:`weight_store` from
+        the topo, the stations and the options of the distribution method
+
+        Args:
+            topo: :mod:`smrf.data.loadTopo.Topo` instance
+
+        Returns:
+            str: key of the weights
+        """
+
+        method = self.config['distribution']
+        prefix = self.INTERPOLATOR_OPTIONS[method]
+        options = {k: v for k, v in self.config.items()
+                   if k.startswith(prefix) and not k.endswith('ncores')}
+
+        return hash_key(
+            method, np.dtype(self.dtype).str, options, topo.X, topo.Y,
+            topo.dem, topo.domain_mask, self.mx, self.my, self.mz)
+
+    def static_field(self, name, function, *args):
+        """
+        Field derived from the topo that is the same every time step, shared
+        with the other modules through the :py:attr:`static_fields`. The
+        field is calculated with ``function(*args)`` for the first module
+        declaring it and is read only.
+
+        Args:
+            name (str): name of the field
+            function (callable): calculates the field
+            args: arguments to the function, part of the key of the field
+
+        Returns:
+            the shared field
+        """
+
+        if self.static_fields is None:
+            return function(*args)
+
+        return self.static_fields.get(
+            hash_key(name, *args), function, *args)
+
+    def _create_interpolator(self, topo, metadata):
+        """
+        Create the interpolator for the distribution method and calculate
+        the weights
+
+        Args:
+            topo: :mod:`smrf.data.loadTopo.Topo` instance
+            metadata: metadata Pandas dataframe of the stations
+
+        Returns:
+            interpolator for the distribution method
+        """
+
+        if self.config['distribution'] == 'idw':
+            # inverse distance weighting
+            return idw.IDW(
+                self.mx, self.my, topo.X, topo.Y, mz=self.mz,
+                GridZ=topo.dem, power=self.config['idw_power'],
+                dtype=self.dtype,
+                neighbors=self.config['idw_neighbors'],
+                search_radius=self.config['idw_search_radius'])
+
+        elif self.config['distribution'] == 'dk':
+            # detrended kriging, the weights for the stations with data are
+            # kept in the weight store
+            store_key = None
+            if self.weight_store is not None:
+                store_key = self.weight_key(topo)
+
+            return dk.DK(
+                self.mx, self.my, self.mz, topo.X, topo.Y,
+                topo.dem,
+                self.config,
+                dtype=self.dtype,
+                weight_store=self.weight_store,
+                store_key=store_key)
+
+        elif self.config['distribution'] == 'grid':
+            # linear interpolation between points
+            return grid.GRID(
+                self.config, self.mx, self.my, topo.X,
+                topo.Y,
+                mz=self.mz,
+                GridZ=topo.dem,
+                mask=topo.domain_mask,
+                metadata=metadata,
+                mask_x=topo.domain_x,
+                mask_y=topo.domain_y)
+
+        elif self.config['distribution'] == 'kriging':
+            # generic kriging
+            return kriging.KRIGE(
+                self.mx, self.my, self.mz, topo.X,
+                topo.Y,
+                topo.dem,
+                self.config)
+
+    @property
+    def batch(self):
+        """True if the module can distribute a block of time steps with
+        :func:`distribute_batch`"""
+        return self.BATCH_INPUT is not None and \
+            self.config.get('distribution') in self.BATCH_METHODS
+
+    def distribute_batch(self, data):
+        """
+        Interpolate a block of time steps at once. The distributed values
+        are kept until :func:`_distribute` is called for the time step, which
+        then skips the interpolation.
+
+        Args:
+            data: Pandas dataframe of the station data for the time steps,
+                indexed by date time
+
+        Raises:
+            Exception: If all input data is NaN for a time step
+        """
+
+        data = data[self.stations]
+
+        if np.any(data.isnull().all(axis=1)):
+            raise Exception("{}: All data values are NaN"
+                            "".format(self.variable))
+
+        v = self._interpolate_batch(data.values.astype(np.float64))
+        self._batch = dict(zip(data.index, v))
+
+    def _distribute_stack(self, data, other_attributes):
+        """
+        Distribute several fields of a single time step, like the wind
+        direction components, at once. The distribution methods in
+        :py:attr:`BATCH_METHODS` apply the weights to all the fields in one
+        pass, the other methods distribute each field with
+        :func:`_distribute`.
+
+        Args:
+            data (list): Pandas dataframe of each field for a single time
+                step
+            other_attributes (list): attribute for each distributed field
+
+        Raises:
+            Exception: If all input data is NaN for a field
+        """
+
+        if self.config['distribution'] not in self.BATCH_METHODS:
+            for d, attribute in zip(data, other_attributes):
+                self._distribute(d, other_attribute=attribute)
+            return
+
+        values = np.array([d[self.stations].values for d in data],
+                          dtype=np.float64)
+
+        if np.any(np.isnan(values).all(axis=1)):
+            raise Exception("{}: All data values are NaN"
+                            "".format(self.variable))
+
+        v = self._interpolate_batch(values)
+        for value, attribute in zip(v, other_attributes):
+            setattr(self, attribute, value)
+
+    def _interpolate_batch(self, values):
+        """
+        Interpolate a block of fields with the distribution method
+
+        Args:
+            values: station data of shape (T, nsta)
+
+        Returns:
+            v: distributed values of shape (T, ny, nx)
+        """
+
+        with self.timing.time('interpolation', self.variable):
+            if self.config['distribution'] == 'idw':
+                if self.config['detrend']:
+                    v = self.idw.detrendedIDWBatch(
+                        values, self.config['detrend_slope'])
+                else:
+                    v = self.idw.calculateIDWBatch(values)
+
+            elif self.config['distribution'] == 'dk':
+                v = self.dk.calculateBatch(values)
+
+        return v.astype(self.dtype, copy=False)
+
     def _distribute(self, data, other_attribute=None, zeros=None):
         """
         Distribute the data using the defined distribution method in
@@ -230,38 +640,61 @@ class image_data():
             raise Exception("{}: All data values are NaN"
                             "".format(self.variable))
 
-        if self.config['distribution'] == 'idw':
-            if self.config['detrend']:
-                v = self.idw.detrendedIDW(
-                    data.values,
-                    self.config['detrend_slope'],
-                    zeros=zeros)
-            else:
-                v = self.idw.calculateIDW(data.values)
-
-        elif self.config['distribution'] == 'dk':
-            v = self.dk.calculate(data.values)
+        if other_attribute is None and data.name in self._batch:
+            v = self._batch.pop(data.name)
 
-        elif self.config['distribution'] == 'grid':
-            if self.config['detrend']:
-                v = self.grid.detrendedInterpolation(
-                    data,
-                    self.config['detrend_slope'],
-                    self.config['grid_method'])
-            else:
-                v = self.grid.calculateInterpolation(
-                    data.values,
-                    self.config['grid_method'])
+        else:
+            v = self._interpolate(data, zeros)
 
-        elif self.config['distribution'] == 'kriging':
-            v, ss = self.kriging.calculate(data.values)
-            setattr(self, '{}_variance'.format(self.variable), ss)
+        v = v.astype(self.dtype, copy=False)
 
         if other_attribute is not None:
             setattr(self, other_attribute, v)
         else:
             setattr(self, self.variable, v)
 
+    def _interpolate(self, data, zeros=None):
+        """
+        Interpolate a single time step with the distribution method
+
+        Args:
+            data: Pandas dataframe for a single time step of the stations
+            zeros: data values that should be treated as zeros
+
+        Returns:
+            v: distributed values
+        """
+
+        with self.timing.time('interpolation', self.variable):
+            if self.config['distribution'] == 'idw':
+                if self.config['detrend']:
+                    v = self.idw.detrendedIDW(
+                        data.values,
+                        self.config['detrend_slope'],
+                        zeros=zeros)
+                else:
+                    v = self.idw.calculateIDW(data.values)
+
+            elif self.config['distribution'] == 'dk':
+                v = self.dk.calculate(data.values)
+
+            elif self.config['distribution'] == 'grid':
+                if self.config['detrend']:
+                    v = self.grid.detrendedInterpolation(
+                        data,
+                        self.config['detrend_slope'],
+                        self.config['grid_method'])
+                else:
+                    v = self.grid.calculateInterpolation(
+                        data.values,
+                        self.config['grid_method'])
+
+            elif self.config['distribution'] == 'kriging':
+                v, ss = self.kriging.calculate(data.values)
+                setattr(self, '{}_variance'.format(self.variable), ss)
+
+        return v
+
     def post_processor(self, output_func):
         """
         Each distributed variable has the oppurtunity to do post processing on
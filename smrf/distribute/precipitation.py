@@ -106,6 +106,53 @@ class ppt(image_data.image_data):
         'storm_total'
     ])
 
+    STATE_VARIABLES = frozenset([
+        'storm_days',
+        'storm_total',
+        'storm_id',
+        'storming'
+    ])
+
+    # marks2017 storm table
+    PERIOD_STATE_VARIABLES = frozenset([
+        'storms',
+        'corrected_precip'
+    ])
+
+    DISTRIBUTE_INPUTS = (
+        'station_precip',
+        'dew_point',
+        'precip_temp',
+        'air_temp',
+        'time',
+        'station_wind_speed',
+        'station_air_temp',
+        'wind_direction',
+        'dir_round_cell',
+        'wind_speed',
+        'cellmaxus'
+    )
+
+    BASE_THREAD_INPUTS = frozenset([
+        'dew_point',
+        'precip_temp',
+        'air_temp'
+    ])
+
+    THREAD_DATA_INPUTS = frozenset([
+        'precip',
+        'air_temp',
+        'wind_speed'
+    ])
+
+    DISTRIBUTE_OUTPUTS = frozenset([
+        'precip',
+        'percent_snow',
+        'snow_density',
+        'storm_days',
+        'storm_total'
+    ])
+
     def __init__(self, pptConfig, start_date, time_step=60):
 
         # extend the base class
@@ -153,8 +200,10 @@ class ppt(image_data.image_data):
                     self.storm_days = np.zeros((topo.ny, topo.nx))
 
                 else:
-                    # start at index of storm_days - 1
-                    self.storm_days = f.variables['storm_days'][time_ind - 1, :, :][0]  # noqa
+                    # start at index of storm_days - 1, the topo may be a
+                    # tile of the model domain or compressed
+                    self.storm_days = topo.window(
+                        f.variables['storm_days'][time_ind - 1])[0]
             else:
                 self._logger.error(
                     'Variable storm_days not in {}'.format(
@@ -211,6 +260,9 @@ class ppt(image_data.image_data):
 
         # if redistributing due to wind
         if self.config['precip_rescaling_model'] == 'winstral':
+            self.add_thread_inputs([
+                'wind_direction', 'flatwind', 'dir_round_cell', 'cellmaxus'])
+
             self._tbreak_file = nc.Dataset(
                 self.config['winstral_tbreak_netcdf'], 'r')
             self.tbreak = self._tbreak_file.variables['tbreak'][:]
@@ -496,18 +548,19 @@ class ppt(image_data.image_data):
                 dir_round_cell = None
                 cell_maxus = None
 
-            self.distribute(
-                ppt_data,
-                dpt,
-                precip_temp,
-                ta,
-                date_time,
-                ws_data,
-                ta_data,
-                wind_direction,
-                dir_round_cell,
-                flatwind,
-                cell_maxus)
+            with self.timing.time('distribute', self.variable, date_time):
+                self.distribute(
+                    ppt_data,
+                    dpt,
+                    precip_temp,
+                    ta,
+                    date_time,
+                    ws_data,
+                    ta_data,
+                    wind_direction,
+                    dir_round_cell,
+                    flatwind,
+                    cell_maxus)
 
             smrf_queue[self.variable].put([date_time, self.precip])
             smrf_queue['percent_snow'].put([date_time, self.percent_snow])
@@ -37,6 +37,10 @@ class ts(image_data.image_data):
     # be written during main distribute loop
     post_process_variables = {}
 
+    DISTRIBUTE_OUTPUTS = frozenset([
+        'soil_temp'
+    ])
+
     def __init__(self, soilConfig):
 
         # extend the base class
@@ -62,7 +66,9 @@ class ts(image_data.image_data):
         self._logger.debug('Initializing distribute.soil_temp')
         self.date_time = date_time
 #         self._initialize(topo, metadata)
-        self.soil_temp = float(self.config['temp']) * np.ones(topo.dem.shape)
+        self.dtype = topo.dtype
+        self.soil_temp = float(self.config['temp']) * np.ones(
+            topo.dem.shape, dtype=self.dtype)
 
     def distribute(self):
         """
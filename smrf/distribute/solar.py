@@ -1,6 +1,9 @@
+import numpy as np
+
 from smrf.distribute import image_data
 from smrf.envphys.constants import IR_WAVELENGTHS, VISIBLE_WAVELENGTHS
 from smrf.envphys.solar import cloud, toporad, vegetation
+from smrf.envphys.solar.clear_sky import ClearSkyLUT
 from smrf.utils import utils
 
 
@@ -100,6 +103,11 @@ class Solar(image_data.image_data):
             :mod:`smrf.data.loadTopo.Topo`
         veg_tau: numpy array of vegetation optical transmissivity from
             :mod:`smrf.data.loadTopo.Topo`
+        veg_extinction: numpy array of the vegetation extinction
+            ``-veg_k * veg_height`` of the beam correction
+        tau_domain: numpy array of the clear sky optical depth over the DEM
+        clear_sky_lut: :mod:`smrf.envphys.solar.clear_sky.ClearSkyLUT` of
+            the clear sky radiation, None to calculate it every time step
         veg_vis_beam: numpy array vegetation adjusted visible beam radiation
         veg_vis_diffuse: numpy array vegetation adjusted visible diffuse
             radiation
@@ -208,6 +216,29 @@ class Solar(image_data.image_data):
         ['net_solar']
     )
 
+    DISTRIBUTE_INPUTS = (
+        'time',
+        'cloud_factor',
+        'illum_ang',
+        'cosz',
+        'azimuth',
+        'albedo_vis',
+        'albedo_ir'
+    )
+
+    BASE_THREAD_INPUTS = frozenset([
+        'cosz',
+        'azimuth',
+        'illum_ang',
+        'albedo_ir',
+        'albedo_vis',
+        'cloud_factor'
+    ])
+
+    DISTRIBUTE_OUTPUTS = frozenset([
+        'net_solar'
+    ])
+
     # These are variables that are operate at the end only and do not need to
     # be written during main distribute loop
     post_process_variables = {}
@@ -233,6 +264,9 @@ class Solar(image_data.image_data):
         * :py:attr:`veg_height`
         * :py:attr:`veg_tau`
         * :py:attr:`veg_k`
+        * :py:attr:`veg_extinction`
+        * :py:attr:`tau_domain`
+        * :py:attr:`clear_sky_lut`
 
         Args:
             topo: :mod:`smrf.data.loadTopo.Topo` instance contain topographic
@@ -251,6 +285,28 @@ class Solar(image_data.image_data):
         self.veg_tau = topo.veg_tau
         self.veg_k = topo.veg_k
 
+        # static parts of the vegetation and clear sky corrections
+        self.veg_extinction = self.static_field(
+            'veg_extinction', vegetation.solar_veg_extinction,
+            topo.veg_height, topo.veg_k)
+        self.tau_domain = self.static_field(
+            'optical_depth', toporad.optical_depth, topo.dem,
+            self.config['clear_opt_depth'], self.config['clear_tau'])
+
+        # clear sky radiation interpolated from the look up table
+        self.clear_sky_lut = None
+        if self.config['clear_sky_lut'] is not None:
+            self.clear_sky_lut = ClearSkyLUT(
+                self.config['clear_sky_lut'],
+                topo,
+                days=self.config['clear_sky_lut_days'],
+                minutes=self.config['clear_sky_lut_minutes'],
+                tau_elevation=self.config['clear_opt_depth'],
+                tau=self.config['clear_tau'],
+                omega=self.config['clear_omega'],
+                scattering_factor=self.config['clear_gamma'],
+                tau_domain=self.tau_domain)
+
     def distribute(self, date_time, cloud_factor, illum_ang, cosz, azimuth,
                    albedo_vis, albedo_ir):
         """
@@ -290,26 +346,16 @@ class Solar(image_data.image_data):
             self.cloud_factor = cloud_factor.copy()
 
             # --------------------------------------------
-            # calculate clear sky radiation
-
-            # Not all the clean but it will work for now
-            val_beam, val_diffuse = self.calc_stoporad(
-                date_time, illum_ang, cosz, azimuth,
-                albedo_ir, IR_WAVELENGTHS)
-
-            setattr(self, 'clear_ir_beam', val_beam)
-            setattr(self, 'clear_ir_diffuse', val_diffuse)
-            self.ir_beam = val_beam.copy()
-            self.ir_diffuse = val_diffuse.copy()
+            # calculate clear sky radiation of both bands at once
+            beam, diffuse = self.calc_stoporad(
+                date_time, illum_ang, cosz, azimuth, albedo_ir, albedo_vis)
 
-            val_beam, val_diffuse = self.calc_stoporad(
-                date_time, illum_ang, cosz, azimuth,
-                albedo_vis, VISIBLE_WAVELENGTHS)
-
-            setattr(self, 'clear_vis_beam', val_beam)
-            setattr(self, 'clear_vis_diffuse', val_diffuse)
-            self.vis_beam = val_beam.copy()
-            self.vis_diffuse = val_diffuse.copy()
+            self.clear_ir_beam, self.clear_vis_beam = beam
+            self.clear_ir_diffuse, self.clear_vis_diffuse = diffuse
+            self.ir_beam = self.clear_ir_beam.copy()
+            self.ir_diffuse = self.clear_ir_diffuse.copy()
+            self.vis_beam = self.clear_vis_beam.copy()
+            self.vis_diffuse = self.clear_vis_diffuse.copy()
 
             # --------------------------------------------
             # correct clear sky for cloud
@@ -382,14 +428,15 @@ class Solar(image_data.image_data):
             albedo_vis = smrf_queue['albedo_vis'].get(date_time)
             self.cloud_factor = smrf_queue['cloud_factor'].get(date_time)
 
-            self.distribute(
-                date_time,
-                self.cloud_factor,
-                illum_ang,
-                cosz,
-                azimuth,
-                albedo_vis,
-                albedo_ir)
+            with self.timing.time('distribute', self.variable, date_time):
+                self.distribute(
+                    date_time,
+                    self.cloud_factor,
+                    illum_ang,
+                    cosz,
+                    azimuth,
+                    albedo_vis,
+                    albedo_ir)
 
             for cstv in self.CLEAR_SKY_THREAD_VARIABLES:
                 smrf_queue[cstv].put([date_time, getattr(self, cstv)])
@@ -446,7 +493,8 @@ class Solar(image_data.image_data):
             self.vis_beam,
             self.veg_height,
             illum_ang,
-            self.veg_k)
+            self.veg_k,
+            extinction=self.veg_extinction)
 
         # correct diffuse
         self.vis_diffuse = vegetation.solar_veg_diffuse(
@@ -459,7 +507,8 @@ class Solar(image_data.image_data):
             self.ir_beam,
             self.veg_height,
             illum_ang,
-            self.veg_k)
+            self.veg_k,
+            extinction=self.veg_extinction)
 
         # correct diffuse
         self.ir_diffuse = vegetation.solar_veg_diffuse(
@@ -492,9 +541,10 @@ class Solar(image_data.image_data):
         self.net_solar = vv_n + vir_n
         self.net_solar = utils.set_min_max(self.net_solar, self.min, self.max)
 
-    def calc_stoporad(self, date_time, illum_ang, cosz, azimuth,
-                      albedo_surface, wavelength_range=VISIBLE_WAVELENGTHS):
-        """Run stoporad for the given date_time and wavelength range
+    def calc_stoporad(self, date_time, illum_ang, cosz, azimuth, albedo_ir,
+                      albedo_vis):
+        """Run stoporad for the given date_time for the infrared and visible
+        wavelengths at once
 
         Args:
             date_time (datetime): datetime object
@@ -502,26 +552,44 @@ class Solar(image_data.image_data):
                 angles
             cosz (float): cosine of the zenith angle for the basin
             azimuth (float): azimuth to the sun for the basin
-            albedo_surface (np.array): albedo should match wavelengths
-                specified
-            wavelength_range (list, optional): wavelengths to integrate over.
-                Defaults to [0.28, 0.7].
+            albedo_ir (np.array): infrared albedo
+            albedo_vis (np.array): visible albedo
 
         Returns:
-            tuple: clear sky beam and diffuse radiation
+            tuple: clear sky beam and diffuse radiation of shape
+            (2, ny, nx), infrared first
         """
 
-        clear_beam, clear_diffuse = toporad.stoporad(
+        # new arrays every time step as the threads queue the clear sky
+        shape = (2,) + np.shape(illum_ang)
+        clear_beam = np.empty(shape, dtype=self.dtype)
+        clear_diffuse = np.empty(shape, dtype=self.dtype)
+
+        if self.clear_sky_lut is not None:
+            return self.clear_sky_lut.stoporad_bands(
+                date_time,
+                cosz,
+                azimuth,
+                illum_ang,
+                [albedo_ir, albedo_vis],
+                [IR_WAVELENGTHS, VISIBLE_WAVELENGTHS],
+                beam=clear_beam,
+                diffuse=clear_diffuse)
+
+        toporad.stoporad_bands(
             date_time,
             self.topo,
             cosz,
             azimuth,
             illum_ang,
-            albedo_surface,
-            wavelength_range=wavelength_range,
+            [albedo_ir, albedo_vis],
+            [IR_WAVELENGTHS, VISIBLE_WAVELENGTHS],
+            beam=clear_beam,
+            diffuse=clear_diffuse,
             tau_elevation=self.config['clear_opt_depth'],
             tau=self.config['clear_tau'],
             omega=self.config['clear_omega'],
-            scattering_factor=self.config['clear_gamma'])
+            scattering_factor=self.config['clear_gamma'],
+            tau_domain=self.tau_domain)
 
         return clear_beam, clear_diffuse
@@ -193,6 +193,25 @@ class th(image_data.image_data):
         'thermal_clear'
     ])
 
+    DISTRIBUTE_INPUTS = (
+        'time',
+        'air_temp',
+        'vapor_pressure',
+        'dew_point',
+        'cloud_factor'
+    )
+
+    BASE_THREAD_INPUTS = frozenset([
+        'air_temp',
+        'dew_point',
+        'vapor_pressure',
+        'cloud_factor'
+    ])
+
+    DISTRIBUTE_OUTPUTS = frozenset([
+        'thermal'
+    ])
+
     def __init__(self, thermalConfig):
 
         # extend the base class
@@ -224,6 +243,7 @@ class th(image_data.image_data):
         * :py:attr:`veg_k`
         * :py:attr:`sky_view_factor`
         * :py:attr:`dem`
+        * :py:attr:`canopy`
 
         Args:
             topo: :mod:`smrf.data.loadTopo.Topo` instance contain topographic
@@ -245,6 +265,13 @@ class th(image_data.image_data):
             self.sky_view_factor = None
         self.dem = topo.dem
 
+        # canopy pixels and transmissivity for the vegetation correction
+        self.canopy = None
+        if self.correct_veg:
+            self.canopy = self.static_field(
+                'thermal_canopy', vegetation.thermal_canopy,
+                topo.veg_tau, topo.veg_height)
+
         if self.correct_cloud:
             self.add_thread_variables('thermal_cloud')
 
@@ -274,15 +301,17 @@ class th(image_data.image_data):
 
         self._logger.debug('%s Distributing thermal' % date_time)
 
-        # calculate clear sky thermal
+        # calculate clear sky thermal, the c function is double precision
         if self.clear_sky_method == 'marks1979':
             cth = np.zeros_like(air_temp, dtype=np.float64)
             envphys_c.ctopotherm(
-                air_temp, dew_point,
-                self.dem,
-                self.sky_view_factor,
+                np.asarray(air_temp, dtype=np.float64),
+                np.asarray(dew_point, dtype=np.float64),
+                np.ascontiguousarray(self.dem, dtype=np.float64),
+                np.ascontiguousarray(self.sky_view_factor, dtype=np.float64),
                 cth,
                 self.config['marks1979_nthreads'])
+            cth = cth.astype(air_temp.dtype, copy=False)
 
         elif self.clear_sky_method == 'dilley1998':
             cth = clear_sky.Dilly1998(air_temp, vapor_pressure/1000)
@@ -334,7 +363,8 @@ class th(image_data.image_data):
             cth = vegetation.thermal_correct_canopy(cth,
                                                     air_temp,
                                                     self.veg_tau,
-                                                    self.veg_height)
+                                                    self.veg_height,
+                                                    canopy=self.canopy)
 
             # make output variable
             self.thermal_veg = cth.copy()
@@ -361,8 +391,9 @@ class th(image_data.image_data):
             vapor_pressure = smrf_queue['vapor_pressure'].get(date_time)
             cloud_factor = smrf_queue['cloud_factor'].get(date_time)
 
-            self.distribute(date_time, air_temp, vapor_pressure,
-                            dew_point, cloud_factor)
+            with self.timing.time('distribute', self.variable, date_time):
+                self.distribute(date_time, air_temp, vapor_pressure,
+                                dew_point, cloud_factor)
 
             if self.correct_veg:
                 smrf_queue['thermal_veg'].put(
@@ -67,6 +67,28 @@ class vp(image_data.image_data):
         'precip_temp'
     ])
 
+    DISTRIBUTE_INPUTS = (
+        'station_vapor_pressure',
+        'air_temp'
+    )
+
+    BASE_THREAD_INPUTS = frozenset([
+        'air_temp'
+    ])
+
+    THREAD_DATA_INPUTS = frozenset([
+        'vapor_pressure'
+    ])
+
+    # no state between time steps so a block of time steps can be distributed
+    BATCH_INPUT = 'vapor_pressure'
+
+    DISTRIBUTE_OUTPUTS = frozenset([
+        'vapor_pressure',
+        'dew_point',
+        'precip_temp'
+    ])
+
     def __init__(self, vpConfig, precip_temp_method):
 
         # extend the base class
@@ -133,9 +155,10 @@ class vp(image_data.image_data):
         # calculate the dew point
         self._logger.debug('%s -- Calculating dew point' % data.name)
 
-        # use the core_c to calculate the dew point
+        # use the core_c to calculate the dew point, the c functions are
+        # double precision only
         dpt = np.zeros_like(self.vapor_pressure, dtype=np.float64)
-        envphys_c.cdewpt(self.vapor_pressure,
+        envphys_c.cdewpt(np.asarray(self.vapor_pressure, dtype=np.float64),
                          dpt,
                          self.config['dew_point_tolerance'],
                          self.config['dew_point_nthreads'])
@@ -146,6 +169,7 @@ class vp(image_data.image_data):
         if (np.sum(ind) > 0):  # or np.sum(indm) > 0):
             dpt[ind] = ta[ind] - 0.2
 
+        dpt = dpt.astype(self.dtype, copy=False)
         self.dew_point = dpt
 
         # calculate wet bulb temperature
@@ -153,13 +177,15 @@ class vp(image_data.image_data):
             # initialize timestep wet_bulb
             wet_bulb = np.zeros_like(self.vapor_pressure, dtype=np.float64)
             # calculate wet_bulb
-            envphys_c.cwbt(ta, dpt, self.dem,
+            envphys_c.cwbt(np.asarray(ta, dtype=np.float64),
+                           np.asarray(dpt, dtype=np.float64),
+                           np.ascontiguousarray(self.dem, dtype=np.float64),
                            wet_bulb, self.config['dew_point_tolerance'],
                            self.config['dew_point_nthreads'])
             # # store last time step of wet_bulb
             # self.wet_bulb_old = wet_bulb.copy()
             # store in precip temp for use in precip
-            self.precip_temp = wet_bulb
+            self.precip_temp = wet_bulb.astype(self.dtype, copy=False)
         else:
             self.precip_temp = dpt
 
@@ -184,7 +210,8 @@ class vp(image_data.image_data):
             vp_data = data_queue['vapor_pressure'].get(date_time)
             ta = smrf_queue['air_temp'].get(date_time)
 
-            self.distribute(vp_data, ta)
+            with self.timing.time('distribute', self.variable, date_time):
+                self.distribute(vp_data, ta)
 
             smrf_queue[self.variable].put([date_time, self.vapor_pressure])
             smrf_queue['precip_temp'].put([date_time, self.precip_temp])
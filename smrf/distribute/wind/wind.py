@@ -69,6 +69,31 @@ class Wind(image_data.image_data):
         'wind_direction'
     ])
 
+    DISTRIBUTE_INPUTS = (
+        'station_wind_speed',
+        'station_wind_direction',
+        'time'
+    )
+
+    THREAD_DATA_INPUTS = frozenset([
+        'wind_speed',
+        'wind_direction'
+    ])
+
+    DISTRIBUTE_OUTPUTS = frozenset([
+        'wind_speed',
+        'wind_direction',
+        'flatwind',
+        'dir_round_cell',
+        'cellmaxus'
+    ])
+
+    # fields that are only set on the wind model
+    WIND_MODEL_FIELDS = frozenset([
+        'dir_round_cell',
+        'cellmaxus'
+    ])
+
     def __init__(self, config):
         image_data.image_data.__init__(self, self.VARIABLE)
         self._logger = logging.getLogger(__name__)
@@ -133,6 +158,11 @@ class Wind(image_data.image_data):
 
         self._logger.debug('Initializing distribute.wind')
         self.date_time = date_time
+        self.dtype = topo.dtype
+        self.wind_model.timing = self.timing
+        self.wind_model.weight_store = self.weight_store
+        self.wind_model.plans = self.plans
+        self.wind_model.static_fields = self.static_fields
         self.wind_model._initialize(topo, data.metadata)
 
         if self.model_type(WinstralWindModel.MODEL_TYPE):
@@ -141,6 +171,40 @@ class Wind(image_data.image_data):
         if not self.model_type(self.INTERP):
             self.wind_model.initialize(topo, data)
 
+    def get_interpolators(self):
+        """Get the spatial interpolators of the :py:attr:`wind_model`
+
+        Returns:
+            dict: interpolator by distribution method
+        """
+
+        return image_data.image_data.get_interpolators(self.wind_model)
+
+    def set_interpolators(self, interpolators):
+        """Set the spatial interpolators of the :py:attr:`wind_model`
+
+        Args:
+            interpolators (dict): interpolator by distribution method
+        """
+
+        self.wind_model.interpolators = interpolators
+
+    def get_field(self, field):
+        """Get a field produced by the module, the maxus fields are
+        only set on the :py:attr:`wind_model`
+
+        Args:
+            field (str): field name from :py:attr:`DISTRIBUTE_OUTPUTS`
+
+        Returns:
+            the value of the field
+        """
+
+        if field in self.WIND_MODEL_FIELDS:
+            return getattr(self.wind_model, field, None)
+
+        return getattr(self, field, None)
+
     def distribute(self, data_speed, data_direction, t):
         """
         Distribute given a Panda's dataframe for a single time step. Calls
@@ -167,10 +231,9 @@ class Wind(image_data.image_data):
             self.v_direction = np.cos(data_direction * np.pi/180)
 
             # distribute u_direction and v_direction
-            self._distribute(self.u_direction,
-                             other_attribute='u_direction_distributed')
-            self._distribute(self.v_direction,
-                             other_attribute='v_direction_distributed')
+            self._distribute_stack(
+                [self.u_direction, self.v_direction],
+                ['u_direction_distributed', 'v_direction_distributed'])
 
             # combine u and v to azimuth
             az = np.arctan2(self.u_direction_distributed,
@@ -207,7 +270,8 @@ class Wind(image_data.image_data):
             ws_data = data_queue['wind_speed'].get(date_time)
             wd_data = data_queue['wind_direction'].get(date_time)
 
-            self.distribute(ws_data, wd_data, date_time)
+            with self.timing.time('distribute', self.variable, date_time):
+                self.distribute(ws_data, wd_data, date_time)
 
             smrf_queue['wind_speed'].put(
                 [date_time, self.wind_model.wind_speed])
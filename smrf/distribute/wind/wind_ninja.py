@@ -108,6 +108,10 @@ class WindNinjaModel(image_data.image_data):
             data {None} -- Not used but needs to be there
         """
 
+        # filling the edges of the WindNinja grids needs the full grid
+        if topo.cells is not None:
+            raise ValueError('WindNinja can not be used with compress_mask')
+
         # meshgrid points
         self.X = topo.X
         self.Y = topo.Y
@@ -117,28 +121,45 @@ class WindNinjaModel(image_data.image_data):
         # WindNinja output height in meters
         self.wind_height = float(self.config['wind_ninja_height'])
 
+        # precalculate scale arrays so we don't do it every timestep
+        self.ln_wind_scale = self.static_field(
+            'ln_wind_scale', self.wind_scale, topo.veg_height,
+            self.wind_height, float(self.config['wind_ninja_roughness']))
+
+    @staticmethod
+    def wind_scale(veg_height, wind_height, wind_ninja_roughness):
+        """Log law scaling of the WindNinja wind speeds from the roughness
+        used in the WindNinja simulation to the veg surface roughness
+
+        Arguments:
+            veg_height {array} -- veg height
+            wind_height {float} -- WindNinja output height in meters
+            wind_ninja_roughness {float} -- roughness used in WindNinja
+
+        Returns:
+            array -- scale of the wind speeds
+        """
+
         # set roughness that was used in WindNinja simulation
         # WindNinja uses 0.01m for grass, 0.43 for shrubs, and 1.0 for forest
-        self.wn_roughness = float(self.config['wind_ninja_roughness']) * \
-            np.ones_like(topo.dem)
+        wn_roughness = wind_ninja_roughness * np.ones_like(veg_height)
 
         # get our effective veg surface roughness
         # to use in log law scaling of WindNinja data
         # using the relationship in
         # https://www.jstage.jst.go.jp/article/jmsj1965/53/1/53_1_96/_pdf
-        self.veg_roughness = topo.veg_height / 7.39
+        veg_roughness = veg_height / 7.39
 
         # make sure roughness stays reasonable using bounds from
         # http://www.iawe.org/Proceedings/11ACWE/11ACWE-Cataldo3.pdf
-        self.veg_roughness[self.veg_roughness < 0.01] = 0.01
-        self.veg_roughness[np.isnan(self.veg_roughness)] = 0.01
-        self.veg_roughness[self.veg_roughness > 1.6] = 1.6
+        veg_roughness[veg_roughness < 0.01] = 0.01
+        veg_roughness[np.isnan(veg_roughness)] = 0.01
+        veg_roughness[veg_roughness > 1.6] = 1.6
 
-        # precalculate scale arrays so we don't do it every timestep
-        self.ln_wind_scale = np.log(
-            (self.veg_roughness + self.wind_height) / self.veg_roughness
+        return np.log(
+            (veg_roughness + wind_height) / veg_roughness
         ) / np.log(
-            (self.wn_roughness + self.wind_height) / self.wn_roughness
+            (wn_roughness + wind_height) / wn_roughness
         )
 
     def initialize_interp(self, t):
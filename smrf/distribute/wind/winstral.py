@@ -82,9 +82,9 @@ class WinstralWindModel(image_data.image_data):
 
         self._logger.debug('Creating the WinstralWindModel')
 
-        # open the maxus netCDF
+        # open the maxus netCDF, the maxus values are read when initialized
         self._maxus_file = nc.Dataset(self.config['maxus_netcdf'], 'r')
-        self.maxus = self._maxus_file.variables['maxus'][:]
+        maxus_shape = self._maxus_file.variables['maxus'].shape
         self.maxus_direction = self._maxus_file.variables['direction'][:]
         self._maxus_file.close()
 
@@ -93,11 +93,11 @@ class WinstralWindModel(image_data.image_data):
         t_shape = topo_nc.variables['dem'].shape
         topo_nc.close()
 
-        if t_shape != self.maxus[0].shape:
+        if t_shape != maxus_shape[1:]:
             raise IOError("\nMaxus file must be generated using the topo to"
                           " be valid. Maxus netcdf shape = {} and topo"
                           " netcdf shape = {}".format(t_shape,
-                                                      self.maxus.shape))
+                                                      maxus_shape))
 
         self._logger.debug('Read data from {}'
                            .format(self.config['maxus_netcdf']))
@@ -128,10 +128,29 @@ class WinstralWindModel(image_data.image_data):
 
         self.veg_type = topo.veg_type
 
+        # maxus adjustment of the veg types, the same every time step
+        self.veg_maxus = self.static_field(
+            'veg_maxus', self.veg_adjustment, self.veg_type, self.veg)
+
         # meshgrid points
         self.X = topo.X
         self.Y = topo.Y
 
+        # read the maxus library over the topo, which may be a tile of the
+        # model domain or compressed, and at the station pixels in the model
+        # domain
+        self._maxus_file = nc.Dataset(self.config['maxus_netcdf'], 'r')
+        maxus = self._maxus_file.variables['maxus']
+        self.maxus = topo.window(maxus)
+        self.station_maxus = {
+            m: maxus[:, self.metadata.loc[m, 'yi'], self.metadata.loc[m, 'xi']]
+            for m in self.metadata.index}
+        self._maxus_file.close()
+
+        # station pixel locations in the topo
+        self.station_index, self.station_in_topo = topo.pixel_index(
+            self.metadata.yi.values, self.metadata.xi.values)
+
         # get the enhancements for the stations
         if 'enhancement' not in self.metadata.columns:
             self.metadata['enhancement'] = \
@@ -174,15 +193,11 @@ class WinstralWindModel(image_data.image_data):
         # calculate the maxus at each site
         self.stationMaxus(data_speed, data_direction)
 
-        # distribute the flatwind
-        self._distribute(self.flatwind_point,
-                         other_attribute='flatwind')
-
-        # distribute u_direction and v_direction
-        self._distribute(self.u_direction,
-                         other_attribute='u_direction_distributed')
-        self._distribute(self.v_direction,
-                         other_attribute='v_direction_distributed')
+        # distribute the flatwind, u_direction and v_direction
+        self._distribute_stack(
+            [self.flatwind_point, self.u_direction, self.v_direction],
+            ['flatwind', 'u_direction_distributed',
+             'v_direction_distributed'])
 
         # Calculate simulated wind speed at each cell from flatwind
         self.simulateWind(data_speed)
@@ -222,17 +237,7 @@ class WinstralWindModel(image_data.image_data):
             cellmaxus[ind] = self.maxus[i][ind]
 
         # correct for veg
-        dynamic_mask = np.ones(cellmaxus.shape)
-        for k, v in self.veg.items():
-            # Adjust veg types that were specified by the user
-            if k != 'default':
-                ind = self.veg_type == int(k)
-                dynamic_mask[ind] = 0
-                cellmaxus[ind] += v
-
-        # Apply the veg default to those that weren't messed with
-        if self.veg['default'] != 0:
-            cellmaxus[dynamic_mask == 1] += self.veg['default']
+        cellmaxus += self.veg_maxus
 
         # correct unreasonable values
         cellmaxus[cellmaxus > 32] = 32
@@ -274,7 +279,9 @@ class WinstralWindModel(image_data.image_data):
         cellwind *= 1.07985
 
         # preseve the measured values
-        cellwind[self.metadata.yi, self.metadata.xi] = data_speed
+        idx = self.station_in_topo
+        cellwind[self.station_index[0][idx], self.station_index[1][idx]] = \
+            np.asarray(data_speed)[idx]
 
         # check for NaN
         nans, x = utils.nan_helper(cellwind)
@@ -287,6 +294,36 @@ class WinstralWindModel(image_data.image_data):
         self.cellmaxus = cellmaxus
         self.dir_round_cell = dir_round_cell
 
+    @staticmethod
+    def veg_adjustment(veg_type, veg):
+        """
+        Maxus adjustment of each cell from the vegetation type and the
+        factors provided in the [wind] section of the configuration file
+
+        Args:
+            veg_type: numpy array of the veg type
+            veg: adjustment by veg type and the ``default`` adjustment for
+                the other veg types
+
+        Returns:
+            numpy array of the maxus adjustment
+        """
+
+        adjustment = np.zeros(veg_type.shape)
+        dynamic_mask = np.ones(veg_type.shape)
+        for k, v in veg.items():
+            # Adjust veg types that were specified by the user
+            if k != 'default':
+                ind = veg_type == int(k)
+                dynamic_mask[ind] = 0
+                adjustment[ind] += v
+
+        # Apply the veg default to those that weren't messed with
+        if veg['default'] != 0:
+            adjustment[dynamic_mask == 1] += veg['default']
+
+        return adjustment
+
     def stationMaxus(self, data_speed, data_direction):
         """
         Determine the maxus value at the station given the wind direction.
@@ -315,16 +352,13 @@ class WinstralWindModel(image_data.image_data):
         self.nstep = 360/self.nbins
 
         for m in self.metadata.index:
-            # pixel locations
-            xi = self.metadata.loc[m, 'xi']
-            yi = self.metadata.loc[m, 'yi']
             e = self.metadata.loc[m, 'enhancement']
 
             # maxus value at the station
             if not pd.isnull(data_direction[m]):
                 if self.config['station_peak'] is not None:
                     if m.upper() in self.config['station_peak']:
-                        val_maxus = np.min(self.maxus[:, yi, xi] + e)
+                        val_maxus = np.min(self.station_maxus[m] + e)
 
                 else:
                     idx = int(np.ceil((data_direction[m] - self.nstep/2) /
@@ -333,7 +367,7 @@ class WinstralWindModel(image_data.image_data):
                         idx = 0  # special case when 360=0
                     ind = self.maxus_direction == idx
 
-                    val_maxus = self.maxus[ind, yi, xi] + e
+                    val_maxus = self.station_maxus[m][ind] + e
 
                 # correct unreasonable values
                 if val_maxus > 35:
@@ -0,0 +1,315 @@
+import logging
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytz
+from topocalc.shade import shade
+
+from smrf.envphys import sunang
+from smrf.envphys.solar import toporad
+from smrf.envphys.solar.irradiance import direct_solar_irradiance
+from smrf.envphys.solar.twostream import twostream
+from smrf.utils.cache import LRUCache, hash_key
+
+
+class ClearSkyLUT():
+    """
+    Look up table of the clear sky radiation over the topo by day of year
+    and time of day, kept on disk between runs of the same basin.
+
+    The twostream transmittance over a surface with albedo ``R0`` is
+    ``trans / (1 - R0 * s)``, where ``trans`` is the transmittance over a
+    black surface and ``s`` the spherical albedo of the atmosphere, and
+    none of the transmittances depend on the wavelength band. Each node of
+    the table keeps four fields that only depend on the sun position, the
+    topo and the clear sky options:
+
+    * the direct transmittance times the local illumination angle, zero
+      where the sun is below the horizon
+    * the direct transmittance times the cosine of the zenith
+    * the transmittance over a black surface times the cosine of the zenith
+    * the spherical albedo
+
+    The solar irradiance of the bands and the surface albedo are applied
+    to the interpolated fields every time step, the cloud and vegetation
+    corrections are applied after as without the table.
+
+    A node is calculated the first time a run needs it, with the sun
+    position of :py:attr:`YEAR` in UTC, and stored as a ``.npy`` file in a
+    directory named by a hash of the topo and the clear sky options. Nodes
+    with the sun down are not stored and the time steps next to them, at
+    sunrise and sunset, are calculated with
+    :func:`~smrf.envphys.solar.toporad.stoporad_bands` instead.
+
+    Args:
+        location (str): directory of the look up tables
+        topo: :mod:`smrf.data.loadTopo.Topo` instance
+        days (int): days between the nodes. Defaults to 7.
+        minutes (int): minutes between the nodes. Defaults to 60.
+        tau_elevation (float, optional): Elevation [m] of optical depth
+            measurement. Defaults to 100.
+        tau (float, optional): optical depth at tau_elevation.
+            Defaults to 0.2.
+        omega (float, optional): Single scattering albedo. Defaults to 0.85.
+        scattering_factor (float, optional): Scattering asymmetry parameter.
+            Defaults to 0.3.
+        tau_domain (np.array, optional): optical depth over the DEM from
+            :func:`~smrf.envphys.solar.toporad.optical_depth`. Defaults to
+            calculating it.
+        cache_size (int, optional): number of nodes to keep in memory.
+            Defaults to 8.
+
+    Attributes:
+        path: directory of the nodes of the table
+        hits: number of nodes loaded from the table
+        misses: number of nodes calculated
+        direct: number of time steps calculated without the table
+    """
+
+    # year of the sun position of the nodes
+    YEAR = 2001
+
+    def __init__(self, location, topo, days=7, minutes=60,
+                 tau_elevation=100, tau=0.2, omega=0.85,
+                 scattering_factor=0.3, tau_domain=None, cache_size=8):
+
+        self.topo = topo
+        self.days = days
+        self.minutes = minutes
+        self.tau_elevation = tau_elevation
+        self.tau = tau
+        self.omega = omega
+        self.scattering_factor = scattering_factor
+        self.dtype = topo.dtype
+
+        if tau_domain is None:
+            tau_domain = toporad.optical_depth(
+                topo.dem, tau_elevation, tau)
+        self.tau_domain = tau_domain
+
+        self.hits = 0
+        self.misses = 0
+        self.direct = 0
+        self.nodes = LRUCache(cache_size)
+        self.start = datetime(self.YEAR, 1, 1, tzinfo=pytz.utc)
+
+        self._logger = logging.getLogger(__name__)
+
+        key = hash_key(
+            'clear_sky', topo.dem, topo.cells, topo.dx, topo.dy,
+            topo.basin_lat, topo.basin_long, np.dtype(self.dtype).str,
+            topo.topoConfig['gradient_method'],
+            topo.topoConfig['sky_view_factor_angles'],
+            topo.topoConfig.get('horizon_increment'),
+            tau_elevation, tau, omega, scattering_factor, days, minutes,
+            self.YEAR)
+
+        self.path = os.path.join(location, 'clear_sky_{}'.format(key))
+        os.makedirs(self.path, exist_ok=True)
+
+    def interpolate(self, date_time):
+        """
+        Bilinear interpolation of the nodes by the day of year and the time
+        of day
+
+        Args:
+            date_time (datetime): date time of the time step
+
+        Returns:
+            np.array: fields of shape (4, ny, nx), None when the sun is down
+            for any of the nodes
+        """
+
+        date_time = date_time.astimezone(pytz.utc)
+        day = (date_time.timetuple().tm_yday - 1) / self.days
+        minute = (date_time.hour * 60 + date_time.minute +
+                  date_time.second / 60) / self.minutes
+
+        i = int(np.floor(day))
+        j = int(np.floor(minute))
+        wi = day - i
+        wj = minute - j
+
+        fields = None
+        for di, dj, weight in [(0, 0, (1 - wi) * (1 - wj)),
+                               (1, 0, wi * (1 - wj)),
+                               (0, 1, (1 - wi) * wj),
+                               (1, 1, wi * wj)]:
+            if weight == 0:
+                continue
+
+            node = self.nodes.get((i + di, j + dj), self.node, i + di, j + dj)
+            if node is None:
+                return None
+
+            if fields is None:
+                fields = weight * node
+            else:
+                fields += weight * node
+
+        return fields
+
+    def node(self, i, j):
+        """
+        Load the node from the table, calculating and storing it when not
+        in the table
+
+        Args:
+            i (int): day index of the node
+            j (int): time of day index of the node
+
+        Returns:
+            np.array: fields of the node, None when the sun is down
+        """
+
+        date_time = self.start + \
+            timedelta(days=i * self.days, minutes=j * self.minutes)
+        cosz, azimuth, rad_vec = sunang.sunang(
+            date_time, self.topo.basin_lat, self.topo.basin_long)
+
+        if cosz <= 0:
+            return None
+
+        path = os.path.join(self.path, '{}_{}.npy'.format(i, j))
+
+        try:
+            node = np.load(path, mmap_mode='r')
+            self.hits += 1
+            return node
+
+        except FileNotFoundError:
+            pass
+
+        except ValueError:
+            self._logger.warning(
+                'Could not load {} from the clear sky table'.format(path))
+
+        self.misses += 1
+        node = self.calculate(cosz, azimuth)
+
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'wb') as f:
+            np.save(f, node)
+        os.replace(tmp, path)
+
+        return node
+
+    def calculate(self, cosz, azimuth):
+        """
+        Calculate the fields of a node
+
+        Args:
+            cosz (float): cosine of the zenith
+            azimuth (float): sun azimuth
+
+        Returns:
+            np.array: fields of shape (4, ny, nx)
+        """
+
+        # local illumination angle masked by the horizon
+        illum_ang = shade(
+            self.topo.sin_slope, self.topo.aspect, azimuth, cosz)
+        thresh = np.tan(np.pi / 2 - np.arccos(cosz))
+        illum_ang[self.topo.horizon(azimuth) > thresh] = 0
+
+        # transmittances over a black and a white surface
+        black = twostream(cosz, 1.0, tau=self.tau_domain, omega=self.omega,
+                          g=self.scattering_factor, R0=0.0)
+        white = twostream(cosz, 1.0, tau=self.tau_domain, omega=self.omega,
+                          g=self.scattering_factor, R0=1.0)
+
+        trans = black['transmittance']
+        btrans = black['direct_transmittance']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            spherical_albedo = np.where(
+                white['transmittance'] > 0,
+                1 - trans / white['transmittance'],
+                0)
+
+        return np.stack([
+            btrans * illum_ang,
+            btrans * cosz,
+            trans * cosz,
+            spherical_albedo
+        ]).astype(self.dtype)
+
+    def stoporad_bands(self, date_time, cosz, azimuth, illum_ang,
+                       albedo_surfaces, wavelength_ranges, beam=None,
+                       diffuse=None):
+        """
+        Same as :func:`~smrf.envphys.solar.toporad.stoporad_bands` from the
+        interpolated nodes. Time steps next to a node with the sun down are
+        calculated with :func:`~smrf.envphys.solar.toporad.stoporad_bands`.
+
+        Args:
+            date_time (datetime): date time of the time step
+            cosz (float): cosine of the zenith
+            azimuth (float): sun azimuth
+            illum_ang (np.array): cosine of the local illumination angles
+            albedo_surfaces (list): surface albedo for each band
+            wavelength_ranges (list): wavelength range for each band
+            beam (np.array, optional): array of shape (bands, ny, nx) to
+                write the beam radiation to. Defaults to a new array.
+            diffuse (np.array, optional): array of shape (bands, ny, nx) to
+                write the diffuse radiation to. Defaults to a new array.
+
+        Returns:
+            tuple: beam and diffuse radiation of each band
+        """
+
+        fields = None
+        if cosz > 0:
+            fields = self.interpolate(date_time)
+
+        if fields is None:
+            # sun down or sunrise and sunset
+            self.direct += 1
+            return toporad.stoporad_bands(
+                date_time,
+                self.topo,
+                cosz,
+                azimuth,
+                illum_ang,
+                albedo_surfaces,
+                wavelength_ranges,
+                beam=beam,
+                diffuse=diffuse,
+                tau_elevation=self.tau_elevation,
+                tau=self.tau,
+                omega=self.omega,
+                scattering_factor=self.scattering_factor,
+                tau_domain=self.tau_domain)
+
+        for wavelength_range in wavelength_ranges:
+            toporad.check_wavelengths(wavelength_range)
+
+        shape = (len(wavelength_ranges),) + self.topo.dem.shape
+        if beam is None:
+            beam = np.zeros(shape, dtype=self.dtype)
+        if diffuse is None:
+            diffuse = np.zeros(shape, dtype=self.dtype)
+
+        illum_trans, flat_trans, trans, spherical_albedo = fields
+
+        for n, wavelength_range in enumerate(wavelength_ranges):
+            solar_irradiance = direct_solar_irradiance(
+                date_time, w=wavelength_range)
+            albedo = albedo_surfaces[n]
+            R0 = max(np.mean(albedo), 0)
+
+            # elevrad diffuse over the mean surface albedo
+            elevrad_diffuse = solar_irradiance * \
+                (trans / (1 - R0 * spherical_albedo) - flat_trans)
+
+            toporad.toporad(
+                solar_irradiance,
+                elevrad_diffuse,
+                illum_trans,
+                self.topo.sky_view_factor,
+                self.topo.terrain_config_factor,
+                flat_trans,
+                surface_albedo=albedo,
+                out=(beam[n], diffuse[n]))
+
+        return beam, diffuse
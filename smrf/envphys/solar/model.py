@@ -5,9 +5,10 @@ from topocalc.shade import shade
 from smrf.envphys import sunang
 from smrf.envphys.solar.irradiance import direct_solar_irradiance
 from smrf.envphys.solar.twostream import twostream
+from smrf.utils.timing import Timing
 
 
-def shade_thread(queue, date, sin_slope, aspect, zenith=None):
+def shade_thread(queue, date, sin_slope, aspect, zenith=None, timing=None):
     """
     See shade for input argument descriptions
 
@@ -18,6 +19,8 @@ def shade_thread(queue, date, sin_slope, aspect, zenith=None):
         aspect: numpy array of aspect in radians from south
         azimuth: azimuth in degrees to the sun -180..180 (comes from sunang)
         zenith: the solar zenith angle 0..90 degrees
+        timing: :mod:`~smrf.utils.timing.Timing` to record the wall time of
+            each illumination angle, optional
 
     """
 
@@ -27,16 +30,21 @@ def shade_thread(queue, date, sin_slope, aspect, zenith=None):
 
     log = logging.getLogger(__name__)
 
+    if timing is None:
+        timing = Timing(enabled=False)
+
     for t in date:
 
         log.debug('%s Calculating illumination angle' % t)
 
         mu = None
         cosz = queue['cosz'].get(t)
+        azimuth = queue['azimuth'].get(t)
 
         if cosz > 0:
-            azimuth = queue['azimuth'].get(t)
-            mu = shade(sin_slope, aspect, azimuth, cosz, zenith)
+            with timing.time('illum_angle', time_step=t):
+                mu = shade(sin_slope, aspect, azimuth, cosz, zenith)
+                mu = mu.astype(sin_slope.dtype, copy=False)
 
         queue['illum_ang'].put([t, mu])
 
@@ -1,5 +1,4 @@
 import numpy as np
-from topocalc.horizon import horizon
 
 from smrf.envphys.constants import (GRAVITY, IR_MAX, IR_MIN, MOL_AIR,
                                     SEA_LEVEL, STD_AIRTMP, STD_LAPSE,
@@ -45,53 +44,145 @@ def stoporad(date_time, topo, cosz, azimuth, illum_ang, albedo_surface,
         [type]: [description]
     """
 
-    wavelength_flag = check_wavelengths(wavelength_range)  # noqa
+    beam, diffuse = stoporad_bands(
+        date_time,
+        topo,
+        cosz,
+        azimuth,
+        illum_ang,
+        [albedo_surface],
+        [wavelength_range],
+        tau_elevation=tau_elevation,
+        tau=tau,
+        omega=omega,
+        scattering_factor=scattering_factor)
+
+    return beam[0], diffuse[0]
+
+
+def stoporad_bands(date_time, topo, cosz, azimuth, illum_ang, albedo_surfaces,
+                   wavelength_ranges, beam=None, diffuse=None,
+                   tau_elevation=100, tau=0.2, omega=0.85,
+                   scattering_factor=0.3, tau_domain=None):
+    """Stoporad for several wavelength bands at once. The horizon mask, the
+    illumination angles and the optical depth over the DEM are calculated
+    once and twostream and toporad are evaluated over a band axis.
+
+    Args:
+        date_time (datetime): date time of the time step
+        topo (Topo): topo for the DEM, horizon and sky view factor
+        cosz (float): cosine of the zenith
+        azimuth (float): sun azimuth
+        illum_ang (np.array): cosine of the local illumination angles
+        albedo_surfaces (list): surface albedo for each band
+        wavelength_ranges (list): wavelength range for each band
+        beam (np.array, optional): array of shape (bands, ny, nx) to write
+            the beam radiation to. Defaults to a new array.
+        diffuse (np.array, optional): array of shape (bands, ny, nx) to
+            write the diffuse radiation to. Defaults to a new array.
+        tau_elevation (int, optional): Elevation [m] of optical depth
+            measurement. Defaults to 100.
+        tau (float, optional): optical depth at tau_elevation.
+            Defaults to 0.2.
+        omega (float, optional): Single scattering albedo. Defaults to 0.85.
+        scattering_factor (float, optional): Scattering asymmetry parameter.
+            Defaults to 0.3.
+        tau_domain (np.array, optional): optical depth over the DEM from
+            :func:`optical_depth`. Defaults to calculating it.
+
+    Returns:
+        tuple: beam and diffuse radiation of each band
+    """
+
+    for wavelength_range in wavelength_ranges:
+        check_wavelengths(wavelength_range)
+
+    # either preallocate or use the input
+    shape = (len(wavelength_ranges),) + np.shape(illum_ang)
+    dtype = np.result_type(topo.dem, illum_ang)
+    if beam is None:
+        beam = np.zeros(shape, dtype=dtype)
+    if diffuse is None:
+        diffuse = np.zeros(shape, dtype=dtype)
 
     # check cosz if sun is down
     if cosz < 0:
-        return np.zeros_like(topo.dem), np.zeros_like(topo.dem)
+        beam[:] = 0
+        diffuse[:] = 0
+        return beam, diffuse
+
+    # irradiance and mean surface albedo with a band axis
+    solar_irradiance = np.array([
+        direct_solar_irradiance(date_time, w=wavelength_range)
+        for wavelength_range in wavelength_ranges])[:, np.newaxis, np.newaxis]
+    albedo_surfaces = np.asarray(albedo_surfaces)
+    R0 = np.array([np.mean(albedo) for albedo in albedo_surfaces])[
+        :, np.newaxis, np.newaxis]
+
+    # Run horizon to get sun-below-horizon mask
+    thresh = np.tan(np.pi / 2 - np.arccos(cosz))
+    no_sun_mask = topo.horizon(azimuth) > thresh
+
+    # Run shade to get cosine local illumination angle
+    # mask by horizon mask using cosz=0 where the sun is not visible
+    illum_ang = np.copy(illum_ang)
+    illum_ang[no_sun_mask] = 0
+
+    # Run elevrad to get beam & diffuse then toporad
+    evrad = Elevrad(
+        topo.dem,
+        solar_irradiance,
+        cosz,
+        tau_elevation=tau_elevation,
+        tau=tau,
+        omega=omega,
+        scattering_factor=scattering_factor,
+        surface_albedo=R0,
+        tau_domain=tau_domain)
+
+    toporad(
+        evrad.beam,
+        evrad.diffuse,
+        illum_ang,
+        topo.sky_view_factor,
+        topo.terrain_config_factor,
+        cosz,
+        surface_albedo=albedo_surfaces,
+        out=(beam, diffuse))
+
+    return beam, diffuse
+
+
+def optical_depth(elevation, tau_elevation=100, tau=0.2):
+    """Optical depth over the DEM from the optical depth at a reference
+    elevation, scaled by the pressure of each elevation. Only depends on
+    the topo and the clear sky options so it can be calculated once.
 
-    else:
-        solar_irradiance = direct_solar_irradiance(
-            date_time, w=wavelength_range)
-
-        # Run horizon to get sun-below-horizon mask
-        horizon_angles = horizon(azimuth, topo.dem, topo.dx)
-        thresh = np.tan(np.pi / 2 - np.arccos(cosz))
-        no_sun_mask = np.tan(np.abs(horizon_angles)) > thresh
-
-        # Run shade to get cosine local illumination angle
-        # mask by horizon mask using cosz=0 where the sun is not visible
-        illum_ang = np.copy(illum_ang)
-        illum_ang[no_sun_mask] = 0
-
-        R0 = np.mean(albedo_surface)
-
-        # Run elevrad to get beam & diffuse then toporad
-        evrad = Elevrad(
-            topo.dem,
-            solar_irradiance,
-            cosz,
-            tau_elevation=tau_elevation,
-            tau=tau,
-            omega=omega,
-            scattering_factor=scattering_factor,
-            surface_albedo=R0)
-
-        trad_beam, trad_diff = toporad(
-            evrad.beam,
-            evrad.diffuse,
-            illum_ang,
-            topo.sky_view_factor,
-            topo.terrain_config_factor,
-            cosz,
-            surface_albedo=albedo_surface)
-
-    return trad_beam, trad_diff
+    Args:
+        elevation (np.array): DEM elevations in meters
+        tau_elevation (float, optional): Elevation [m] of optical depth
+            measurement. Defaults to 100.
+        tau (float, optional): optical depth at tau_elevation.
+            Defaults to 0.2.
+
+    Returns:
+        np.array: optical depth over the DEM
+    """
+
+    # reference pressure (at reference elevation, in km)
+    reference_pressure = hysat(SEA_LEVEL, STD_AIRTMP, STD_LAPSE,
+                               tau_elevation / 1000, GRAVITY, MOL_AIR)
+
+    # Convert each elevation in look-up table to pressure, then to optical
+    # depth over the modeling domain
+    pressure = hysat(SEA_LEVEL, STD_AIRTMP, STD_LAPSE,
+                     elevation / 1000, GRAVITY, MOL_AIR)
+
+    return tau * pressure / reference_pressure
 
 
 def toporad(beam, diffuse, illum_angle, sky_view_factor, terrain_config_factor,
-            cosz, surface_albedo=0.0):
+            cosz, surface_albedo=0.0, out=None):
     """Topographically-corrected solar radiation. Calculates the topographic
     distribution of solar radiation at a single time, using input beam and
     diffuse radiation calculates supplied by elevrad.
@@ -105,21 +196,27 @@ def toporad(beam, diffuse, illum_angle, sky_view_factor, terrain_config_factor,
         cosz (float): cosine of the zenith
         surface_albedo (float/np.array, optional): surface albedo.
             Defaults to 0.0.
+        out (tuple, optional): arrays to write the beam and diffuse
+            radiation to. Defaults to new arrays.
 
     Returns:
         tuple: beam and diffuse radiation corrected for terrain
     """
 
+    if out is None:
+        out = (None, None)
+
     # adjust diffuse radiation accounting for sky view factor
-    drad = diffuse * sky_view_factor
+    drad = np.multiply(diffuse, sky_view_factor, out=out[1])
 
     # add reflection from adjacent terrain
-    drad = drad + (diffuse * (1 - sky_view_factor) +
-                   beam * cosz) * terrain_config_factor * surface_albedo
+    drad += (diffuse * (1 - sky_view_factor) +
+             beam * cosz) * terrain_config_factor * surface_albedo
 
     # global radiation is diffuse + incoming_beam * cosine of local
     # illumination * angle
-    rad = drad + beam * illum_angle
+    rad = np.multiply(beam, illum_angle, out=out[0])
+    rad += drad
 
     return rad, drad
 
@@ -131,7 +228,8 @@ class Elevrad():
 
     Args:
         elevation (np.array): DEM elevations in meters
-        solar_irradiance (float): from direct_solar_irradiance
+        solar_irradiance (float/np.array): from direct_solar_irradiance,
+            an array with a band axis evaluates several bands at once
         cosz (float): cosine of zenith angle
         tau_elevation (float, optional): Elevation [m] of optical depth
                                         measurement. Defaults to 100.
@@ -139,7 +237,10 @@ class Elevrad():
         omega (float, optional): Single scattering albedo. Defaults to 0.85.
         scattering_factor (float, optional): Scattering asymmetry parameter.
                                             Defaults to 0.3.
-        surface_albedo (float, optional): Mean surface albedo. Defaults to 0.5.
+        surface_albedo (float/np.array, optional): Mean surface albedo, by
+            band with solar_irradiance by band. Defaults to 0.5.
+        tau_domain (np.array, optional): optical depth over the DEM from
+            :func:`optical_depth`. Defaults to calculating it.
     """
 
     def __init__(self, elevation, solar_irradiance, cosz, **kwargs):
@@ -150,7 +251,7 @@ class Elevrad():
             solar_irradiance (float): from direct_solar_irradiance
             cosz (float): cosine of zenith angle
             kwargs: tau_elevation, tau, omega, scattering_factor,
-                    surface_albedo
+                    surface_albedo, tau_domain
 
         Returns:
             radiation: dict with beam and diffuse radiation
@@ -162,6 +263,7 @@ class Elevrad():
         self.omega = 0.85
         self.scattering_factor = 0.3
         self.surface_albedo = 0.5
+        self.tau_domain = None
 
         # set user specified values
         for key, value in kwargs.items():
@@ -178,15 +280,11 @@ class Elevrad():
         """Perform the calculations
         """
 
-        # reference pressure (at reference elevation, in km)
-        reference_pressure = hysat(SEA_LEVEL, STD_AIRTMP, STD_LAPSE,
-                                   self.tau_elevation / 1000, GRAVITY, MOL_AIR)
-
-        # Convert each elevation in look-up table to pressure, then to optical
-        # depth over the modeling domain
-        pressure = hysat(SEA_LEVEL, STD_AIRTMP, STD_LAPSE,
-                         self.elevation / 1000, GRAVITY, MOL_AIR)
-        tau_domain = self.tau * pressure / reference_pressure
+        # optical depth over the modeling domain
+        tau_domain = self.tau_domain
+        if tau_domain is None:
+            tau_domain = optical_depth(
+                self.elevation, self.tau_elevation, self.tau)
 
         # twostream over the optical depth of the domain
         self.twostream = twostream(
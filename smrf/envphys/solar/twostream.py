@@ -44,17 +44,19 @@ def twostream(cosz, S0, tau=0.2, omega=0.85, g=0.3, R0=0.5):
             'irradiance_normal_to_beam': 0
         }
 
-    if S0 <= 0:
+    if np.any(np.asarray(S0) <= 0):
         raise ValueError('The direct beam irradiance (S0) is less than 0')
 
     if isinstance(tau, float):
         tau = np.array([tau])
 
+    # the optical depth may be shared and read only
     idx = tau == 0
-    tau[idx] = 1e15
+    if np.any(idx):
+        tau = np.where(idx, 1e15, tau)
 
-    if R0 < 0:
-        R0 = 0
+    # R0 may be an array to solve several bands at once
+    R0 = np.maximum(R0, 0)
 
     # gamma's for phase function for all input
     gamma = mwgamma(cosz, omega, g)
@@ -108,10 +110,11 @@ def twostream(cosz, S0, tau=0.2, omega=0.85, g=0.3, R0=0.5):
     btrans = et
 
     # semi-infinite?
-    idx = np.argwhere(((em == 0) & (et == 0)) | (ep >= 1e15))
-    refl[idx] = omega * (gam3 * xi + alph2) / (gpx * opx)
-    btrans[idx] = 0
-    trans[idx] = 0
+    idx = ((em == 0) & (et == 0)) | (ep >= 1e15)
+    if np.any(idx):
+        refl = np.where(idx, omega * (gam3 * xi + alph2) / (gpx * opx), refl)
+        btrans = np.where(idx, 0, btrans)
+        trans = np.where(idx, 0, trans)
 
     assert(np.min(refl) >= 0)
     assert(np.min(trans) >= 0)
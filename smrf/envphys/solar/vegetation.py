@@ -1,7 +1,16 @@
 import numpy as np
 
 
-def solar_veg_beam(data, height, cosz, k):
+def solar_veg_extinction(height, k):
+    """
+    Extinction of the beam irradiance through the canopy ``-k h``, the
+    part of :func:`solar_veg_beam` that does not change with the sun
+    """
+
+    return -k * height
+
+
+def solar_veg_beam(data, height, cosz, k, extinction=None):
     """
     Apply the vegetation correction to the beam irradiance
     using the equation from Links and Marks 1999
@@ -9,13 +18,19 @@ def solar_veg_beam(data, height, cosz, k):
     S_b,f = S_b,o * exp[ -k h sec(theta) ] or
     S_b,f = S_b,o * exp[ -k h / cosz ]
 
+    The extinction ``-k h`` from :func:`solar_veg_extinction` can be given
+    to not calculate it every time step.
+
     20150610 Scott Havens
     """
 
     # ensure that the sun is visible
     cosz[cosz <= 0] = 0.01
 
-    return data * np.exp(-k * height / cosz)
+    if extinction is None:
+        extinction = solar_veg_extinction(height, k)
+
+    return data * np.exp(extinction / cosz)
 
 
 def solar_veg_diffuse(data, tau):
@@ -4,6 +4,8 @@ from math import asin, atan, cos, fmod, sin, sqrt, tan
 import numpy as np
 import pytz
 
+from smrf.utils.timing import Timing
+
 JULIAN_CENTURY = 36525		# days in Julian century
 DEGS_IN_CIRCLE = 3.6e2        # degrees in circle
 TOLERANCE = 1.1920928955e-07
@@ -51,7 +53,7 @@ def sunang(date_time, latitude, longitude, truncate=True):
     return mu, azimuth, rad_vec
 
 
-def sunang_thread(queue, date, lat, lon):
+def sunang_thread(queue, date, lat, lon, timing=None):
     """
     See sunang for input descriptions
 
@@ -59,6 +61,8 @@ def sunang_thread(queue, date, lat, lon):
         queue: queue with cosz, azimuth
         date: loop through dates to accesss queue, must be same as
                 rest of queues
+        timing: :mod:`~smrf.utils.timing.Timing` to record the wall time of
+                each sun angle, optional
 
     """
 
@@ -69,11 +73,15 @@ def sunang_thread(queue, date, lat, lon):
 
     log = logging.getLogger(__name__)
 
+    if timing is None:
+        timing = Timing(enabled=False)
+
     for t in date:
 
         log.debug('%s Calculating sun angle' % t)
 
-        cosz, azimuth, rad_vec = sunang(t.astimezone(pytz.utc), lat, lon)
+        with timing.time('sun_angle', time_step=t):
+            cosz, azimuth, rad_vec = sunang(t.astimezone(pytz.utc), lat, lon)
 
         queue['cosz'].put([t, cosz])
         queue['azimuth'].put([t, azimuth])
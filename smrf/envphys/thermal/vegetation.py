@@ -3,7 +3,29 @@ import numpy as np
 from smrf.envphys.constants import EMISS_VEG, FREEZE, STEF_BOLTZ
 
 
-def thermal_correct_canopy(th, ta, tau, veg_height, height_thresh=2):
+def thermal_canopy(tau, veg_height, height_thresh=2):
+    """
+    Pixels with canopy and their transmissivity, the part of
+    :func:`thermal_correct_canopy` that does not change with time
+
+    Args:
+        tau: transmissivity of the canopy
+        veg_height: vegitation height for each pixel
+        height_thresh: threshold hold for height to say that there is veg in
+            the pixel
+
+    Returns:
+        tuple: pixels with canopy above the threshold, the transmissivity
+        and one minus the transmissivity of those pixels
+    """
+
+    ind = veg_height > height_thresh
+
+    return ind, tau[ind], 1 - tau[ind]
+
+
+def thermal_correct_canopy(th, ta, tau, veg_height, height_thresh=2,
+                           canopy=None):
     """
     Correct thermal radiation for vegitation.  It will only correct
     for pixels where the veg height is above a threshold. This ensures
@@ -17,6 +39,8 @@ def thermal_correct_canopy(th, ta, tau, veg_height, height_thresh=2):
         veg_height: vegitation height for each pixel
         height_thresh: threshold hold for height to say that there is veg in
             the pixel
+        canopy: canopy pixels and transmissivity from
+            :func:`thermal_canopy`, calculated if not given
 
     Returns:
         corrected thermal radiation
@@ -26,13 +50,15 @@ def thermal_correct_canopy(th, ta, tau, veg_height, height_thresh=2):
     20150611 Scott Havens
     """
 
-    # thermal emitted from the canopy
-    veg = STEF_BOLTZ * EMISS_VEG * np.power(ta + FREEZE, 4)
-
     # pixels with canopy above the threshold
-    ind = veg_height > height_thresh
+    if canopy is None:
+        canopy = thermal_canopy(tau, veg_height, height_thresh)
+    ind, tau_canopy, emitted = canopy
+
+    # thermal emitted from the canopy
+    veg = STEF_BOLTZ * EMISS_VEG * np.power(ta[ind] + FREEZE, 4)
 
     # correct incoming thermal
-    th[ind] = tau[ind] * th[ind] + (1 - tau[ind]) * veg[ind]
+    th[ind] = tau_canopy * th[ind] + emitted * veg
 
     return th
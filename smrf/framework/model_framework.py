@@ -24,12 +24,19 @@ Example:
 """
 
 import logging
+import multiprocessing
 import os
+import pickle
+import shutil
 import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from copy import deepcopy
 from datetime import datetime
 from os.path import abspath, join
 from threading import Thread
 
+import netCDF4 as nc
 import numpy as np
 import pandas as pd
 import pytz
@@ -44,7 +51,10 @@ from smrf import distribute
 from smrf.data import InputData, Topo
 from smrf.envphys.solar import model
 from smrf.framework import art, logger
+from smrf.framework.scheduler import DistributeScheduler
 from smrf.output import output_hru, output_netcdf
+from smrf.utils.cache import PlanRegistry, StaticFields, WeightStore
+from smrf.utils.timing import Timing
 from smrf.utils.utils import backup_input, date_range, getqotw
 
 
@@ -81,9 +91,21 @@ class SMRF():
                'wind']
 
     BASE_THREAD_VARIABLES = frozenset([
-        'cosz', 'azimuth', 'illum_ang', 'output'
+        'cosz', 'azimuth', 'illum_ang'
     ])
 
+    # fields provided to the distribute modules for each time step, the
+    # station data is provided as station_<variable>
+    BASE_FIELDS = [
+        'time', 'cosz', 'azimuth', 'illum_ang'
+    ]
+
+    # model state written by write_checkpoint to the out_location
+    CHECKPOINT_FILE = 'smrf_checkpoint.pkl'
+
+    # fields of the state modules distributed for a time chunk
+    STATE_FIELDS_FILE = 'state_fields.pkl'
+
     def __init__(self, config, external_logger=None):
         """
         Initialize the model, read config file, start and end date, and logging
@@ -170,6 +192,15 @@ class SMRF():
                              " WRF generated data!")
 
         self.distribute = {}
+        self.timing = Timing(self.config['output']['timing_report'])
+        self.checkpoint = None
+
+        if self.config['output']['checkpoint_frequency'] > 0 and (
+                self.threading or self.time_chunks > 1 or
+                self.tile_rows * self.tile_cols > 1):
+            raise ValueError('Checkpoints are only written when distributing '
+                             'in serial, set threading to False and use a '
+                             'single time chunk and tile')
 
         if self.config['system']['qotw']:
             self._logger.info(getqotw())
@@ -224,13 +255,22 @@ class SMRF():
             variables.update(module.output_variables)
         return variables
 
+    @property
+    def dtype(self):
+        """Numpy float type for the ``precision`` in the system section"""
+        return np.float32 if self.precision == 'float' else np.float64
+
     def loadTopo(self):
         """
         Load the information from the configFile in the ['topo'] section. See
         :func:`smrf.data.loadTopo.Topo` for full description.
         """
 
-        self.topo = Topo(self.config['topo'])
+        self.topo = Topo(self.config['topo'], dtype=self.dtype)
+
+        # tiles are compressed by the tile workers
+        if self.compress_mask and self.tile_rows * self.tile_cols == 1:
+            self.topo = self.topo.compress()
 
     def create_distribution(self):
         """
@@ -291,6 +331,67 @@ class SMRF():
         self.distribute['soil_temp'] = distribute.soil_temp.ts(
             self.config['soil_temp'])
 
+        store = None
+        if self.weight_store is not None:
+            store = WeightStore(self.weight_store, self.weight_store_size)
+
+        # modules with the same stations share the interpolators
+        self.plans = PlanRegistry()
+
+        # fields derived from the topo that are the same every time step
+        self.static_fields = StaticFields()
+
+        for module in self.distribute.values():
+            module.timing = self.timing
+            module.weight_store = store
+            module.plans = self.plans
+            module.static_fields = self.static_fields
+
+        self.create_scheduler()
+
+    def create_scheduler(self, modules=None, fields=()):
+        """
+        Create the :mod:`~smrf.framework.scheduler.DistributeScheduler` from
+        the fields each distribute module consumes and produces. Any module
+        added to :attr:`~smrf.framework.model_framework.SMRF.distribute` must
+        declare its ``DISTRIBUTE_INPUTS`` and ``DISTRIBUTE_OUTPUTS``.
+
+        Args:
+            modules (list, optional): names of the modules to schedule.
+                Defaults to None, which schedules all the modules and sets
+                :attr:`~smrf.framework.model_framework.SMRF.scheduler`.
+            fields (list, optional): fields given to every time step instead
+                of produced by a module, like the fields of the state modules
+                distributed for a time chunk
+
+        Returns:
+            DistributeScheduler: scheduler for the modules
+        """
+
+        base_fields = self.BASE_FIELDS + [
+            'station_{}'.format(v) for v in InputData.VARIABLES[:-1]] + \
+            list(fields)
+
+        if modules is not None:
+            return DistributeScheduler(
+                {name: self.distribute[name] for name in modules},
+                base_fields,
+                self.timestep_workers,
+                timing=self.timing)
+
+        self.scheduler = DistributeScheduler(
+            self.distribute,
+            base_fields,
+            self.timestep_workers,
+            timing=self.timing)
+
+        self._logger.debug('Distribute order: {}'.format(
+            ', '.join(self.scheduler.order)))
+        self._logger.debug('Distribute critical path: {}'.format(
+            ' -> '.join(self.scheduler.critical_path())))
+
+        return self.scheduler
+
     def loadData(self):
         """
         Load the measurement point data for distributing to the DEM,
@@ -339,20 +440,29 @@ class SMRF():
 
     def disttribute_data(self):
         """
-        Wrapper for various distribute methods. If threading was set in
-        configFile, then
+        Wrapper for various distribute methods. If more than one tile was set
+        in configFile, then
+        :func:`~smrf.framework.model_framework.SMRF.disttribute_data_tiled`
+        will be called. If more than one time chunk was set in configFile, then
+        :func:`~smrf.framework.model_framework.SMRF.disttribute_data_chunked`
+        will be called. If threading was set in configFile, then
         :func:`~smrf.framework.model_framework.SMRF.disttribute_data_threaded`
         will be called. Default will call
         :func:`~smrf.framework.model_framework.SMRF.disttribute_data_serial`.
         """
 
-        if self.threading:
+        if self.tile_rows * self.tile_cols > 1:
+            self.disttribute_data_tiled()
+        elif self.time_chunks > 1:
+            self.disttribute_data_chunked()
+        elif self.threading:
             self.disttribute_data_threaded()
         else:
             self.disttribute_data_serial()
 
     def initialize_distribution(self, date_time=None):
-        """Call the initialize method for each distribute module
+        """Call the initialize method for each distribute module and set the
+        model state when restarting from a checkpoint
 
         Args:
             date_time (list, optional): initialize with the datetime list
@@ -362,6 +472,9 @@ class SMRF():
         for v in self.distribute:
             self.distribute[v].initialize(self.topo, self.data, date_time)
 
+        if self.checkpoint is not None:
+            self.set_model_state(self.checkpoint['state'])
+
     def disttribute_data_serial(self):
         """
         Distribute the measurement point data for all variables in serial. Each
@@ -371,17 +484,13 @@ class SMRF():
         The function distributes over each time step, all the variables below.
 
         Steps performed:
+            0. Interpolate the next ``batch_time_steps`` time steps if needed
             1. Sun angle for the time step
             2. Illumination angle
-            3. Air temperature
-            4. Vapor pressure
-            5. Wind direction and speed
-            6. Precipitation
-            7. Cloud Factor
-            8. Solar radiation
-            9. Thermal radiation
-            10. Soil temperature
-            11. Output time step if needed
+            3. Distribute modules in dependency order with the
+               :mod:`~smrf.framework.scheduler.DistributeScheduler`
+            4. Output time step if needed
+            5. Write a checkpoint of the model state if needed
         """
 
         self.initialize_distribution()
@@ -392,16 +501,68 @@ class SMRF():
 
             startTime = datetime.now()
 
+            if output_count % self.batch_time_steps == 0:
+                self.distribute_batch(self.date_time[
+                    output_count:output_count + self.batch_time_steps])
+
             self.distribute_single_timestep(t)
             self.output(t)
 
+            if self.checkpoint_due(t):
+                self.write_checkpoint(t)
+
             telapsed = datetime.now() - startTime
             self._logger.debug('{0:.2f} seconds for time step'
                                .format(telapsed.total_seconds()))
 
+        self.scheduler.shutdown()
+
+        if self.timing.enabled:
+            self._logger.debug(
+                'Distribute critical path by run time: {}'.format(
+                    ' -> '.join(self.scheduler.critical_path(
+                        self.scheduler.durations))))
+
         self.forcing_data = 1
 
-    def distribute_single_timestep(self, t):
+    def distribute_batch(self, date_time):
+        """
+        Interpolate a block of time steps with
+        :func:`~smrf.distribute.image_data.image_data.distribute_batch` for
+        the distribute modules that support it. The interpolated values are
+        used when the modules distribute the time steps.
+
+        Args:
+            date_time (list): time steps to interpolate
+        """
+
+        if len(date_time) < 2 or self.hrrr_data_timestep:
+            return
+
+        for module in self.distribute.values():
+            if module.batch:
+                module.distribute_batch(
+                    getattr(self.data, module.BATCH_INPUT).loc[date_time])
+
+    def distribute_single_timestep(self, t, scheduler=None, fields=None):
+        """
+        Distribute a single time step
+
+        Args:
+            t (datetime): time step to distribute
+            scheduler (DistributeScheduler, optional): scheduler for the
+                modules to distribute. Defaults to None, which distributes
+                all the modules with
+                :attr:`~smrf.framework.model_framework.SMRF.scheduler`.
+            fields (dict, optional): fields of the time step that are not
+                distributed by the scheduler. Defaults to None.
+
+        Returns:
+            dict: fields of the time step
+        """
+
+        if scheduler is None:
+            scheduler = self.scheduler
 
         self._logger.info('Distributing time step {}'.format(t))
 
@@ -410,78 +571,36 @@ class SMRF():
             self.data.set_variables()
 
         # 0.1 sun angle for time step
-        cosz, azimuth, rad_vec = sunang.sunang(
-            t.astimezone(pytz.utc),
-            self.topo.basin_lat,
-            self.topo.basin_long)
+        with self.timing.time('sun_angle', time_step=t):
+            cosz, azimuth, rad_vec = sunang.sunang(
+                t.astimezone(pytz.utc),
+                self.topo.basin_lat,
+                self.topo.basin_long)
 
         # 0.2 illumination angle
         illum_ang = None
-        if cosz > 0:
-            illum_ang = shade(
-                self.topo.sin_slope,
-                self.topo.aspect,
-                azimuth,
-                cosz)
-
-        # 1. Air temperature
-        self.distribute['air_temp'].distribute(self.data.air_temp.loc[t])
-
-        # 2. Vapor pressure
-        self.distribute['vapor_pressure'].distribute(
-            self.data.vapor_pressure.loc[t],
-            self.distribute['air_temp'].air_temp)
-
-        # 3. Wind_speed and wind_direction
-        self.distribute['wind'].distribute(
-            self.data.wind_speed.loc[t],
-            self.data.wind_direction.loc[t],
-            t)
-
-        # 4. Precipitation
-        self.distribute['precipitation'].distribute(
-            self.data.precip.loc[t],
-            self.distribute['vapor_pressure'].dew_point,
-            self.distribute['vapor_pressure'].precip_temp,
-            self.distribute['air_temp'].air_temp,
-            t,
-            self.data.wind_speed.loc[t],
-            self.data.air_temp.loc[t],
-            self.distribute['wind'].wind_direction,
-            self.distribute['wind'].wind_model.dir_round_cell,
-            self.distribute['wind'].wind_speed,
-            self.distribute['wind'].wind_model.cellmaxus)
-
-        # 5. Albedo
-        self.distribute['albedo'].distribute(
-            t,
-            illum_ang,
-            self.distribute['precipitation'].storm_days)
-
-        # 6. cloud_factor
-        self.distribute['cloud_factor'].distribute(
-            self.data.cloud_factor.loc[t])
-
-        # 7. Solar
-        self.distribute['solar'].distribute(
-            t,
-            self.distribute["cloud_factor"].cloud_factor,
-            illum_ang,
-            cosz,
-            azimuth,
-            self.distribute['albedo'].albedo_vis,
-            self.distribute['albedo'].albedo_ir)
-
-        # 8. thermal radiation
-        self.distribute['thermal'].distribute(
-            t,
-            self.distribute['air_temp'].air_temp,
-            self.distribute['vapor_pressure'].vapor_pressure,
-            self.distribute['vapor_pressure'].dew_point,
-            self.distribute['cloud_factor'].cloud_factor)
+        if cosz > 0 and 'illum_ang' in scheduler.input_fields:
+            with self.timing.time('illum_angle', time_step=t):
+                illum_ang = shade(
+                    self.topo.sin_slope,
+                    self.topo.aspect,
+                    azimuth,
+                    cosz).astype(self.dtype, copy=False)
+
+        # 1. distribute modules in dependency order
+        fields = dict(fields or {})
+        fields.update({
+            'time': t,
+            'cosz': cosz,
+            'azimuth': azimuth,
+            'illum_ang': illum_ang
+        })
+        for variable in self.data.VARIABLES[:-1]:
+            field = 'station_{}'.format(variable)
+            if field in scheduler.input_fields:
+                fields[field] = getattr(self.data, variable).loc[t]
 
-        # 9. Soil temperature
-        self.distribute['soil_temp'].distribute()
+        return scheduler.run(fields)
 
     def disttribute_data_threaded(self):
         """
@@ -497,7 +616,8 @@ class SMRF():
         distribute_thread function iterates over
         :attr:`~smrf.framework.model_framework.SMRF.date_time` and places the
         distributed values into the
-        :func:`DateQueue <smrf.utils.queue.DateQueue_Threading>`.
+        :func:`DateQueue <smrf.utils.queue.DateQueue_Threading>`. Each value is
+        released from the queue once every thread that reads it has done so.
         """
 
         # Load the data into the data queue
@@ -514,11 +634,9 @@ class SMRF():
                 self.out_func,
                 self.config['output']['frequency'],
                 self.topo.nx,
-                self.topo.ny))
-
-        # the cleaner
-        self.threads.append(queue.QueueCleaner(
-            self.date_time, self.smrf_queue))
+                self.topo.ny,
+                timing=self.timing,
+                start_index=self.run_index(self.date_time[0])))
 
         # start all the threads
         for i in range(len(self.threads)):
@@ -530,22 +648,603 @@ class SMRF():
 
         self._logger.debug('DONE!!!!')
 
+    def disttribute_data_chunked(self):
+        """
+        Distribute the measurement point data by splitting
+        :attr:`~smrf.framework.model_framework.SMRF.date_time` into
+        ``time_chunks`` and distributing each chunk in serial within a process
+        pool.
+
+        The model state carried between time steps (i.e. storm days) only
+        depends on the modules from
+        :func:`~smrf.framework.model_framework.SMRF.state_modules`. Those
+        modules are distributed here one time chunk after the other, and
+        every chunk is handed to the process pool as soon as the state
+        modules reach its end. The fields of the state modules are written
+        to the chunk output location by
+        :func:`~smrf.framework.model_framework.SMRF.distribute_state_fields`
+        so the chunk only distributes the other modules. The last chunk
+        starts from the state at its start and distributes all the modules.
+        State that depends on the full period (the marks2017 storm table) is
+        calculated here and handed to every chunk. The chunked run
+        reproduces a serial run and the chunk outputs are written to the
+        output files.
+
+        The topo is loaded once and shared with the chunks by
+        :func:`~smrf.data.load_topo.Topo.share`.
+        """
+
+        self.initialize_distribution()
+
+        chunks = self.create_time_chunks()
+        period_state = self.get_model_state(period=True)
+
+        # the modules that carry state are distributed here
+        state_scheduler = self.create_scheduler(self.state_modules())
+        self._logger.info('Distributing {} for each time chunk'.format(
+            ', '.join(state_scheduler.order)))
+
+        self._logger.info('Distributing {} time chunks in {} processes'.format(
+            len(chunks), self.max_processes or len(chunks)))
+
+        # every chunk attaches to the same topo images
+        self.calculate_topo_images()
+        self.topo.share()
+
+        # spawn the processes as forking a threaded process can deadlock
+        try:
+            with ProcessPoolExecutor(
+                    max_workers=self.max_processes,
+                    mp_context=multiprocessing.get_context('spawn')
+            ) as executor:
+                futures = []
+                for chunk in chunks:
+                    state = self.get_model_state()
+                    for module, values in period_state.items():
+                        state[module].update(values)
+
+                    state_fields = None
+                    if chunk is not chunks[-1]:
+                        state_fields = self.distribute_state_fields(
+                            chunk, state_scheduler)
+
+                    futures.append(executor.submit(
+                        distribute_chunk, self.chunk_config(chunk), state,
+                        self.topo, state_fields))
+
+                results = [future.result() for future in futures]
+        finally:
+            self.topo.unshare()
+            state_scheduler.shutdown()
+
+        for result in results:
+            self.timing.extend(result['timing'])
+
+        self.output_chunks(chunks)
+        self.set_model_state(results[-1]['end_state'])
+
+    def distribute_state_fields(self, chunk, scheduler):
+        """
+        Distribute the state modules over a time chunk and write the fields
+        they produce, and their output variables, for every time step to
+        ``STATE_FIELDS_FILE`` in the chunk output location. The time steps
+        are pickled one after the other so the chunk reads them back one
+        time step at a time.
+
+        Args:
+            chunk (dict): time chunk from
+                :func:`~smrf.framework.model_framework.SMRF.create_time_chunks`
+            scheduler (DistributeScheduler): scheduler of the state modules
+
+        Returns:
+            str: file of the state fields
+        """
+
+        os.makedirs(chunk['out_location'], exist_ok=True)
+        file_name = join(chunk['out_location'], self.STATE_FIELDS_FILE)
+
+        with open(file_name, 'wb') as f:
+            for t in self.date_time[
+                    chunk['start_index']:chunk['end_index'] + 1]:
+                fields = self.distribute_single_timestep(
+                    t, scheduler=scheduler)
+
+                variables = {}
+                for name in scheduler.order:
+                    module = self.distribute[name]
+                    variables[name] = {
+                        v: getattr(module, v, None)
+                        for v in module.OUTPUT_VARIABLES}
+
+                pickle.dump({
+                    'fields': {field: fields[field]
+                               for field in scheduler.producers},
+                    'variables': variables
+                }, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        return file_name
+
+    def calculate_topo_images(self):
+        """
+        Calculate the lazy topo images the modules use before the topo is
+        shared, so the processes attach to the images instead of each
+        calculating them over the domain
+        """
+
+        images = []
+        if 'illum_ang' in self.scheduler.input_fields:
+            images += Topo.GRADIENT_IMAGES
+        if 'solar' in self.scheduler.order or \
+                'thermal' in self.scheduler.order:
+            images += Topo.VIEWF_IMAGES
+
+        for v in images:
+            getattr(self.topo, v)
+
+    def state_modules(self):
+        """
+        Find the distribute modules that carry state between time steps
+        (``STATE_VARIABLES``) and the modules they depend on
+
+        Returns:
+            list: module names in dependency order
+        """
+
+        names = set(name for name, module in self.distribute.items()
+                    if module.STATE_VARIABLES)
+
+        dependencies = list(names)
+        while dependencies:
+            for name in self.scheduler.dependencies[dependencies.pop()]:
+                if name not in names:
+                    names.add(name)
+                    dependencies.append(name)
+
+        return [name for name in self.scheduler.order if name in names]
+
+    def create_time_chunks(self):
+        """
+        Split :attr:`~smrf.framework.model_framework.SMRF.date_time` into
+        ``time_chunks`` contiguous chunks
+
+        Returns:
+            list: dict for each chunk with the chunk index, the index of the
+                first time step and the first and last time step
+        """
+
+        n_chunks = min(self.time_chunks, self.time_steps)
+
+        chunks = []
+        for i, index in enumerate(
+                np.array_split(np.arange(self.time_steps), n_chunks)):
+            chunks.append({
+                'index': i,
+                'start_index': index[0],
+                'end_index': index[-1],
+                'start': self.date_time[index[0]],
+                'end': self.date_time[index[-1]],
+                'out_location': join(
+                    self.config['output']['out_location'],
+                    'chunk_{:03d}'.format(i))
+            })
+
+        return chunks
+
+    def chunk_config(self, chunk):
+        """
+        Create the configuration to distribute a single time chunk. The
+        chunk is distributed in serial and outputs every time step to the
+        chunk output location.
+
+        Args:
+            chunk (dict): time chunk from
+                :func:`~smrf.framework.model_framework.SMRF.create_time_chunks`
+
+        Returns:
+            UserConfig: configuration for the chunk
+        """
+
+        config = self.worker_config(chunk['out_location'])
+        cfg = config.cfg
+
+        cfg['time']['start_date'] = chunk['start'].tz_localize(None)
+        cfg['time']['end_date'] = chunk['end'].tz_localize(None)
+
+        cfg['output']['frequency'] = 1
+
+        # the initial state is handed to the chunk
+        cfg['precip']['storm_days_restart'] = None
+
+        return config
+
+    def worker_config(self, out_location):
+        """
+        Create the configuration for a time chunk or tile worker that
+        distributes in serial to its own output location
+
+        Args:
+            out_location (str): output location for the worker
+
+        Returns:
+            UserConfig: configuration for the worker
+        """
+
+        config = deepcopy(self.ucfg)
+        cfg = config.cfg
+
+        cfg['output']['out_location'] = out_location
+        cfg['output']['mask_output'] = False
+        cfg['output']['input_backup'] = False
+        cfg['output']['checkpoint_frequency'] = 0
+
+        cfg['system']['tile_rows'] = 1
+        cfg['system']['tile_cols'] = 1
+        cfg['system']['time_chunks'] = 1
+        cfg['system']['threading'] = False
+
+        return config
+
+    def output_chunks(self, chunks):
+        """
+        Write the time chunk outputs to the output files and remove the
+        chunk output locations
+
+        Args:
+            chunks (list): time chunks from
+                :func:`~smrf.framework.model_framework.SMRF.create_time_chunks`
+        """
+
+        for chunk in chunks:
+            self._logger.debug('Outputting time chunk {}'.format(
+                chunk['index']))
+
+            for v in self.out_func.variable_dict.values():
+                f = nc.Dataset(
+                    join(chunk['out_location'], '{}.nc'.format(v['variable'])),
+                    'r')
+                f.set_always_mask(False)
+
+                for index, t in enumerate(self.output_file_times(f)):
+                    output_count = self.date_time.index(t)
+
+                    if output_count % self.config['output']['frequency'] == 0:
+                        with self.timing.time('output', v['variable'], t):
+                            self.out_func.output(
+                                v['variable'],
+                                f.variables[v['variable']][index, :],
+                                t)
+
+                f.close()
+
+            shutil.rmtree(chunk['out_location'])
+
+    def disttribute_data_tiled(self):
+        """
+        Distribute the measurement point data by splitting the model domain
+        into ``tile_rows`` by ``tile_cols`` tiles and distributing each tile
+        in serial within a process pool. Each tile is extended by
+        ``tile_halo`` pixels so the neighbourhood calculations (horizon
+        angles for the solar radiation and filling the wind fields) see the
+        surrounding terrain. Only the tile without the halo is written to the
+        output files.
+
+        The topo is loaded and shared once and each process slices its
+        :func:`~smrf.data.load_topo.Topo.tile` from the attached images,
+        which does not copy the images. Stations are located in the full
+        model domain so every tile uses the same stations.
+        """
+
+        tiles = self.create_tiles()
+
+        self._logger.info('Distributing {} tiles in {} processes'.format(
+            len(tiles), self.max_processes or len(tiles)))
+
+        self.calculate_topo_images()
+        self.topo.share()
+        try:
+            # spawn the processes as forking a threaded process can deadlock
+            with ProcessPoolExecutor(
+                    max_workers=self.max_processes,
+                    mp_context=multiprocessing.get_context('spawn')
+            ) as executor:
+                futures = []
+                for tile in tiles:
+                    futures.append(executor.submit(
+                        distribute_tile,
+                        self.worker_config(tile['out_location']),
+                        self.topo,
+                        tile['rows'],
+                        tile['cols']))
+
+                for future in futures:
+                    self.timing.extend(future.result())
+        finally:
+            self.topo.unshare()
+
+        self.output_tiles(tiles)
+
+    def create_tiles(self):
+        """
+        Split the model domain into ``tile_rows`` by ``tile_cols`` tiles
+        with a halo of ``tile_halo`` pixels
+
+        Returns:
+            list: dict for each tile with the rows and columns of the domain
+                in the tile including the halo, the rows and columns of the
+                domain the tile outputs and the same rows and columns within
+                the tile
+        """
+
+        halo = self.tile_halo
+
+        tiles = []
+        for rows in np.array_split(np.arange(self.topo.ny), self.tile_rows):
+            for cols in np.array_split(
+                    np.arange(self.topo.nx), self.tile_cols):
+
+                tile_rows = slice(
+                    max(rows[0] - halo, 0),
+                    min(rows[-1] + 1 + halo, self.topo.ny))
+                tile_cols = slice(
+                    max(cols[0] - halo, 0),
+                    min(cols[-1] + 1 + halo, self.topo.nx))
+
+                tiles.append({
+                    'index': len(tiles),
+                    'rows': tile_rows,
+                    'cols': tile_cols,
+                    'out_rows': slice(rows[0], rows[-1] + 1),
+                    'out_cols': slice(cols[0], cols[-1] + 1),
+                    'tile_rows': slice(
+                        rows[0] - tile_rows.start,
+                        rows[-1] + 1 - tile_rows.start),
+                    'tile_cols': slice(
+                        cols[0] - tile_cols.start,
+                        cols[-1] + 1 - tile_cols.start),
+                    'out_location': join(
+                        self.config['output']['out_location'],
+                        'tile_{:03d}'.format(len(tiles)))
+                })
+
+        return tiles
+
+    def output_tiles(self, tiles):
+        """
+        Stitch the tile outputs together without the halos, write to the
+        output files and remove the tile output locations
+
+        Args:
+            tiles (list): tiles from
+                :func:`~smrf.framework.model_framework.SMRF.create_tiles`
+        """
+
+        for v in self.out_func.variable_dict.values():
+            self._logger.debug('Outputting tiles for {}'.format(
+                v['variable']))
+
+            files = []
+            for tile in tiles:
+                f = nc.Dataset(
+                    join(tile['out_location'], '{}.nc'.format(v['variable'])),
+                    'r')
+                f.set_always_mask(False)
+                files.append(f)
+
+            data = np.zeros((self.topo.ny, self.topo.nx))
+            for index, t in enumerate(self.output_file_times(files[0])):
+                for tile, f in zip(tiles, files):
+                    data[tile['out_rows'], tile['out_cols']] = \
+                        f.variables[v['variable']][
+                            index, tile['tile_rows'], tile['tile_cols']]
+
+                with self.timing.time('output', v['variable'], t):
+                    self.out_func.output(v['variable'], data, t)
+
+            for f in files:
+                f.close()
+
+        for tile in tiles:
+            shutil.rmtree(tile['out_location'])
+
+    def output_file_times(self, f):
+        """
+        Read the time steps from an output file
+
+        Args:
+            f (netCDF4.Dataset): output file
+
+        Returns:
+            list: time steps in the model time zone
+        """
+
+        times = f.variables['time']
+        file_time = nc.num2date(
+            times[:],
+            times.units,
+            times.calendar,
+            only_use_cftime_datetimes=False)
+
+        return [pd.Timestamp(t).tz_localize(self.time_zone)
+                for t in file_time]
+
+    def get_model_state(self, period=False):
+        """
+        Get a copy of the model state from each distribute module and the
+        input data
+
+        Args:
+            period (bool, optional): get the state determined from the full
+                period of input data instead of the state carried between
+                time steps. Defaults to False.
+
+        Returns:
+            dict: state for each distribute module and the input data
+        """
+
+        state = {}
+        for name, module in self.distribute.items():
+            if period:
+                state[name] = module.get_state(module.PERIOD_STATE_VARIABLES)
+            else:
+                state[name] = module.get_state()
+
+        state['data'] = {}
+        if not period and hasattr(self.data.load_class, 'get_state'):
+            state['data'] = self.data.load_class.get_state()
+
+        return state
+
+    def set_model_state(self, state):
+        """
+        Set the model state for each distribute module and the input data
+
+        Args:
+            state (dict): state from
+                :func:`~smrf.framework.model_framework.SMRF.get_model_state`
+        """
+
+        for name, values in state.items():
+            if name == 'data':
+                if values:
+                    self.data.load_class.set_state(values)
+            else:
+                self.distribute[name].set_state(values)
+
+    @property
+    def checkpoint_file(self):
+        return join(self.config['output']['out_location'],
+                    self.CHECKPOINT_FILE)
+
+    def run_index(self, current_time_step):
+        """
+        Index of the time step in the full run, including the time steps
+        before a restart
+
+        Args:
+            current_time_step (datetime): time step in
+                :py:attr:`date_time`
+
+        Returns:
+            int: index of the time step
+        """
+
+        index = self.date_time.index(current_time_step)
+        if self.checkpoint is not None:
+            index += self.checkpoint['run_index'] + 1
+
+        return index
+
+    def checkpoint_due(self, current_time_step):
+        """
+        Checkpoints are written every ``checkpoint_frequency`` time steps
+        when the next time step is also an output time step, so a restarted
+        run outputs on the same time steps.
+
+        Args:
+            current_time_step (datetime): time step that was distributed
+
+        Returns:
+            bool: True if a checkpoint is due after the time step
+        """
+
+        frequency = self.config['output']['checkpoint_frequency']
+        if frequency <= 0:
+            return False
+
+        count = self.run_index(current_time_step) + 1
+
+        return count % frequency == 0 and \
+            count % self.config['output']['frequency'] == 0
+
+    def write_checkpoint(self, current_time_step):
+        """
+        Write the model state after the current time step and the spatial
+        interpolation weights to the checkpoint file in the ``out_location``.
+        The file is replaced once the new checkpoint is complete, a failure
+        while writing keeps the last checkpoint.
+
+        Args:
+            current_time_step (datetime): time step that was distributed
+        """
+
+        checkpoint = {
+            'time_step': current_time_step,
+            'run_index': self.run_index(current_time_step),
+            'state': self.get_model_state(),
+            'interpolators': {
+                name: module.get_interpolators()
+                for name, module in self.distribute.items()
+            }
+        }
+
+        tmp_file = '{}.tmp'.format(self.checkpoint_file)
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, self.checkpoint_file)
+
+        self._logger.info('Checkpoint written for {}'.format(
+            current_time_step))
+
+    def load_checkpoint(self):
+        """
+        Load the checkpoint from the ``out_location`` to restart the run from
+        the time step after the checkpoint. The model state is set when the
+        distribution is initialized, the interpolation weights from the
+        checkpoint are used instead of calculating them and the outputs are
+        added to the existing output files.
+        """
+
+        if self.tile_rows * self.tile_cols > 1 or self.time_chunks > 1:
+            raise ValueError('Restarting from a checkpoint is only supported '
+                             'with serial or threaded distribution')
+
+        if not os.path.isfile(self.checkpoint_file):
+            raise FileNotFoundError('No checkpoint to restart from at '
+                                    '{}'.format(self.checkpoint_file))
+
+        with open(self.checkpoint_file, 'rb') as f:
+            checkpoint = pickle.load(f)
+
+        if checkpoint['time_step'] not in self.date_time:
+            raise ValueError('Checkpoint time step {} is not in the run '
+                             'period'.format(checkpoint['time_step']))
+
+        index = self.date_time.index(checkpoint['time_step'])
+        self.date_time = self.date_time[index + 1:]
+        self.time_steps = len(self.date_time)
+        self.checkpoint = checkpoint
+
+        for name, interpolators in checkpoint['interpolators'].items():
+            self.distribute[name].set_interpolators(interpolators)
+
+        self._logger.info('Restarting from the checkpoint at {}'.format(
+            checkpoint['time_step']))
+        self._logger.info('Number of time steps --> %i' % self.time_steps)
+
     def create_data_queue(self):
 
         self._logger.info('Creating the data queue and loading current data')
 
+        # threads that read the station data
+        consumers = Counter()
+        for module in self.distribute.values():
+            if hasattr(module, 'distribute_thread'):
+                consumers.update(module.THREAD_DATA_INPUTS)
+
         self.data_queue = {}
         for variable in self.data.VARIABLES[:-1]:
             dq = queue.DateQueueThreading(
                 timeout=self.time_out,
-                name="data_{}".format(variable))
+                name="data_{}".format(variable),
+                consumers=consumers[variable])
 
             # load the data into the queue, all methods should have
             # loaded something, even the HRRR will have a single hour
             # of data loaded.
             data = getattr(self.data, variable, pd.DataFrame())
             for date_time, row in data.iterrows():
-                dq.put([date_time, row])
+                if date_time >= self.date_time[0]:
+                    dq.put([date_time, row])
 
             self.data_queue[variable] = dq
 
@@ -565,11 +1264,50 @@ class SMRF():
         for v in self.distribute:
             self.thread_queue_variables += self.distribute[v].thread_variables
 
-    def create_distributed_threads(self, other_queue=None):
+    def set_queue_consumers(self, consumers=None):
+        """
+        Count the threads that read each queued variable so the value can be
+        released as soon as the last thread has read it. This includes the
+        illumination angle thread, the distribute threads and the output
+        thread.
+
+        Args:
+            consumers (dict, optional): additional consumers for a variable
+                from threads outside of SMRF. Defaults to None.
+        """
+
+        if consumers is not None and not isinstance(consumers, dict):
+            raise TypeError('consumers must be a dict of the number of '
+                            'consumers for each variable')
+
+        self.queue_consumers = Counter(consumers)
+
+        # illumination angle
+        self.queue_consumers.update(['cosz', 'azimuth'])
+
+        for module in self.distribute.values():
+            if hasattr(module, 'distribute_thread'):
+                self.queue_consumers.update(module.thread_inputs)
+
+        # output thread
+        for v in self.out_func.variable_dict.values():
+            if v['variable'] in self.thread_queue_variables:
+                self.queue_consumers[v['variable']] += 1
+
+    def create_distributed_threads(self, consumers=None):
         """
         Creates the threads for a distributed run in smrf.
         Designed for smrf runs in memory
 
+        Each value is released from :attr:`smrf_queue` once every thread
+        reading it has done so. Threads outside of SMRF that read from
+        :attr:`smrf_queue` must be counted with ``consumers`` so the values
+        are held until they are read.
+
+        Args:
+            consumers (dict, optional): additional consumers for a variable
+                from threads outside of SMRF. Defaults to None.
+
         Returns
             t: list of threads for distribution
             q: queue
@@ -581,6 +1319,7 @@ class SMRF():
 
         self.initialize_distribution(self.date_time)
         self.set_queue_variables()
+        self.set_queue_consumers(consumers)
 
         # -------------------------------------
         # Create Queues for all the variables
@@ -591,7 +1330,9 @@ class SMRF():
             self.smrf_queue[v] = queue.DateQueueThreading(
                 self.queue_max_values,
                 self.time_out,
-                name=v)
+                name=v,
+                consumers=self.queue_consumers[v],
+                dtype=self.dtype)
 
         # -------------------------------------
         # Distribute the data
@@ -603,30 +1344,24 @@ class SMRF():
             name='sun_angle',
             args=(self.smrf_queue, self.date_time,
                   self.topo.basin_lat,
-                  self.topo.basin_long)))
+                  self.topo.basin_long),
+            kwargs={'timing': self.timing}))
 
         # 0.2 illumination angle
         self.threads.append(Thread(
             target=model.shade_thread,
             name='illum_angle',
             args=(self.smrf_queue, self.date_time,
-                  self.topo.sin_slope, self.topo.aspect)))
-
-        thread_dict = {
-            'air_temp': self.distribute['air_temp'].distribute_thread,
-            'vapor_pressure': self.distribute['vapor_pressure'].distribute_thread,  # noqa
-            'wind': self.distribute['wind'].distribute_thread,
-            'precipitation': self.distribute['precipitation'].distribute_thread,  # noqa
-            'albedo': self.distribute['albedo'].distribute_thread,
-            'cloud_factor': self.distribute['cloud_factor'].distribute_thread,
-            'solar': self.distribute['solar'].distribute_thread,
-            'thermal': self.distribute['thermal'].distribute_thread
-        }
+                  self.topo.sin_slope, self.topo.aspect),
+            kwargs={'timing': self.timing}))
+
+        for name in self.scheduler.order:
+            if not hasattr(self.distribute[name], 'distribute_thread'):
+                continue
 
-        for name, target in thread_dict.items():
             self.threads.append(
                 Thread(
-                    target=target,
+                    target=self.distribute[name].distribute_thread,
                     name=name,
                     args=(self.smrf_queue, self.data_queue))
             )
@@ -717,7 +1452,8 @@ class SMRF():
 
         # Only output according to the user specified value,
         # or if it is the end.
-        if (output_count % self.config['output']['frequency'] == 0) or \
+        if (self.run_index(current_time_step) %
+                self.config['output']['frequency'] == 0) or \
            (output_count == len(self.date_time)):
 
             # User is attempting to output single variable
@@ -746,7 +1482,10 @@ class SMRF():
 
                 # output the time step
                 self._logger.debug("Outputting {0}".format(v['module']))
-                self.out_func.output(v['variable'], data, current_time_step)
+                with self.timing.time('output', v['variable'],
+                                      current_time_step):
+                    self.out_func.output(
+                        v['variable'], data, current_time_step)
 
     def post_process(self):
         """
@@ -771,12 +1510,14 @@ class SMRF():
             self._logger.info(line)
 
 
-def run_smrf(config, external_logger=None):
+def run_smrf(config, external_logger=None, restart=False):
     """
     Function that runs smrf how it should be operate for full runs.
 
     Args:
         config: string path to the config file or inicheck UserConfig instance
+        restart: restart from the last checkpoint in the ``out_location`` and
+            add to the existing outputs
     """
     start = datetime.now()
     # initialize
@@ -793,17 +1534,120 @@ def run_smrf(config, external_logger=None):
         # load weather data  and station metadata
         s.loadData()
 
+        # resume after the last checkpoint
+        if restart:
+            s.load_checkpoint()
+
         # distribute
         s.disttribute_data()
 
         # post process if necessary
         s.post_process()
 
+        if s.config['output']['timing_report']:
+            s.timing.write(s.config['output']['out_location'])
+
         s._logger.info(datetime.now() - start)
 
     return s
 
 
+def distribute_chunk(config, state, topo, state_fields=None):
+    """
+    Distribute a single time chunk in serial. Used by
+    :func:`~smrf.framework.model_framework.SMRF.disttribute_data_chunked` to
+    distribute the time chunks in separate processes.
+
+    Args:
+        config: inicheck UserConfig instance for the chunk
+        state (dict): model state at the start of the chunk
+        topo: :mod:`~smrf.data.load_topo.Topo` for the model domain
+        state_fields (str, optional): file with the fields of the state
+            modules from :func:`SMRF.distribute_state_fields`, which are
+            then not distributed by the chunk. Defaults to None, which
+            distributes all the modules.
+
+    Returns:
+        dict: model state at the end of the chunk and the timing records of
+            the chunk
+    """
+
+    s = SMRF(config, external_logger=logging.getLogger(__name__))
+    s.topo = topo
+    s.create_distribution()
+    s.initializeOutput()
+    s.loadData()
+
+    s.initialize_distribution()
+    s.set_model_state(state)
+
+    if state_fields is None:
+        for t in s.date_time:
+            s.distribute_single_timestep(t)
+            s.output(t)
+
+        s.scheduler.shutdown()
+
+    else:
+        state_modules = s.state_modules()
+        fields = set()
+        for name in state_modules:
+            fields.update(s.distribute[name].DISTRIBUTE_OUTPUTS)
+
+        scheduler = s.create_scheduler(
+            [name for name in s.scheduler.order if name not in state_modules],
+            fields)
+
+        with open(state_fields, 'rb') as f:
+            for t in s.date_time:
+                values = pickle.load(f)
+
+                # the state modules output the distributed variables
+                for name, variables in values['variables'].items():
+                    for v, value in variables.items():
+                        setattr(s.distribute[name], v, value)
+
+                s.distribute_single_timestep(
+                    t, scheduler=scheduler, fields=values['fields'])
+                s.output(t)
+
+        scheduler.shutdown()
+        os.remove(state_fields)
+
+    return {
+        'end_state': s.get_model_state(),
+        'timing': s.timing.records
+    }
+
+
+def distribute_tile(config, topo, rows, cols):
+    """
+    Distribute a single tile of the model domain in serial. Used by
+    :func:`~smrf.framework.model_framework.SMRF.disttribute_data_tiled` to
+    distribute the tiles in separate processes.
+
+    Args:
+        config: inicheck UserConfig instance for the tile
+        topo: shared :mod:`~smrf.data.load_topo.Topo` of the model domain
+        rows (slice): rows of the domain in the tile
+        cols (slice): columns of the domain in the tile
+
+    Returns:
+        list: timing records of the tile
+    """
+
+    s = SMRF(config, external_logger=logging.getLogger(__name__))
+    s.topo = topo.tile(rows, cols)
+    if s.compress_mask and np.any(s.topo.mask):
+        s.topo = s.topo.compress()
+    s.create_distribution()
+    s.initializeOutput()
+    s.loadData()
+    s.disttribute_data_serial()
+
+    return s.timing.records
+
+
 def can_i_run_smrf(config):
     """
     Function that wraps run_smrf in try, except for testing purposes
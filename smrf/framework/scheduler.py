@@ -0,0 +1,240 @@
+"""
+The module :mod:`~smrf.framework.scheduler` builds a dependency graph of the
+distribute modules from the fields each module declares it consumes
+(``DISTRIBUTE_INPUTS``) and produces (``DISTRIBUTE_OUTPUTS``). The graph is
+used to run the modules for a time step in dependency order, running modules
+that do not depend on each other concurrently.
+
+Example:
+    >>> scheduler = DistributeScheduler(
+    ...     s.distribute, ['time', 'cosz', 'azimuth', 'illum_ang'])
+    >>> scheduler.critical_path()
+    ['air_temp', 'vapor_pressure', 'precipitation', 'albedo', 'solar']
+    >>> scheduler.run(fields)
+
+"""
+
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from smrf.utils.timing import Timing
+
+
+class DistributeScheduler():
+    """
+    Dependency graph scheduler for the distribute modules
+
+    Args:
+        modules (dict): distribute module instances by name, each with
+            ``DISTRIBUTE_INPUTS`` and ``DISTRIBUTE_OUTPUTS``
+        base_fields (list): fields that are provided to
+            :func:`~smrf.framework.scheduler.DistributeScheduler.run` and not
+            produced by a module
+        max_workers (int, optional): number of modules to run concurrently.
+            Defaults to 1, which runs the modules in order. The thread pool
+            is created on the first run and kept until
+            :func:`~smrf.framework.scheduler.DistributeScheduler.shutdown`.
+        timing (Timing, optional): records the wall time of each module for
+            each time step. Defaults to None, which does not record.
+
+    Attributes:
+        producers: module that produces each field
+        input_fields: base fields that are consumed by at least one module
+        dependencies: set of modules that each module depends on
+        order: modules in a dependency order
+    """
+
+    def __init__(self, modules, base_fields, max_workers=1, timing=None):
+
+        self._logger = logging.getLogger(__name__)
+
+        self.modules = modules
+        self.base_fields = set(base_fields)
+        self.max_workers = max_workers
+        self.timing = timing if timing is not None else Timing(enabled=False)
+
+        self.producers = {}
+        for name, module in self.modules.items():
+            for field in module.DISTRIBUTE_OUTPUTS:
+                if field in self.base_fields:
+                    raise ValueError(
+                        'Module {} output {} is a base field'.format(
+                            name, field))
+                if field in self.producers:
+                    raise ValueError(
+                        'Field {} is an output of modules {} and {}'.format(
+                            field, self.producers[field], name))
+                self.producers[field] = name
+
+        self.dependencies = {}
+        for name, module in self.modules.items():
+            self.dependencies[name] = set()
+            for field in module.DISTRIBUTE_INPUTS:
+                if field in self.producers:
+                    self.dependencies[name].add(self.producers[field])
+                elif field not in self.base_fields:
+                    raise ValueError(
+                        'Module {} input {} is not produced by any '
+                        'module'.format(name, field))
+
+        self.input_fields = set()
+        for module in self.modules.values():
+            self.input_fields.update(module.DISTRIBUTE_INPUTS)
+        self.input_fields &= self.base_fields
+
+        self.order = self.topological_order()
+        self._executor = None
+
+    @property
+    def durations(self):
+        """
+        Total seconds spent running each module from the ``distribute``
+        records of the timing, zero for every module if the timing is not
+        enabled
+
+        Returns:
+            dict: seconds by module name
+        """
+
+        totals = self.timing.totals('distribute')
+
+        return {name: totals.get(getattr(module, 'variable', name), 0.0)
+                for name, module in self.modules.items()}
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix='distribute')
+        return self._executor
+
+    def shutdown(self):
+        """
+        Shut down the thread pool once all the time steps have been run
+        """
+
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def topological_order(self):
+        """
+        Order the modules so that every module comes after the modules it
+        depends on. Modules without a dependency between them keep the order
+        of ``modules``.
+
+        Returns:
+            list: module names in dependency order
+        """
+
+        order = []
+        remaining = list(self.modules)
+        while remaining:
+            ready = [name for name in remaining
+                     if self.dependencies[name].issubset(order)]
+            if len(ready) == 0:
+                raise ValueError(
+                    'Circular dependency between modules {}'.format(
+                        ', '.join(remaining)))
+
+            order += ready
+            remaining = [name for name in remaining if name not in ready]
+
+        return order
+
+    def critical_path(self, durations=None):
+        """
+        Find the longest chain of dependent modules, which limits how fast a
+        time step can be distributed no matter how many modules run
+        concurrently.
+
+        Args:
+            durations (dict, optional): duration of each module. Defaults to
+                None, which counts each module as one.
+
+        Returns:
+            list: module names along the critical path
+        """
+
+        if durations is None:
+            durations = dict.fromkeys(self.modules, 1)
+
+        length = {}
+        previous = {}
+        for name in self.order:
+            previous[name] = None
+            length[name] = 0
+            for dependency in self.dependencies[name]:
+                if length[dependency] > length[name]:
+                    length[name] = length[dependency]
+                    previous[name] = dependency
+            length[name] += durations[name]
+
+        name = max(self.order, key=lambda n: length[n])
+        path = []
+        while name is not None:
+            path.insert(0, name)
+            name = previous[name]
+
+        return path
+
+    def run_module(self, name, fields):
+        """
+        Distribute a single module from the fields and return the fields it
+        produced
+
+        Args:
+            name (str): module name
+            fields (dict): fields for the time step
+
+        Returns:
+            dict: fields produced by the module
+        """
+
+        module = self.modules[name]
+        with self.timing.time('distribute', getattr(module, 'variable', name),
+                              fields.get('time')):
+            outputs = module.distribute_fields(fields)
+
+        return outputs
+
+    def run(self, fields):
+        """
+        Distribute all modules for a time step. With ``max_workers`` greater
+        than one, every module whose dependencies have finished is run in the
+        thread pool.
+
+        Args:
+            fields (dict): base fields for the time step
+
+        Returns:
+            dict: base fields and all the fields produced by the modules
+        """
+
+        fields = dict(fields)
+
+        if self.max_workers == 1:
+            for name in self.order:
+                fields.update(self.run_module(name, fields))
+
+            return fields
+
+        done = set()
+        running = {}
+        while len(done) < len(self.order):
+
+            for name in self.order:
+                if name in done or name in running.values():
+                    continue
+                if self.dependencies[name].issubset(done):
+                    future = self.executor.submit(
+                        self.run_module, name, dict(fields))
+                    running[future] = name
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                fields.update(future.result())
+                done.add(running.pop(future))
+
+        return fields
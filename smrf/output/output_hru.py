@@ -69,7 +69,8 @@ class output_hru():
         self._logger.debug('Reading HRU ascii {}'
                            .format(self.config['hru_file']))
 
-        hru = np.loadtxt(self.config['hru_file'], skiprows=6)
+        # the HRUs of the cells of a compressed topo
+        hru = topo.gather(np.loadtxt(self.config['hru_file'], skiprows=6))
         hru_max = int(np.max(hru))
         self._logger.debug("Number of HRU's: {}".format(hru_max))
 
@@ -46,7 +46,10 @@ class OutputNetcdf():
         # determine the x,y vectors for the netCDF file
         x = topo.x
         y = topo.y
-        self.mask = topo.mask
+        self.mask = topo.expand(topo.mask)
+
+        # values of a compressed topo are expanded to the grid
+        self.expand = topo.expand
 
         dimensions = ('time', 'y', 'x')
         self.date_time = {}
@@ -179,6 +182,7 @@ class OutputNetcdf():
 
         # insert the time and data
         f.variables['time'][index] = t
+        data = self.expand(data)
 
         if self.outConfig['mask_output']:
             f.variables[variable][index, :] = data*self.mask
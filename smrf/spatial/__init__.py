@@ -1,3 +1,3 @@
 # -*- coding: utf-8 -*-
-from . import grid, idw  # noqa
+from . import grid, idw, trend  # noqa
 from .dk import dk  # noqa
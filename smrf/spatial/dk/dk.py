@@ -9,6 +9,9 @@ import logging
 import numpy as np
 import pandas as pd
 
+from smrf.spatial.trend import linear_trend
+from smrf.utils.cache import LRUCache, hash_key, mask_key
+
 from . import detrended_kriging
 
 
@@ -17,7 +20,9 @@ class DK:
     Detrended kriging class
     """
 
-    def __init__(self, mx, my, mz, GridX, GridY, GridZ, config):
+    def __init__(self, mx, my, mz, GridX, GridY, GridZ, config,
+                 dtype=np.float64, weight_store=None, store_key=None,
+                 cache_size=8):
         """
         Args:
             mx: x locations for the points
@@ -26,6 +31,13 @@ class DK:
             GridX: x locations in grid to interpolate over
             GridY: y locations in grid to interpolate over
             GridZ: z locations in grid to interpolate over
+            dtype: float type of the grid distances and weights, the
+                kriging system is always solved in double
+            weight_store: :mod:`~smrf.utils.cache.WeightStore` to keep the
+                weights for the stations with data between runs
+            store_key: key of the interpolation in the weight store
+            cache_size: number of weights to keep for the sets of stations
+                with data
         """
 
         # measurement point locations
@@ -44,18 +56,14 @@ class DK:
         self.data = None
         self.nan_val = []
 
-        # initialize some things
-        self.weights = []
-        self.dgrid = []
-        self.ad = []
-
         self.config = config
+        self.dtype = dtype
 
-        # calculate the distances
-#         self.calculateDistances()
+        self.weight_store = weight_store
+        self.store_key = store_key
 
-        # calculate the weights
-#         self.calculateWeights()
+        # weights by the stations with data
+        self.weight_cache = LRUCache(cache_size)
 
         self._logger = logging.getLogger(__name__)
 
@@ -72,79 +80,136 @@ class DK:
         """
 
         nan_val = pd.isnull(data)
-
-        # only calcualte if the stations involved have changed
-        # if np.sum(np.array_equal(nan_val,self.nan_val)) != len(self.mx):
-        if not np.array_equal(nan_val, self.nan_val):
-
-            self.nan_val = nan_val
-            nsta = np.sum(~nan_val)
-            self._logger.debug('''Recalculating detrended kriging weights
-                                for {} stations ...'''.format(nsta))
-
-            self.calculateWeights()
+        weights = self.calculateWeights(nan_val)
 
         # now calculate the trend and the residuals
-        self.detrendData(data)
+        pv, residuals = self.detrendData(data, nan_val)
 
         # distribute the risduals
-        r = np.nansum(self.weights * self.residuals, 2)
+        r = np.tensordot(weights, residuals.astype(self.dtype), axes=1)
 
         # retrend the residuals
-        v = self.retrendData(r)
+        v = self.retrendData(r, pv)
 
         return v
 
-    def calculateWeights(self):
+    def calculateBatch(self, data):
         """
-        Calculate the weights given those stations with nan values for data
+        Calculate the detrended kriging for a block of time steps. The trend
+        of every time step is fit with
+        :func:`~smrf.spatial.trend.linear_trend` and the time steps with the
+        same stations available are distributed with a single matrix product
+        of the kriging weights and the residuals.
+
+        Args:
+            data: station data of shape (T, nsta)
+
+        Returns:
+            v: distributed data of shape (T, ny, nx)
         """
 
-        nsta = np.sum(~self.nan_val)
-        mx = self.mx[~self.nan_val]
-        my = self.my[~self.nan_val]
-        mz = self.mz[~self.nan_val]
+        data = np.atleast_2d(data)
+        slope, intercept = linear_trend(
+            self.mz, data, self.config['detrend_slope'])
+        residuals = data - (np.outer(slope, self.mz) +
+                            intercept[:, np.newaxis])
 
-        # calculate the distances between stations
-        ad = np.zeros((nsta, nsta))
-        for i in range(nsta):
-            ad[i, i] = 0
-            for j in range(i+1, nsta):
-                ad[i, j] = np.sqrt((mx[i] - mx[j])**2 + (my[i] - my[j])**2)
-                ad[j, i] = np.sqrt((mx[i] - mx[j])**2 + (my[i] - my[j])**2)
+        shape = self.GridX.shape
+        r = np.empty((data.shape[0], self.ngrid), dtype=self.dtype)
 
-        self.ad = ad
+        patterns, index = np.unique(
+            np.isnan(data), axis=0, return_inverse=True)
+        for p, nan_val in enumerate(patterns):
+            steps = index.ravel() == p
+            w = self.calculateWeights(nan_val).reshape(self.ngrid, -1)
+            r[steps] = (w @ residuals[steps][:, ~nan_val].T.astype(
+                self.dtype)).T
 
-        # calculate the distances from the grid to the station
-        dgrid = np.zeros((self.ngrid, nsta))
-        Xa = self.GridX.ravel()
-        Ya = self.GridY.ravel()
-        for i in range(nsta):
-            dgrid[:, i] = np.sqrt((Xa - mx[i])**2 + (Ya - my[i])**2)
+        return r.reshape((data.shape[0],) + shape) + (
+            slope[:, np.newaxis, np.newaxis] * self.GridZ +
+            intercept[:, np.newaxis, np.newaxis])
 
-        self.dgrid = dgrid
+    def calculateWeights(self, nan_val):
+        """
+        Weights for the stations with data. Weights are kept in a least
+        recently used cache by the stations with data so alternating station
+        outages do not solve the kriging system again.
+
+        Args:
+            nan_val: True for the stations without data
+
+        Returns:
+            weights of shape (ny, nx, nsta with data)
+        """
+
+        return self.weight_cache.get(
+            mask_key(nan_val), self.stationWeights, nan_val)
+
+    def stationWeights(self, nan_val):
+        """
+        Weights of the stations with data, loaded from the
+        :py:attr:`weight_store` when set
+
+        Args:
+            nan_val: True for the stations without data
+
+        Returns:
+            weights of shape (ny, nx, nsta with data)
+        """
+
+        self._logger.debug(
+            'Calculating detrended kriging weights for {} stations'.format(
+                np.sum(~nan_val)))
+
+        if self.weight_store is not None:
+            wg = self.weight_store.get(
+                hash_key(self.store_key, np.asarray(nan_val)),
+                self.krigingWeights, nan_val)
+        else:
+            wg = self.krigingWeights(nan_val)
+
+        return np.ascontiguousarray(wg, dtype=self.dtype).reshape(
+            self.GridX.shape + (wg.shape[1],))
+
+    def krigingWeights(self, nan_val):
+        """
+        Solve the kriging system of each grid cell for the stations with data
+
+        Args:
+            nan_val: True for the stations without data
+
+        Returns:
+            wg: weights of shape (ngrid, nsta with data)
+        """
+
+        mx = self.mx[~nan_val]
+        my = self.my[~nan_val]
+        mz = self.mz[~nan_val]
+
+        # distances between stations and from the grid to the stations
+        ad = np.hypot(mx[:, np.newaxis] - mx, my[:, np.newaxis] - my)
+        dgrid = np.hypot(self.GridX.reshape(-1, 1) - mx,
+                         self.GridY.reshape(-1, 1) - my)
 
         # calculate the weights
         wg = np.zeros_like(dgrid)
-        detrended_kriging.call_grid(self.ad, self.dgrid, mz.astype(np.double),
+        detrended_kriging.call_grid(ad, dgrid, mz.astype(np.double),
                                     wg, self.config['dk_ncores'])
 
-        # reshape the weights
-        self.weights = np.zeros((self.GridX.shape[0],
-                                 self.GridX.shape[1],
-                                 nsta))
-        for v in range(nsta):
-            self.weights[:, :, v] = wg[:, v].reshape(self.GridX.shape)
+        return wg
 
-    def detrendData(self, data):
+    def detrendData(self, data, nan_val):
         """
         Detrend the data in val using the heights zmeas
         data    - is the same size at mx,my
-        flag     - 1 for positive, -1 for negative, 0 for any trend imposed
+        nan_val - True for the stations without data
+
+        Returns:
+            tuple: the trend and the residuals of the stations with data
         """
 
         # calculate the trend on any real data
-        pv = np.polyfit(self.mz[~self.nan_val], data[~self.nan_val], 1)
+        pv = np.polyfit(self.mz[~nan_val], data[~nan_val], 1)
 
         # apply trend constraints
         if self.config['detrend_slope'] == 1 and pv[0] < 0:
@@ -152,17 +217,15 @@ class DK:
         elif (self.config['detrend_slope'] == -1 and pv[0] > 0):
             pv = np.array([0, 0])
 
-        self.pv = pv
-
         # detrend the data
-        el_trend = self.mz[~self.nan_val] * pv[0] + pv[1]
+        el_trend = self.mz[~nan_val] * pv[0] + pv[1]
 
-        self.residuals = data[~self.nan_val] - el_trend
+        return pv, data[~nan_val] - el_trend
 
-    def retrendData(self, r):
+    def retrendData(self, r, pv):
         """
-        Retrend the residual values
+        Retrend the residual values with the trend from :func:`detrendData`
         """
 
         # retrend the data
-        return r + self.pv[0]*self.GridZ + self.pv[1]
+        return r + pv[0]*self.GridZ + pv[1]
@@ -1,216 +1,346 @@
-/*
- *    krige.c
- *
- *    David Garen   8/91, 3/94
- *
- *    Calculate kriging weights
- *
- *    26 May 2000:
- *    Change solution method to LU decomposition
- *
- *    Feb 2016:
- *    - Create new function krige_grid to calculate the kriging weights
- *    	on a grid. This is meant to be called from a Python function
- *    - Everything else is the same except the 2D arrays must now be indexed
- *    	with linear indexing
- *
- */
-
-#include <stdio.h>
-#include <stdlib.h>
-//#include <malloc/malloc.h>
-#include <omp.h>
-
-#include "dk_header.h"
-
-
-
-void krige_grid(nsta, ngrid, ad, dgrid, elevations, nthreads, weights)
-int nsta;					/* number of stations used */
-int ngrid;					/* number of grid cells*/
-double *ad;                      /* matrix of distances between prec/temp
-                                    stations for computing kriging weights */
-double *dgrid;                   /* array of distances between grid cells
-                                    and prec/temp stations */
-double *elevations;				 /* vector of station elevations */
-int nthreads;				/* number of threads for parrallel processing */
-double *weights;			/* output weights */
-//int nthreads;					/* number of threads to use */
-{
-
-	double w[nsta+1];			/* kriging weights */
-	int i, j;
-
-	/* Calculate kriging weights using all stations */
-	omp_set_dynamic(0);     // Explicitly disable dynamic teams
-	omp_set_num_threads(nthreads); // Use N threads for all consecutive parallel regions
-
-#pragma omp parallel shared(nsta, ad, dgrid, elevations, weights) private(i, j, w)
-	{
-#pragma omp for
-		for (i = 0; i < ngrid; i++) {
-
-			krige(nsta, ad, &dgrid[i*nsta], elevations, w);
-
-			for (j = 0; j < nsta; j++){
-				weights[i*nsta + j] = w[j];
-			}
-		}
-	}
-
-	//	return wall;
-}
-
-
-
-void krige(nsta, ad, dgrid, elevations, w)
-int nsta;                          /* number of stations used */
-double *ad;                      /* matrix of distances between prec/temp
-                                    stations for computing kriging weights */
-double *dgrid;                   /* array of distances between grid cells
-                                    and prec/temp stations */
-double *elevations;				 /* vector of station elevations */
-double *w;						/* kriging weights */
-{
-	double elevsave;               /* stored value of station elevation */
-	int m, mm, n, nn, i, j;             /* loop indexes */
-	int msave;                    /* stored value of m index */
-	int nsp1;                     /* ns plus 1 */
-	double *wcalc;                /* calculation vector for weights */
-	int ns;					 	 /* number of stations */
-	int luret;                    /* return value from lusolv() */
-	int *staflg;				 	 /* station use flags*/
-	double temp;						 /* temporary variable */
-	int itemp;						 /* temporary variable */
-	double *dist;					 /* sorted distance */
-	int *idx;					 /* index sorted distance */
-	double **a;                   /* data matrix for solving for kriging
-                                       weights (input to m_inv()) */
-//	double *w;                    /* kriging weights */
-//	double w[nsta+1];
-
-	//   nsta = ns;
-
-	// find the N closest stations
-	dist = vector(nsta);
-	idx = ivector(nsta);
-	for (i = 0; i < nsta; ++i){
-		dist[i] = dgrid[i];
-		idx[i] = i;
-	}
-	for (i = 0; i < nsta; ++i){
-		for (j = i + 1; j < nsta; ++j){
-			if (dist[i] > dist[j]) {
-				// sort the distance
-				temp = dist[i];
-				dist[i] = dist[j];
-				dist[j] = temp;
-
-				// re-sort the index
-				itemp = idx[i];
-				idx[i] = idx[j];
-				idx[j] = itemp;
-			}
-		}
-	}
-
-	// set station use flags
-	ns = 0;
-	staflg = ivector(nsta);
-	for (m = 0; m < nsta; m++) {
-		staflg[idx[m]] = 1;
-		ns++;
-	}
-	//   for (i = 0; i < nsta; ++i){
-	//	   printf("%f - %i - %i\n",dist[i],idx[i],staflg[i]);
-	//   }
-	//   exit(0);
-
-	a = dmatrix(nsta+1, nsta+2);
-//	w = dvector(nsta+1);
-
-
-	wcalc = dvector(nsta+1);
-	while (1) {
-		nsp1 = ns + 1;
-
-		/* Load matrix for calculating kriging weights using only
-         the desired stations (staflg = 1) */
-
-		mm = -1;
-		for (m = 0; m < nsta; m++) {
-			if (staflg[m] == 1) {
-				mm++;
-				nn = -1;
-				for (n = 0; n < nsta; n++) {
-					if (staflg[n] == 1) {
-						nn++;
-						a[mm][nn] = ad[m*nsta + n];
-					}
-				}
-				a[mm][ns] = a[ns][mm] = 1;
-				a[mm][nsp1] = dgrid[m];
-			}
-		}
-		a[ns][ns] = 0;
-		a[ns][nsp1] = 1;
-		n = nsp1;
-
-		/* Solve linear system for kriging weights */
-
-		if ((luret = lusolv(n, a, wcalc)) != 0) {
-			printf("Error in lusolv()\n");
-			exit(0);
-		}
-
-		/* Check for negative weights, throw out the most distant station by elevation with
-         a negative weight, and recalculate weights until all are positive */
-
-		elevsave = 0.0;
-		mm = msave = -1;
-		for (m = 0; m < nsta; m++) {
-			if (staflg[m] == 1) {
-				mm++;
-				if (wcalc[mm] < 0.0) {
-					if (elevations[m] > elevsave) {
-						msave = m;
-						elevsave = elevations[m];
-					}
-				}
-			}
-		}
-		if (msave >= 0) {
-			staflg[msave] = 0; // set station use flag to zero for furthest station
-			ns--;
-		}
-		else {
-			mm = -1;
-			for (m = 0; m < nsta; m++) {
-				if (staflg[m] == 1) {
-					mm++;
-					w[m] = wcalc[mm];
-				}
-				else
-					w[m] = 0.0;
-			}
-			break;
-		}
-	}
-
-//	free(wcalc);
-
-	/* clean up 1D arrays*/
-	free(dist);
-	free(idx);
-	free(staflg);
-	free(wcalc);
-
-	/* clean up 2D arrays*/
-	for (m = 0; m < nsta+1; m++) {
-		free(a[m]);
-	}
-	free(a);
-
-
-//	return w;
-}
+/*
+ *    krige.c
+ *
+ *    David Garen   8/91, 3/94
+ *
+ *    Calculate kriging weights
+ *
+ *    26 May 2000:
+ *    Change solution method to LU decomposition
+ *
+ *    Feb 2016:
+ *    - Create new function krige_grid to calculate the kriging weights
+ *    	on a grid. This is meant to be called from a Python function
+ *    - Everything else is the same except the 2D arrays must now be indexed
+ *    	with linear indexing
+ *
+ *    Oct 2026:
+ *    - The left hand side of the kriging system only depends on the
+ *    	stations in the system, not the grid cell. The system of all the
+ *    	stations is factored once for the grid and the systems without the
+ *    	stations with negative weights are factored once per thread and
+ *    	reused from a cache
+ *    - Work space is allocated once per thread instead of for every grid
+ *    	cell and the unused distance sort is removed
+ *
+ */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+//#include <malloc/malloc.h>
+#include <omp.h>
+
+#include "dk_header.h"
+
+/* maximum number and memory of the factored systems kept by each thread */
+#define KRIGE_CACHE 256
+#define KRIGE_CACHE_BYTES 67108864
+
+
+typedef struct {
+	int ns;						/* number of stations in the system,
+									-1 when not set */
+	char *staflg;				/* station use flags of the system */
+	double **lu;				/* LU decomposition of the system */
+	int *indx;					/* row permutation of the decomposition */
+} krige_system;
+
+
+static void krige_system_alloc(krige_system *sys, int nsta)
+{
+	sys->ns = -1;
+	sys->staflg = (char *) malloc(nsta * sizeof(char));
+	sys->lu = dmatrix(nsta+1, nsta+1);
+	sys->indx = ivector(nsta+1);
+}
+
+
+static void krige_system_free(krige_system *sys, int nsta)
+{
+	int m;
+
+	for (m = 0; m < nsta+1; m++) {
+		free(sys->lu[m]);
+	}
+	free(sys->lu);
+	free(sys->indx);
+	free(sys->staflg);
+}
+
+
+/*
+ * Load and factor the matrix for calculating kriging weights using only
+ * the desired stations (staflg = 1)
+ */
+static void krige_factor(nsta, ad, staflg, ns, sys)
+int nsta;						/* number of stations */
+double *ad;						/* matrix of distances between stations */
+char *staflg;					/* station use flags */
+int ns;							/* number of stations used */
+krige_system *sys;				/* factored system */
+{
+	int m, mm, n, nn;			/* loop indexes */
+	double d;					/* +/- 1 for row interchanges */
+
+	mm = -1;
+	for (m = 0; m < nsta; m++) {
+		if (staflg[m] == 1) {
+			mm++;
+			nn = -1;
+			for (n = 0; n < nsta; n++) {
+				if (staflg[n] == 1) {
+					nn++;
+					sys->lu[mm][nn] = ad[m*nsta + n];
+				}
+			}
+			sys->lu[mm][ns] = sys->lu[ns][mm] = 1;
+		}
+	}
+	sys->lu[ns][ns] = 0;
+
+	if (ludcmp(sys->lu, ns+1, sys->indx, &d) != 0) {
+		printf("Error in lusolv()\n");
+		exit(0);
+	}
+
+	memcpy(sys->staflg, staflg, nsta * sizeof(char));
+	sys->ns = ns;
+}
+
+
+/*
+ * Solve the factored system for the right hand side b, the solution is
+ * returned in b. Same as lubksb() without modifying the decomposition so
+ * the factored system can be shared.
+ */
+static void krige_solve(double **lu, int n, int *indx, double *b)
+{
+	int i, j;					/* looping indexes */
+	int ii = -1;				/* index of first nonzero r.h.s. value */
+	int ip;						/* index value */
+	double sum;					/* summing variable */
+
+	/* Forward substitution */
+
+	for (i = 0; i < n; i++) {
+		ip = indx[i];
+		sum = b[ip];
+		b[ip] = b[i];
+		if (ii >= 0) {
+			for (j = ii; j < i; j++)
+				sum -= lu[i][j] * b[j];
+		}
+		else if (sum > 0.0)
+			ii = i;
+		b[i] = sum;
+	}
+
+	/* Backsubstitution */
+
+	for (i = n-1; i >= 0; i--) {
+		sum = b[i];
+		for (j = i+1; j < n; j++)
+			sum -= lu[i][j] * b[j];
+		b[i] = sum / lu[i][i];
+	}
+}
+
+
+/*
+ * Find the factored system for the stations in the cache, factoring and
+ * replacing the oldest cached system when not found
+ */
+static krige_system *krige_lookup(nsta, ad, staflg, ns, cache, ncache, next)
+int nsta;						/* number of stations */
+double *ad;						/* matrix of distances between stations */
+char *staflg;					/* station use flags */
+int ns;							/* number of stations used */
+krige_system *cache;			/* cached systems */
+int ncache;						/* number of cached systems */
+int *next;						/* next cached system to replace */
+{
+	int c;
+	krige_system *sys;
+
+	for (c = 0; c < ncache; c++) {
+		if (cache[c].ns == ns &&
+				memcmp(cache[c].staflg, staflg, nsta * sizeof(char)) == 0) {
+			return &cache[c];
+		}
+	}
+
+	sys = &cache[*next];
+	*next = (*next + 1) % ncache;
+	krige_factor(nsta, ad, staflg, ns, sys);
+
+	return sys;
+}
+
+
+/*
+ * Kriging weights of a grid cell. Starts with the system of all the
+ * stations, throws out the most distant station by elevation with a
+ * negative weight, and recalculates weights until all are positive.
+ */
+static void krige_cell(nsta, ad, dgrid, elevations, full, cache, ncache,
+		next, staflg, wcalc, w)
+int nsta;						/* number of stations */
+double *ad;						/* matrix of distances between stations */
+double *dgrid;					/* distances between the cell and stations */
+double *elevations;				/* vector of station elevations */
+krige_system *full;				/* factored system of all the stations */
+krige_system *cache;			/* cached systems of the thread */
+int ncache;						/* number of cached systems */
+int *next;						/* next cached system to replace */
+char *staflg;					/* work space for the station use flags */
+double *wcalc;					/* work space for the weights */
+double *w;						/* kriging weights */
+{
+	double elevsave;			/* stored value of station elevation */
+	int m, mm;					/* loop indexes */
+	int msave;					/* stored value of m index */
+	int ns;						/* number of stations used */
+	krige_system *sys;			/* factored system of the stations used */
+
+	memset(staflg, 1, nsta * sizeof(char));
+	ns = nsta;
+	sys = full;
+
+	while (1) {
+
+		/* Right hand side for the stations used */
+
+		mm = -1;
+		for (m = 0; m < nsta; m++) {
+			if (staflg[m] == 1) {
+				mm++;
+				wcalc[mm] = dgrid[m];
+			}
+		}
+		wcalc[ns] = 1;
+
+		krige_solve(sys->lu, ns+1, sys->indx, wcalc);
+
+		/* Check for negative weights, throw out the most distant station by elevation with
+         a negative weight, and recalculate weights until all are positive */
+
+		elevsave = 0.0;
+		mm = msave = -1;
+		for (m = 0; m < nsta; m++) {
+			if (staflg[m] == 1) {
+				mm++;
+				if (wcalc[mm] < 0.0) {
+					if (elevations[m] > elevsave) {
+						msave = m;
+						elevsave = elevations[m];
+					}
+				}
+			}
+		}
+		if (msave >= 0) {
+			staflg[msave] = 0; // set station use flag to zero for furthest station
+			ns--;
+			sys = krige_lookup(nsta, ad, staflg, ns, cache, ncache, next);
+		}
+		else {
+			mm = -1;
+			for (m = 0; m < nsta; m++) {
+				if (staflg[m] == 1) {
+					mm++;
+					w[m] = wcalc[mm];
+				}
+				else
+					w[m] = 0.0;
+			}
+			break;
+		}
+	}
+}
+
+
+void krige_grid(nsta, ngrid, ad, dgrid, elevations, nthreads, weights)
+int nsta;					/* number of stations used */
+int ngrid;					/* number of grid cells*/
+double *ad;                      /* matrix of distances between prec/temp
+                                    stations for computing kriging weights */
+double *dgrid;                   /* array of distances between grid cells
+                                    and prec/temp stations */
+double *elevations;				 /* vector of station elevations */
+int nthreads;				/* number of threads for parrallel processing */
+double *weights;			/* output weights */
+//int nthreads;					/* number of threads to use */
+{
+
+	krige_system full;			/* factored system of all the stations */
+	char *staflg;
+	int i;
+	int ncache;					/* number of cached systems per thread */
+
+	/* The system of all the stations is the same for every grid cell */
+	krige_system_alloc(&full, nsta);
+	staflg = (char *) malloc(nsta * sizeof(char));
+	memset(staflg, 1, nsta * sizeof(char));
+	krige_factor(nsta, ad, staflg, nsta, &full);
+	free(staflg);
+
+	/* Keep as many systems as fit in the cache memory of a thread */
+	ncache = KRIGE_CACHE_BYTES /
+			((nsta+1) * ((nsta+1) * sizeof(double) + sizeof(int)));
+	if (ncache > KRIGE_CACHE)
+		ncache = KRIGE_CACHE;
+	if (ncache < 1)
+		ncache = 1;
+
+	/* Calculate kriging weights using all stations */
+	omp_set_dynamic(0);     // Explicitly disable dynamic teams
+	omp_set_num_threads(nthreads); // Use N threads for all consecutive parallel regions
+
+#pragma omp parallel shared(nsta, ngrid, ad, dgrid, elevations, weights, full, ncache) private(i)
+	{
+		krige_system *cache;
+		char *work_flg;
+		double *wcalc;
+		int c, next = 0;
+
+		/* work space of the thread */
+		cache = (krige_system *) malloc(ncache * sizeof(krige_system));
+		for (c = 0; c < ncache; c++) {
+			krige_system_alloc(&cache[c], nsta);
+		}
+		work_flg = (char *) malloc(nsta * sizeof(char));
+		wcalc = dvector(nsta+1);
+
+#pragma omp for
+		for (i = 0; i < ngrid; i++) {
+			krige_cell(nsta, ad, &dgrid[i*nsta], elevations, &full, cache,
+					ncache, &next, work_flg, wcalc, &weights[i*nsta]);
+		}
+
+		for (c = 0; c < ncache; c++) {
+			krige_system_free(&cache[c], nsta);
+		}
+		free(cache);
+		free(work_flg);
+		free(wcalc);
+	}
+
+	krige_system_free(&full, nsta);
+
+	//	return wall;
+}
+
+
+
+void krige(nsta, ad, dgrid, elevations, w)
+int nsta;                          /* number of stations used */
+double *ad;                      /* matrix of distances between prec/temp
+                                    stations for computing kriging weights */
+double *dgrid;                   /* array of distances between grid cells
+                                    and prec/temp stations */
+double *elevations;				 /* vector of station elevations */
+double *w;						/* kriging weights */
+{
+	/* Kriging weights of a single grid cell */
+	krige_grid(nsta, 1, ad, dgrid, elevations, 1, w);
+}
@@ -5,23 +5,30 @@ Distributed forcing data over a grid using interpolation
 '''
 
 import numpy as np
-import pandas as pd
-from scipy.interpolate import griddata
-from scipy.interpolate.interpnd import _ndim_coords_from_arrays
+from scipy.interpolate import CloughTocher2DInterpolator
+from scipy.spatial import cKDTree
 from scipy.spatial import qhull as qhull
 
-from smrf.utils.utils import grid_interpolate_deconstructed
+from smrf.spatial.trend import linear_trend
+from smrf.utils.cache import LRUCache, mask_key
 
 
 class GRID:
     '''
-    Inverse distance weighting class
-    - Standard IDW
-    - Detrended IDW
+    Gridded interpolation class
+    - Standard interpolation
+    - Detrended interpolation
+
+    The Delaunay triangulation of the points and the simplex and barycentric
+    weights of each grid cell only depend on the points with data. They are
+    calculated once and kept in a least recently used cache by the points
+    with data instead of calling ``scipy.interpolate.griddata`` for every
+    time step.
     '''
 
     def __init__(self, config, mx, my, GridX, GridY,
-                 mz=None, GridZ=None, mask=None, metadata=None):
+                 mz=None, GridZ=None, mask=None, metadata=None,
+                 mask_x=None, mask_y=None, cache_size=8):
         """
         Args:
             config: configuration for grid interpolation
@@ -33,6 +40,10 @@ class GRID:
             GridZ: z locations in grid to interpolate over
             mask: mask for those points to include in the detrending
                 will be ignored if config['mask'] is false
+            mask_x: x locations of the mask, defaults to the grid
+            mask_y: y locations of the mask, defaults to the grid
+            cache_size: number of triangulations to keep for the sets of
+                points with data
         """
 
         self.config = config
@@ -50,41 +61,30 @@ class GRID:
 
         self.metadata = metadata
 
-        # local elevation gradient, precalculte the distance dataframe
-        if config['grid_local']:
-            k = config['grid_local_n']
-            dist_df = pd.DataFrame(index=metadata.index, columns=range(k))
-            dist_df.index.name = 'cell_id'
-            for i, row in metadata.iterrows():
-
-                d = np.sqrt((metadata.latitude - row.latitude) **
-                            2 + (metadata.longitude - row.longitude)**2)
-                dist_df.loc[row.name] = d.sort_values()[:k].index
-
-            self.dist_df = dist_df
-
-            # stack and reset index
-            df = dist_df.stack().reset_index()
-            df = df.rename(columns={0: 'cell_local'})
-            df.drop('level_1', axis=1, inplace=True)
-
-            # get the elevations
-            df['elevation'] = metadata.loc[df.cell_local, 'elevation'].values
+        # triangulation and interpolation weights by the points with data
+        self.weight_cache = LRUCache(cache_size)
 
-            # now we have cell_id, cell_local and elevation for the whole grid
-            self.full_df = df
+        # local elevation gradient, find the nearest cells of each cell
+        if config['grid_local']:
+            k = min(config['grid_local_n'], len(metadata))
+            tree = cKDTree(np.column_stack(
+                (metadata.latitude.values, metadata.longitude.values)))
+            self.neighbors = tree.query(tree.data, k=k)[1].reshape(-1, k)
 
-            self.tri = None
+            # elevations of the nearest cells, shape (ncells, k)
+            self.neighbor_elevation = \
+                metadata.elevation.values[self.neighbors].astype(float)
 
         # mask
         self.mask = np.zeros_like(self.mx, dtype=bool)
         if config['grid_mask']:
 
-            assert(mask.shape == GridX.shape)
+            x = GridX[0, :] if mask_x is None else mask_x
+            y = GridY[:, 0] if mask_y is None else mask_y
+
+            assert(mask.shape == (len(y), len(x)))
             mask = mask.astype(bool)
 
-            x = GridX[0, :]
-            y = GridY[:, 0]
             for i, v in enumerate(mx):
                 xi = np.argmin(np.abs(x - mx[i]))
                 yi = np.argmin(np.abs(y - my[i]))
@@ -114,62 +114,33 @@ class GRID:
 
     def detrendedInterpolationLocal(self, data, flag=0, grid_method='linear'):
         """
-        Interpolate using a detrended approach
+        Interpolate using a detrended approach with a local elevation trend
+        for each cell, fit to the ``grid_local_n`` nearest cells. The trends
+        of all the cells are fit at once with
+        :func:`smrf.spatial.trend.linear_trend`.
 
         Args:
             data: data to interpolate
             grid_method: scipy.interpolate.griddata interpolation method
         """
 
-        # take the new full_df and fill a data column
-        df = self.full_df.copy()
-        df['data'] = data[df['cell_local']].values
-        df = df.set_index('cell_id')
-        df['fit'] = df.groupby('cell_id').apply(
-            lambda x: np.polyfit(x.elevation, x.data, 1))
-
-        # drop all the duplicates
-        df.reset_index(inplace=True)
-        df.drop_duplicates(subset=['cell_id'], keep='first', inplace=True)
-        df.set_index('cell_id', inplace=True)
-        df[['slope', 'intercept']] = df.fit.apply(pd.Series)
-        # df = df.drop(columns='fit').reset_index()
-
-        # apply trend constraints
-        if flag == 1:
-            df.loc[df['slope'] < 0, ['slope', 'intercept']] = 0
-        elif flag == -1:
-            df.loc[df['slope'] > 0, ['slope', 'intercept']] = 0
+        data = np.asarray(data, dtype=float)
+        elevation = self.metadata.elevation.values.astype(float)
 
-        # get triangulation
-        if self.tri is None:
-            xy = _ndim_coords_from_arrays(
-                (self.metadata.utm_x, self.metadata.utm_y))
-            self.tri = qhull.Delaunay(xy)
+        # fit the elevation trend of each cell to the nearest cells at once
+        slope, intercept = linear_trend(
+            self.neighbor_elevation, data[self.neighbors], flag)
 
         # interpolate the slope/intercept
-        grid_slope = grid_interpolate_deconstructed(
-            self.tri,
-            df.slope.values[:],
-            (self.GridX, self.GridY),
-            method=grid_method)
-
-        grid_intercept = grid_interpolate_deconstructed(
-            self.tri,
-            df.intercept.values[:],
-            (self.GridX, self.GridY),
-            method=grid_method)
+        grid_slope = self.calculateInterpolation(slope, grid_method)
+        grid_intercept = self.calculateInterpolation(intercept, grid_method)
 
         # remove the elevation trend from the HRRR precip
-        el_trend = df.elevation * df.slope + df.intercept
-        dtrend = df.data - el_trend
+        el_trend = elevation * slope + intercept
+        dtrend = data - el_trend
 
         # interpolate the residuals over the DEM
-        idtrend = grid_interpolate_deconstructed(
-            self.tri,
-            dtrend,
-            (self.GridX, self.GridY),
-            method=grid_method)
+        idtrend = self.calculateInterpolation(dtrend, grid_method)
 
         # reinterpolate
         rtrend = idtrend + grid_slope * self.GridZ + grid_intercept
@@ -186,7 +157,8 @@ class GRID:
         """
 
         # get the trend, ensure it's positive
-        pv = np.polyfit(self.mz[self.mask].astype(float), data[self.mask], 1)
+        fit = self.mask & ~np.isnan(data)
+        pv = np.polyfit(self.mz[fit].astype(float), data[fit], 1)
 
         # apply trend constraints
         if flag == 1 and pv[0] < 0:
@@ -194,17 +166,12 @@ class GRID:
         elif (flag == -1 and pv[0] > 0):
             pv = np.array([0, 0])
 
-        self.pv = pv
-
         # detrend the data
         el_trend = self.mz * pv[0] + pv[1]
         dtrend = data - el_trend
 
         # interpolate over the DEM grid
-        idtrend = griddata((self.mx, self.my),
-                           dtrend,
-                           (self.GridX, self.GridY),
-                           method=grid_method)
+        idtrend = self.calculateInterpolation(dtrend, grid_method)
 
         # retrend the data
         rtrend = idtrend + pv[0]*self.GridZ + pv[1]
@@ -213,19 +180,100 @@ class GRID:
 
     def calculateInterpolation(self, data, grid_method='linear'):
         """
-        Interpolate over the grid
+        Interpolate over the grid, same as ``scipy.interpolate.griddata``
+        with the triangulation and weights of the points with data from
+        :func:`interpolationWeights`
 
         Args:
             data: data to interpolate
-            mx: x locations for the points
-            my: y locations for the points
-            X: x locations in grid to interpolate over
-            Y: y locations in grid to interpolate over
+            grid_method: interpolation method, nearest, linear or cubic
+
+        Returns:
+            the interpolated values, NaN outside of the points for the
+            linear and cubic methods
         """
 
-        g = griddata((self.mx, self.my),
-                     data,
-                     (self.GridX, self.GridY),
-                     method=grid_method)
+        data = np.asarray(data, dtype=float)
+        valid = ~np.isnan(data)
+        weights = self.interpolationWeights(valid, grid_method)
+        values = data[valid]
+
+        if grid_method == 'nearest':
+            g = values[weights['index']]
+
+        elif grid_method == 'linear':
+            g = np.einsum('nj,nj->n',
+                          np.take(values, weights['vertices']),
+                          weights['weights'])
+            g[weights['outside']] = np.nan
+
+        elif grid_method == 'cubic':
+            # the gradients depend on the data, reuse the triangulation
+            g = CloughTocher2DInterpolator(weights['tri'], values)(
+                weights['xi'])
+
+        return g.reshape(self.GridX.shape)
+
+    def interpolationWeights(self, valid, grid_method='linear'):
+        """
+        Triangulation and weights of the points with data. Point outages
+        usually last for many time steps so the weights are kept in a least
+        recently used cache by the points with data.
+
+        Args:
+            valid: True for the points with data
+            grid_method: interpolation method, nearest, linear or cubic
+
+        Returns:
+            dict: weights from :func:`calculateWeights`
+        """
+
+        return self.weight_cache.get(
+            (grid_method, mask_key(valid)),
+            self.calculateWeights, valid, grid_method)
+
+    def calculateWeights(self, valid, grid_method='linear'):
+        """
+        Find the triangulation and weights of the points with data for the
+        grid. This follows :func:`smrf.utils.utils.interp_weights`.
+
+        * nearest: ``index`` of the nearest point of each grid cell
+        * linear: ``vertices`` of the simplex containing each grid cell, the
+          barycentric ``weights`` of the vertices and the grid cells
+          ``outside`` of the triangulation
+        * cubic: the Delaunay triangulation ``tri`` and the grid
+          coordinates ``xi``
+
+        Args:
+            valid: True for the points with data
+            grid_method: interpolation method, nearest, linear or cubic
+
+        Returns:
+            dict: weights for the interpolation method
+        """
+
+        xy = np.column_stack((self.mx[valid], self.my[valid])).astype(float)
+        xi = np.column_stack(
+            (self.GridX.ravel(), self.GridY.ravel())).astype(float)
+
+        if grid_method == 'nearest':
+            index = cKDTree(xy).query(xi)[1]
+            return {'index': index}
+
+        tri = qhull.Delaunay(xy)
+
+        if grid_method == 'cubic':
+            return {'tri': tri, 'xi': xi}
+
+        simplex = tri.find_simplex(xi)
+        vertices = np.take(tri.simplices, simplex, axis=0)
+        temp = np.take(tri.transform, simplex, axis=0)
+        delta = xi - temp[:, 2]
+        bary = np.einsum('njk,nk->nj', temp[:, :2, :], delta)
+        weights = np.hstack((bary, 1 - bary.sum(axis=1, keepdims=True)))
 
-        return g
+        return {
+            'vertices': vertices,
+            'weights': weights,
+            'outside': simplex == -1
+        }
@@ -1,4 +1,8 @@
 import numpy as np
+from scipy.spatial import cKDTree
+
+from smrf.spatial.trend import linear_trend
+from smrf.utils.cache import LRUCache, mask_key
 
 
 class IDW:
@@ -8,11 +12,18 @@ class IDW:
 
     * Standard IDW
     * Detrended IDW
+    * IDW of the nearest neighbors
+
+    Setting ``neighbors`` or ``search_radius`` only keeps the nearest
+    stations of each grid cell, found with a KD-tree, instead of the
+    distances and weights to every station. Grid cells without an available
+    station within the neighbors use the nearest available stations.
 
     '''
 
     def __init__(self, mx, my, GridX, GridY, mz=None, GridZ=None,
-                 power=2, zeroVal=-1):
+                 power=2, zeroVal=-1, dtype=np.float64, neighbors=None,
+                 search_radius=None, cache_size=8):
         """
         Args:
             mx: x locations for the points
@@ -23,6 +34,13 @@ class IDW:
             GridZ: Elevation values for the points to interpolate over for
                    trended data
             power: power of the inverse distance weighting
+            dtype: float type of the distances and weights
+            neighbors: number of nearest stations to weight for each grid
+                cell, defaults to all the stations
+            search_radius: only weight the stations within the distance of
+                the grid cell
+            cache_size: number of normalized weights to keep for the sets
+                of stations with data
         """
 
         # measurement point locations
@@ -43,12 +61,159 @@ class IDW:
         # IDW parameters
         self.power = power
         self.zeroVal = zeroVal
+        self.dtype = dtype
 
-        # calculate the distances
-        self.calculateDistances()
+        self.neighbors = neighbors
+        self.search_radius = search_radius
+        self.nearest = neighbors is not None or search_radius is not None
 
-        # calculate the weights
-        self.calculateWeights()
+        # normalized weights by the stations with data
+        self.weight_cache = LRUCache(cache_size)
+
+        if self.nearest:
+            self.calculateNeighbors()
+
+        else:
+            # calculate the distances, the weights are calculated for the
+            # stations with data by stationWeights
+            self.calculateDistances()
+
+    def calculateNeighbors(self):
+        '''
+        Find the nearest stations of each grid cell and the weights of the
+        stations. Stations outside of the search radius have an index of
+        ``npoints`` and a weight of zero.
+        '''
+
+        self.tree = cKDTree(np.column_stack((self.mx, self.my)))
+
+        k = min(self.neighbors or self.npoints, self.npoints)
+        radius = self.search_radius or np.inf
+
+        distance, index = self.tree.query(
+            np.column_stack((self.GridX.ravel(), self.GridY.ravel())),
+            k=k, distance_upper_bound=radius)
+
+        distance = distance.reshape(-1, k)
+        self.neighbor_index = index.reshape(-1, k)
+
+        # a station on a grid cell gets the weight of the closest station
+        found = np.isfinite(distance)
+        if np.any(distance[found] > 0):
+            distance[distance == 0] = np.min(distance[distance > 0])
+
+        self.neighbor_weights = np.zeros(distance.shape, dtype=self.dtype)
+        self.neighbor_weights[found] = 1.0 / np.power(
+            distance[found], self.power)
+
+    def normalizedWeights(self, nan_val):
+        '''
+        Weights normalized for the stations with data. Station outages
+        usually last for many time steps so the weights are kept in a least
+        recently used cache by the stations with data.
+
+        Args:
+            nan_val: True for the stations with data
+
+        Returns:
+            the weights of shape (ngrid, nsta with data) or, for the nearest
+            stations, a tuple of the station index and weights from
+            :func:`neighborWeights`
+        '''
+
+        if self.nearest:
+            function = self.neighborWeights
+        else:
+            function = self.stationWeights
+
+        return self.weight_cache.get(mask_key(nan_val), function, nan_val)
+
+    def stationWeights(self, nan_val):
+        '''
+        Normalized weights of the stations with data
+
+        Args:
+            nan_val: True for the stations with data
+
+        Returns:
+            weights of shape (ngrid, nsta with data)
+        '''
+
+        w = self.calculateWeights(
+            self.distance[:, :, nan_val].reshape(-1, np.sum(nan_val)))
+
+        return np.ascontiguousarray(
+            w / np.sum(w, 1, keepdims=True), dtype=self.dtype)
+
+    def neighborWeights(self, nan_val):
+        '''
+        Normalized weights of the nearest stations for the available
+        stations. Grid cells without an available station use the weights of
+        the nearest available stations.
+
+        Args:
+            nan_val: True for the stations with data
+
+        Returns:
+            tuple: station index and normalized weights for each grid cell,
+                the index of a missing station is ``npoints``
+        '''
+
+        index = self.neighbor_index
+        available = np.append(nan_val, False)[index]
+        w = np.where(available, self.neighbor_weights, 0)
+        total = np.sum(w, 1)
+
+        missing = total == 0
+        if np.any(missing):
+            stations = np.flatnonzero(nan_val)
+            k = min(index.shape[1], len(stations))
+            distance, nearest = cKDTree(
+                self.tree.data[stations]).query(
+                    np.column_stack((self.GridX.ravel()[missing],
+                                     self.GridY.ravel()[missing])), k=k)
+            distance = np.maximum(distance.reshape(-1, k), np.finfo(float).eps)
+
+            index = index.copy()
+            index[missing] = self.npoints
+            index[missing, :k] = stations[nearest.reshape(-1, k)]
+            w[missing] = 0
+            w[missing, :k] = 1.0 / np.power(distance, self.power)
+            total = np.sum(w, 1)
+
+        return index, (w / total[:, np.newaxis]).astype(self.dtype)
+
+    def calculateNearestIDW(self, data):
+        '''
+        Calculate the IDW of the nearest stations for one or more time steps
+
+        Args:
+            data: station data of shape (npoints,) or (T, npoints)
+
+        Returns:
+            v: distributed data of shape (ny, nx) or (T, ny, nx)
+        '''
+
+        single = np.ndim(data) == 1
+        data = np.atleast_2d(data)
+        shape = self.GridX.shape
+        v = np.empty((data.shape[0], shape[0] * shape[1]), dtype=self.dtype)
+
+        patterns, pindex = np.unique(
+            ~np.isnan(data), axis=0, return_inverse=True)
+        for p, nan_val in enumerate(patterns):
+            steps = pindex.ravel() == p
+            index, w = self.normalizedWeights(nan_val)
+
+            # missing stations have zero weight
+            values = np.zeros((np.sum(steps), self.npoints + 1),
+                              dtype=self.dtype)
+            values[:, :-1][:, nan_val] = data[steps][:, nan_val]
+            v[steps] = np.einsum('gk,tgk->tg', w, values[:, index])
+
+        v = v.reshape((data.shape[0],) + shape)
+
+        return v[0] if single else v
 
     def calculateDistances(self):
         '''
@@ -59,7 +224,7 @@ class IDW:
         # preallocate
         self.distance = np.empty((self.GridX.shape[0],
                                   self.GridX.shape[1],
-                                  self.npoints))
+                                  self.npoints), dtype=self.dtype)
 
         for i in range(self.npoints):
             self.distance[:, :, i] = np.sqrt((self.GridX - self.mx[i])**2 +
@@ -68,16 +233,21 @@ class IDW:
         # remove any zero values
         self.distance[np.where(self.distance == 0)] = np.min(self.distance)
 
-    def calculateWeights(self):
+    def calculateWeights(self, distance):
         '''
-        Calculate the weights for
+        Calculate the weights for the distances. Only the normalized weights
+        of the stations with data are kept, not the weights of every station.
+
+        Args:
+            distance: distances to the stations
+
+        Returns:
+            weights of the stations
         '''
 
         # calculate the weights
-        self.weights = 1.0/(np.power(self.distance, self.power))
-
-        # if there are Inf values, set to 1 as the distance was 0
-        # self.weights[np.isinf(self.weights)] = 100
+        return (1.0/(np.power(distance, self.power))).astype(
+            self.dtype, copy=False)
 
     def calculateIDW(self, data, local=False):
         '''
@@ -85,13 +255,67 @@ class IDW:
         Inputs:
         data    - is the same size at mx,my
         '''
+        if self.nearest:
+            return self.calculateNearestIDW(data)
+
         nan_val = ~np.isnan(data)
-        w = self.weights[:, :, nan_val]
-        data = data[nan_val]
+        w = self.normalizedWeights(nan_val)
 
-        v = np.nansum(w * data, 2) / np.sum(w, 2)
+        v = w @ data[nan_val].astype(self.dtype)
 
-        return v
+        return v.reshape(self.GridX.shape)
+
+    def calculateIDWBatch(self, data):
+        '''
+        Calculate the IDW for a block of time steps. The time steps with the
+        same stations available share the normalized weights and are
+        distributed with a single matrix product.
+
+        Args:
+            data: station data of shape (T, npoints)
+
+        Returns:
+            v: distributed data of shape (T, ny, nx)
+        '''
+
+        if self.nearest:
+            return self.calculateNearestIDW(np.atleast_2d(data))
+
+        data = np.atleast_2d(data)
+        shape = self.GridX.shape
+        v = np.empty((data.shape[0], shape[0] * shape[1]), dtype=self.dtype)
+
+        patterns, index = np.unique(
+            ~np.isnan(data), axis=0, return_inverse=True)
+        for p, nan_val in enumerate(patterns):
+            steps = index.ravel() == p
+            w = self.normalizedWeights(nan_val)
+            v[steps] = (w @ data[steps][:, nan_val].T.astype(self.dtype)).T
+
+        return v.reshape((data.shape[0],) + shape)
+
+    def detrendedIDWBatch(self, data, flag=0):
+        '''
+        Calculate the detrended IDW for a block of time steps. The trend of
+        every time step is fit with
+        :func:`~smrf.spatial.trend.linear_trend`.
+
+        Args:
+            data: station data of shape (T, npoints)
+            flag: 1 for positive, -1 for negative, 0 for any trend imposed
+
+        Returns:
+            v: distributed data of shape (T, ny, nx)
+        '''
+
+        data = np.atleast_2d(data)
+        slope, intercept = linear_trend(self.mz, data, flag)
+
+        dtrend = data - (np.outer(slope, self.mz) + intercept[:, np.newaxis])
+        v = self.calculateIDWBatch(dtrend)
+
+        return v + (slope[:, np.newaxis, np.newaxis] * self.GridZ +
+                    intercept[:, np.newaxis, np.newaxis])
 
     def detrendedIDW(self, data, flag=0, zeros=None, local=False):
         '''
@@ -100,10 +324,12 @@ class IDW:
         data    - is the same size at mx,my
         '''
 
-        self.detrendData(data, flag, zeros)
-        v = self.calculateIDW(self.dtrend, local)
+        # the trend is not kept so the instance can be shared between
+        # distribute modules and threads
+        pv, dtrend = self._detrend(data, flag, zeros)
+        v = self.calculateIDW(dtrend, local)
 #         vtmp = v.copy()
-        v = self.retrendData(v)
+        v = self._retrend(v, pv)
 
         if zeros is not None:
             v[v < 0] = 0
@@ -114,6 +340,22 @@ class IDW:
         Detrend the data in val using the heights zmeas
         data    - is the same size at mx,my
         flag     - 1 for positive, -1 for negative, 0 for any trend imposed
+
+        Returns:
+            data minus the elevation trend
+        '''
+
+        self.pv, dtrend = self._detrend(data, flag, zeros)
+
+        return dtrend
+
+    def _detrend(self, data, flag=0, zeros=None):
+        '''
+        Same as :func:`detrendData` returning the trend instead of keeping
+        it
+
+        Returns:
+            tuple: the trend and the detrended data
         '''
 
         # calculate the trend on any real data
@@ -126,19 +368,25 @@ class IDW:
         elif (flag == -1 and pv[0] > 0):
             pv = np.array([0, 0])
 
-        self.pv = pv
-
         # detrend the data
         el_trend = self.mz * pv[0] + pv[1]
 
         if zeros is not None:
             data[zeros] = self.zeroVal
-        self.dtrend = data - el_trend
+
+        return pv, data - el_trend
 
     def retrendData(self, idw):
         '''
-        Retrend the IDW values
+        Retrend the IDW values with the trend from :func:`detrendData`
+        '''
+
+        return self._retrend(idw, self.pv)
+
+    def _retrend(self, idw, pv):
+        '''
+        Retrend the IDW values with the trend from :func:`_detrend`
         '''
 
         # retrend the data
-        return idw + self.pv[0]*self.GridZ + self.pv[1]
+        return idw + pv[0]*self.GridZ + pv[1]
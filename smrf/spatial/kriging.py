@@ -1,14 +1,31 @@
 import numpy as np
 import pandas as pd
+from pykrige.core import _adjust_for_anisotropy
 from pykrige.ok import OrdinaryKriging
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import cdist
+
+from smrf.utils.cache import LRUCache, mask_key
 
 
 class KRIGE:
     '''
     Kriging class based on the pykrige package
+
+    The variogram is fit to the data of every time step with
+    ``pykrige.ok.OrdinaryKriging``. Setting ``krig_calibration_steps``
+    freezes the variogram to the median of the parameters fit over the
+    first time steps. The kriging weights then only depend on the stations
+    with data and are solved once and kept in a least recently used cache.
+    Setting ``krig_n_closest_points`` only uses the nearest stations of each
+    grid cell in the kriging system (moving window).
     '''
 
-    def __init__(self, mx, my, mz, GridX, GridY, GridZ, config):
+    # number of grid cells to solve the moving window systems for at once
+    CHUNK_SIZE = 10000
+
+    def __init__(self, mx, my, mz, GridX, GridY, GridZ, config,
+                 cache_size=8):
         """
         Args:
             mx: x locations for the points
@@ -16,6 +33,8 @@ class KRIGE:
             GridX: x locations in grid to interpolate over
             GridY: y locations in grid to interpolate over
             power: power of the inverse distance weighting
+            cache_size: number of kriging weights to keep for the sets of
+                stations with data once the variogram is frozen
         """
 
         # Measurement point locations
@@ -51,9 +70,22 @@ class KRIGE:
         # not in the pypi release of PyKrige
         self.coordinates_type = self.config['krig_coordinates_type']
 
-        # pykrige execution
-        self.backend = 'vectorized'
-        self.n_closest_points = None
+        # moving window of the nearest stations, all stations if None
+        self.n_closest_points = self.config.get('krig_n_closest_points')
+        self.variance = self.config.get('krig_variance', True)
+
+        # variogram parameters fit during the calibration, the variogram is
+        # fit every time step if there are no calibration steps
+        self.calibration_steps = self.config.get('krig_calibration_steps')
+        self.calibration = []
+
+        # kriging weights by the stations with data, frozen variogram only
+        self.weight_cache = LRUCache(cache_size)
+
+    @property
+    def frozen(self):
+        """True once the variogram parameters are fixed"""
+        return self.variogram_parameters is not None
 
     def calculate(self, data):
         """
@@ -68,8 +100,8 @@ class KRIGE:
                If style was specified as 'masked', zvalues will
                be a numpy masked array.
             sigmasq: Variance at specified grid points or
-                     at the specified set of points. If style was specified as
-                     'masked', sigmasq will be a numpy masked array.
+                     at the specified set of points. None if
+                     ``krig_variance`` is False.
         """
 
         nan_val = pd.isnull(data)
@@ -79,25 +111,20 @@ class KRIGE:
         else:
             d = data.copy()
 
-        OK = OrdinaryKriging(self.mx[~nan_val],
-                             self.my[~nan_val],
-                             d[~nan_val],
-                             variogram_model=self.variogram_model,
-                             variogram_parameters=self.variogram_parameters,
-                             variogram_function=self.variogram_function,
-                             nlags=self.nlags,
-                             weight=self.weight,
-                             anisotropy_scaling=self.anisotropy_scaling,
-                             anisotropy_angle=self.anisotropy_angle,
-                             verbose=self.verbose,
-                             enable_plotting=self.enable_plotting,
-                             enable_statistics=self.enable_statistics)
-
-        v, ss1 = OK.execute('grid',
-                            self.GridX[0, :],
-                            self.GridY[:, 0],
-                            backend=self.backend,
-                            n_closest_points=self.n_closest_points)
+        if self.frozen:
+            weights = self.weight_cache.get(
+                mask_key(nan_val), self.krigingWeights, nan_val)
+
+        else:
+            OK = self.ordinaryKriging(nan_val, d[~nan_val])
+            weights = self.krigingWeights(nan_val, OK)
+            self.calibrate(OK)
+
+        v = self.applyWeights(weights, d[~nan_val])
+
+        ss1 = None
+        if self.variance:
+            ss1 = weights['variance'].reshape(self.GridX.shape)
 
         if self.config['detrend']:
             # retrend the residuals
@@ -105,6 +132,144 @@ class KRIGE:
 
         return v, ss1
 
+    def ordinaryKriging(self, nan_val, data):
+        """
+        Ordinary kriging model of the stations with data, the variogram is
+        fit to the data unless it is frozen
+
+        Args:
+            nan_val: True for the stations without data
+            data: data of the stations with data, only used to fit the
+                variogram
+
+        Returns:
+            pykrige.ok.OrdinaryKriging instance
+        """
+
+        return OrdinaryKriging(self.mx[~nan_val],
+                               self.my[~nan_val],
+                               data,
+                               variogram_model=self.variogram_model,
+                               variogram_parameters=self.variogram_parameters,
+                               variogram_function=self.variogram_function,
+                               nlags=self.nlags,
+                               weight=self.weight,
+                               anisotropy_scaling=self.anisotropy_scaling,
+                               anisotropy_angle=self.anisotropy_angle,
+                               verbose=self.verbose,
+                               enable_plotting=self.enable_plotting,
+                               enable_statistics=self.enable_statistics)
+
+    def calibrate(self, OK):
+        """
+        Keep the variogram parameters fit for the time step and freeze the
+        variogram to the median of the parameters after
+        ``krig_calibration_steps`` time steps
+
+        Args:
+            OK: pykrige.ok.OrdinaryKriging fit to the time step
+        """
+
+        if not self.calibration_steps:
+            return
+
+        self.calibration.append(OK.variogram_model_parameters)
+
+        if len(self.calibration) >= self.calibration_steps:
+            self.variogram_parameters = list(
+                np.median(np.array(self.calibration), axis=0))
+
+    def krigingWeights(self, nan_val, OK=None):
+        """
+        Solve the kriging system of each grid cell for the stations with
+        data. Same as ``OrdinaryKriging.execute`` with the vectorized or
+        moving window backend except the weights are returned instead of
+        being applied to the data.
+
+        Args:
+            nan_val: True for the stations without data
+            OK: pykrige.ok.OrdinaryKriging of the stations with data,
+                created with the frozen variogram if not given
+
+        Returns:
+            dict: ``index`` of the stations, None when all the stations
+            are used, the ``weights`` of the stations for each grid cell
+            and the kriging ``variance``
+        """
+
+        if OK is None:
+            OK = self.ordinaryKriging(
+                nan_val, np.zeros(np.sum(~nan_val)))
+
+        n = OK.X_ADJUSTED.shape[0]
+        a = OK._get_kriging_matrix(n)
+
+        xy_data = np.column_stack((OK.X_ADJUSTED, OK.Y_ADJUSTED))
+        xy_grid = _adjust_for_anisotropy(
+            np.column_stack((self.GridX.ravel(), self.GridY.ravel())),
+            [OK.XCENTER, OK.YCENTER],
+            [OK.anisotropy_scaling],
+            [OK.anisotropy_angle])
+
+        def rhs(bd):
+            # right hand side of the kriging system for the distances
+            b = -OK.variogram_function(OK.variogram_model_parameters, bd)
+            if OK.exact_values:
+                b[np.absolute(bd) <= OK.eps] = 0.0
+            return np.concatenate((b, np.ones(bd.shape[:-1] + (1,))), -1)
+
+        if self.n_closest_points is None or self.n_closest_points >= n:
+            # same system for all the grid cells
+            b = rhs(cdist(xy_grid, xy_data, 'euclidean'))
+            x = np.linalg.solve(a, b.T).T
+            return {
+                'index': None,
+                'weights': x[:, :n],
+                'variance': np.sum(x * -b, axis=1)
+            }
+
+        # moving window of the nearest stations
+        k = self.n_closest_points
+        bd, index = cKDTree(xy_data).query(xy_grid, k=k)
+        weights = np.zeros((self.ngrid, k))
+        variance = np.zeros(self.ngrid)
+
+        for s in range(0, self.ngrid, self.CHUNK_SIZE):
+            c = slice(s, s + self.CHUNK_SIZE)
+            sel = np.concatenate(
+                (index[c], np.full((len(index[c]), 1), n)), axis=1)
+            b = rhs(bd[c])
+            x = np.linalg.solve(
+                a[sel[:, :, np.newaxis], sel[:, np.newaxis, :]],
+                b[..., np.newaxis])[..., 0]
+            weights[c] = x[:, :k]
+            variance[c] = np.sum(x * -b, axis=1)
+
+        return {
+            'index': index,
+            'weights': weights,
+            'variance': variance
+        }
+
+    def applyWeights(self, weights, data):
+        """
+        Apply the kriging weights to the data of the stations with data
+
+        Args:
+            weights: weights from :func:`krigingWeights`
+            data: data of the stations with data
+
+        Returns:
+            kriged values on the grid
+        """
+
+        if weights['index'] is None:
+            v = np.dot(weights['weights'], data)
+        else:
+            v = np.sum(weights['weights'] * data[weights['index']], axis=1)
+
+        return v.reshape(self.GridX.shape)
+
     def detrendData(self, data, flag=0, zeros=None):
         '''
         Detrend the data in val using the heights zmeas
@@ -0,0 +1,52 @@
+import numpy as np
+
+
+def linear_trend(mz, data, flag=0):
+    """
+    Linear trend of the data with elevation for a block of time steps. Each
+    time step is fit in closed form using the stations that are not NaN,
+    giving the same slope and intercept as ``np.polyfit(mz, data, 1)`` for
+    every time step without looping over the time steps.
+
+    Args:
+        mz: station elevations, length nsta or of shape (T, nsta) when the
+            stations differ between rows
+        data: station data of shape (T, nsta), NaN for missing stations
+        flag: 1 for positive, -1 for negative, 0 for any trend imposed. A
+            trend that does not follow the flag is set to zero.
+
+    Returns:
+        tuple: slope and intercept, both of length T
+
+    Raises:
+        ValueError: if a time step has less than two stations
+    """
+
+    data = np.atleast_2d(data)
+    valid = ~np.isnan(data)
+    n = valid.sum(axis=1)
+
+    if np.any(n < 2):
+        raise ValueError('A linear trend requires at least two stations')
+
+    # center on the mean elevation of the stations in each time step
+    z_mean = np.where(valid, mz, 0).sum(axis=1) / n
+    d_mean = np.where(valid, data, 0).sum(axis=1) / n
+    z = np.where(valid, mz - z_mean[:, np.newaxis], 0)
+    d = np.where(valid, data - d_mean[:, np.newaxis], 0)
+
+    slope = (z * d).sum(axis=1) / (z * z).sum(axis=1)
+    intercept = d_mean - slope * z_mean
+
+    # apply trend constraints
+    if flag == 1:
+        remove = slope < 0
+    elif flag == -1:
+        remove = slope > 0
+    else:
+        remove = np.zeros_like(slope, dtype=bool)
+
+    slope[remove] = 0
+    intercept[remove] = 0
+
+    return slope, intercept
@@ -1,4 +1,9 @@
+import os
+import pickle
+import shutil
+import tempfile
 import unittest
+from unittest import mock
 
 import netCDF4 as nc
 import numpy as np
@@ -63,3 +68,315 @@ class TestLoadTopo(unittest.TestCase):
 
         for at in important:
             self.assertTrue(hasattr(self.topo, at))
+
+    def test_lazy_images(self):
+        '''
+        Test the sky view factor is only calculated when used
+        '''
+        self.assertNotIn('sky_view_factor', self.topo.__dict__)
+        self.assertNotIn('aspect', self.topo.__dict__)
+
+        self.topo.terrain_config_factor
+        for v in self.topo.GRADIENT_IMAGES + self.topo.VIEWF_IMAGES:
+            self.assertIn(v, self.topo.__dict__)
+
+        with self.assertRaises(AttributeError):
+            self.topo.not_an_image
+
+    def test_lazy_tile(self):
+        '''
+        Test a tile and a compressed topo keep the images lazy and
+        calculate them over the domain when used
+        '''
+        rows = slice(2, 10)
+        cols = slice(5, 12)
+
+        with mock.patch.object(Topo, 'calculate_viewf') as viewf, \
+                mock.patch.object(Topo, 'calculate_gradient') as gradient:
+            tile = self.topo.tile(rows, cols)
+            compressed = self.topo.compress()
+            self.topo.shared_images
+            tile.shared_images
+            compressed.shared_images
+
+        viewf.assert_not_called()
+        gradient.assert_not_called()
+        for topo in [self.topo, tile, compressed]:
+            self.assertNotIn('sky_view_factor', topo.__dict__)
+            self.assertNotIn('aspect', topo.__dict__)
+            self.assertNotIn('sky_view_factor', topo.shared_images)
+
+        # calculated over the domain and not the window or the cells
+        mask = self.topo.mask.astype(bool)
+        np.testing.assert_equal(
+            tile.sky_view_factor, self.topo.sky_view_factor[rows, cols])
+        np.testing.assert_equal(
+            compressed.slope_radians[0], self.topo.slope_radians[mask])
+
+    def test_lazy_tile_shared(self):
+        '''
+        Test a shared compressed topo calculates the lazy images over the
+        shared grid
+        '''
+        topo = self.topo.compress()
+        topo.share()
+
+        try:
+            attached = pickle.loads(pickle.dumps(topo))
+            self.assertNotIn('aspect', attached.__dict__)
+            np.testing.assert_equal(
+                attached.aspect[0],
+                self.topo.aspect[self.topo.mask.astype(bool)])
+
+        finally:
+            topo.unshare()
+
+        self.assertIsNone(self.topo.shared_location)
+
+    def test_derived_cache(self):
+        '''
+        Test the derived images are loaded from the cache by the next run
+        '''
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        config = dict(self.topo.topoConfig, derived_cache=location)
+
+        topo = Topo(config)
+        svf = topo.sky_view_factor
+        self.assertEqual(len(os.listdir(location)), 2)
+        np.testing.assert_equal(svf, self.topo.sky_view_factor)
+
+        with mock.patch.object(Topo, 'calculate_viewf') as viewf, \
+                mock.patch.object(Topo, 'calculate_gradient') as gradient:
+            topo = Topo(config)
+            for v in topo.DERIVED_IMAGES:
+                np.testing.assert_equal(
+                    getattr(topo, v), getattr(self.topo, v))
+
+        viewf.assert_not_called()
+        gradient.assert_not_called()
+
+        # a different number of angles is calculated
+        config['sky_view_factor_angles'] = 16
+        Topo(config).sky_view_factor
+        self.assertEqual(len(os.listdir(location)), 3)
+
+    def test_derived_cache_dtype(self):
+        '''
+        Test the derived images are stored in the topo float type with the
+        aspect in double precision
+        '''
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        config = dict(self.topo.topoConfig, derived_cache=location)
+
+        topo = Topo(config, dtype=np.float32)
+        topo.sky_view_factor
+
+        dtypes = {}
+        for path in os.listdir(location):
+            with nc.Dataset(os.path.join(location, path)) as f:
+                dtypes.update(
+                    {v: f.variables[v].dtype for v in f.variables})
+
+        self.assertEqual(dtypes, {
+            'slope_radians': np.float32,
+            'sin_slope': np.float32,
+            'aspect': np.float64,
+            'sky_view_factor': np.float32,
+            'terrain_config_factor': np.float32
+        })
+
+        # the next run loads the same images
+        cached = Topo(config, dtype=np.float32)
+        for v in topo.GRADIENT_IMAGES + topo.VIEWF_IMAGES:
+            self.assertEqual(getattr(cached, v).dtype, getattr(topo, v).dtype)
+            np.testing.assert_equal(getattr(cached, v), getattr(topo, v))
+
+    def test_horizon_library(self):
+        '''
+        Test the horizon tangents interpolated from the horizon library
+        '''
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        config = dict(self.topo.topoConfig, horizon_increment=5,
+                      derived_cache=location)
+
+        topo = Topo(config)
+        library = topo.horizon_library()
+        self.assertEqual(library.shape, (73,) + self.topo.dem.shape)
+        self.assertEqual(library.dtype, np.int16)
+
+        # exact at the library azimuths up to the int16 scaling
+        for azimuth in [-180, -45, 0, 45, 180]:
+            np.testing.assert_allclose(
+                np.arctan(topo.horizon(azimuth)),
+                self.topo.horizon_cosines(azimuth),
+                rtol=0, atol=0.5 / topo.HORIZON_SCALE)
+
+        # cosines are linear between the library azimuths
+        np.testing.assert_allclose(
+            np.arctan(topo.horizon(47)),
+            0.6 * np.arctan(topo.horizon(45)) +
+            0.4 * np.arctan(topo.horizon(50)))
+
+        # the next run maps the stored library
+        topo = Topo(config)
+        with mock.patch.object(Topo, 'calculate_horizon') as horizon:
+            np.testing.assert_equal(topo.horizon_library(), library)
+        horizon.assert_not_called()
+
+    def test_horizon_library_cliff(self):
+        '''
+        Test the horizons of a cliff are not wrapped by the int16 scaling
+        '''
+        config = dict(self.topo.topoConfig, horizon_increment=5)
+        topo = Topo(config)
+
+        # a wall ten cells high along the middle row of a flat DEM
+        dem = np.zeros_like(topo.dem)
+        dem[topo.ny // 2] = 10 * abs(topo.dx)
+        topo.dem = dem
+
+        library = topo.horizon_library()
+        self.assertTrue(np.all(library >= 0))
+
+        for azimuth in [-180, -90, 0, 90]:
+            np.testing.assert_allclose(
+                topo.horizon(azimuth), topo.calculate_horizon(azimuth),
+                rtol=0, atol=2 / topo.HORIZON_SCALE)
+
+        # the cells next to the wall keep the steepest horizons
+        np.testing.assert_allclose(
+            np.max(topo.horizon(0)), np.max(topo.calculate_horizon(0)),
+            rtol=1e-4)
+
+    def test_tile(self):
+        '''
+        Test a tile of the topo is a window of the full domain
+        '''
+        rows = slice(2, 10)
+        cols = slice(5, 12)
+        tile = self.topo.tile(rows, cols)
+
+        self.assertEqual(tile.ny, 8)
+        self.assertEqual(tile.nx, 7)
+        self.assertEqual(tile.row_offset, 2)
+        self.assertEqual(tile.col_offset, 5)
+
+        np.testing.assert_equal(tile.dem, self.topo.dem[rows, cols])
+        np.testing.assert_equal(
+            tile.sky_view_factor, self.topo.sky_view_factor[rows, cols])
+        np.testing.assert_equal(tile.x, self.topo.x[cols])
+        np.testing.assert_equal(tile.y, self.topo.y[rows])
+
+        # the full domain is kept for locating stations
+        np.testing.assert_equal(tile.domain_x, self.topo.x)
+        np.testing.assert_equal(tile.domain_y, self.topo.y)
+
+    def test_tile_shared(self):
+        '''
+        Test a tile of an attached topo is a view of the shared images
+        '''
+        self.topo.share()
+
+        try:
+            topo = pickle.loads(pickle.dumps(self.topo))
+            tile = topo.tile(slice(2, 10), slice(5, 12))
+
+            self.assertTrue(np.shares_memory(tile.dem, topo.dem))
+            self.assertFalse(tile.dem.flags.writeable)
+
+        finally:
+            self.topo.unshare()
+
+    def test_share(self):
+        '''
+        Test a shared topo is pickled without the images and attaches to
+        read only images
+        '''
+        location = self.topo.share()
+
+        try:
+            self.assertTrue(os.path.isdir(location))
+
+            data = pickle.dumps(self.topo)
+            self.assertLess(len(data), self.topo.dem.nbytes)
+
+            topo = pickle.loads(data)
+            for v in self.topo.shared_images:
+                np.testing.assert_equal(
+                    getattr(topo, v), getattr(self.topo, v))
+
+            self.assertFalse(topo.dem.flags.writeable)
+            self.assertEqual(topo.ny, self.topo.ny)
+
+        finally:
+            self.topo.unshare()
+
+        self.assertFalse(os.path.exists(location))
+        self.assertIsNone(self.topo.shared_location)
+
+    def test_compress(self):
+        '''
+        Test a compressed topo only has the cells in the mask
+        '''
+        topo = self.topo.compress()
+        mask = self.topo.mask.astype(bool)
+
+        self.assertEqual(topo.ny, 1)
+        self.assertEqual(topo.nx, np.sum(mask))
+        self.assertTrue(topo.dem.flags.c_contiguous)
+        np.testing.assert_equal(topo.dem[0], self.topo.dem[mask])
+        np.testing.assert_equal(topo.aspect[0], self.topo.aspect[mask])
+        np.testing.assert_equal(topo.x, self.topo.x)
+
+        # expanding the cells back to the grid
+        np.testing.assert_equal(
+            topo.expand(topo.dem), self.topo.dem * mask)
+        stack = np.stack([self.topo.dem, 2 * self.topo.dem])
+        np.testing.assert_equal(topo.gather(stack)[:, 0], stack[:, mask])
+        np.testing.assert_equal(
+            topo.expand(topo.gather(stack), np.nan)[:, mask], stack[:, mask])
+
+        # horizon of the cells over the grid
+        np.testing.assert_equal(
+            topo.horizon(45), self.topo.horizon(45)[mask][np.newaxis])
+
+    def test_compress_pixel_index(self):
+        '''
+        Test the domain pixels are located in a compressed topo
+        '''
+        topo = self.topo.compress()
+        mask = self.topo.mask.astype(bool)
+
+        yi, xi = np.nonzero(mask)
+        yi = np.concatenate((yi[[0, 10, -1]], np.nonzero(~mask)[0][:1]))
+        xi = np.concatenate((xi[[0, 10, -1]], np.nonzero(~mask)[1][:1]))
+
+        index, in_topo = topo.pixel_index(yi, xi)
+        np.testing.assert_equal(in_topo, [True, True, True, False])
+        np.testing.assert_equal(
+            topo.dem[index][in_topo], self.topo.dem[yi, xi][in_topo])
+
+        # same pixels in a grid topo
+        index, in_topo = self.topo.pixel_index(yi, xi)
+        self.assertTrue(np.all(in_topo))
+        np.testing.assert_equal(self.topo.dem[index], self.topo.dem[yi, xi])
+
+    def test_compress_shared(self):
+        '''
+        Test a shared compressed topo keeps the cells and grid
+        '''
+        topo = self.topo.compress()
+        topo.share()
+
+        try:
+            attached = pickle.loads(pickle.dumps(topo))
+            np.testing.assert_equal(attached.cells, topo.cells)
+            np.testing.assert_equal(attached.dem, topo.dem)
+            np.testing.assert_equal(
+                attached.expand(attached.dem), topo.expand(topo.dem))
+
+        finally:
+            topo.unshare()
@@ -0,0 +1,138 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+from topocalc.shade import shade
+
+from smrf.data import Topo
+from smrf.envphys.albedo import albedo
+from smrf.envphys.constants import IR_WAVELENGTHS, VISIBLE_WAVELENGTHS
+from smrf.envphys.solar import toporad
+from smrf.envphys.solar.clear_sky import ClearSkyLUT
+from smrf.envphys.sunang import sunang
+from smrf.tests.smrf_test_case_lakes import SMRFTestCaseLakes
+
+
+class TestClearSkyLUT(SMRFTestCaseLakes):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        topo_config = {
+            'filename': os.path.join(cls.basin_dir, 'topo/topo.nc'),
+            'northern_hemisphere': True,
+            'gradient_method': 'gradient_d8',
+            'sky_view_factor_angles': 72
+        }
+        cls.topo = Topo(topo_config)
+
+        # a node of the table, 40 days and 20 hours into the year
+        date_time = pd.to_datetime('2/10/2001 20:00')
+        cls.date_time = date_time.tz_localize('UTC')
+
+        cls.cosz, cls.azimuth, rad_vec = sunang(
+            cls.date_time,
+            cls.topo.basin_lat,
+            cls.topo.basin_long)
+
+        cls.illum_ang = shade(
+            cls.topo.sin_slope,
+            cls.topo.aspect,
+            cls.azimuth,
+            cls.cosz)
+
+        cls.albedo_vis, cls.albedo_ir = albedo(
+            20 * np.ones_like(cls.topo.dem), cls.illum_ang, 500, 2000)
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+
+    def stoporad_bands(self, lut, date_time=None):
+        if date_time is None:
+            date_time = self.date_time
+            cosz, azimuth, illum_ang = self.cosz, self.azimuth, self.illum_ang
+        else:
+            cosz, azimuth, rad_vec = sunang(
+                date_time, self.topo.basin_lat, self.topo.basin_long)
+            illum_ang = shade(
+                self.topo.sin_slope, self.topo.aspect, azimuth, cosz)
+
+        return lut.stoporad_bands(
+            date_time,
+            cosz,
+            azimuth,
+            illum_ang,
+            [self.albedo_ir, self.albedo_vis],
+            [IR_WAVELENGTHS, VISIBLE_WAVELENGTHS])
+
+    def test_node(self):
+        lut = ClearSkyLUT(self.location, self.topo, days=5, minutes=60)
+        beam, diffuse = self.stoporad_bands(lut)
+
+        # the albedo is applied to the node like stoporad
+        beam0, diffuse0 = toporad.stoporad_bands(
+            self.date_time,
+            self.topo,
+            self.cosz,
+            self.azimuth,
+            self.illum_ang,
+            [self.albedo_ir, self.albedo_vis],
+            [IR_WAVELENGTHS, VISIBLE_WAVELENGTHS])
+
+        np.testing.assert_allclose(beam, beam0, rtol=1e-10, atol=1e-10)
+        np.testing.assert_allclose(diffuse, diffuse0, rtol=1e-10, atol=1e-10)
+
+    def test_store(self):
+        lut = ClearSkyLUT(self.location, self.topo, days=3, minutes=45)
+        beam, diffuse = self.stoporad_bands(lut)
+
+        # four nodes around the time step
+        self.assertEqual((lut.hits, lut.misses), (0, 4))
+        self.assertEqual(len(os.listdir(lut.path)), 4)
+
+        # another run loads the nodes
+        lut = ClearSkyLUT(self.location, self.topo, days=3, minutes=45)
+        beam2, diffuse2 = self.stoporad_bands(lut)
+
+        self.assertEqual((lut.hits, lut.misses), (4, 0))
+        np.testing.assert_equal(beam, beam2)
+        np.testing.assert_equal(diffuse, diffuse2)
+
+        # other clear sky options are another table
+        lut = ClearSkyLUT(self.location, self.topo, days=3, minutes=45,
+                          tau=0.3)
+        self.assertEqual(len(os.listdir(self.location)), 2)
+
+    def test_sunset(self):
+        lut = ClearSkyLUT(self.location, self.topo, days=3, minutes=60)
+
+        # the sun is up at 1:15 UTC and down at the 2:00 node
+        date_time = pd.to_datetime('2/10/2001 01:15').tz_localize('UTC')
+        cosz, azimuth, rad_vec = sunang(
+            date_time, self.topo.basin_lat, self.topo.basin_long)
+        self.assertGreater(cosz, 0)
+
+        illum_ang = shade(
+            self.topo.sin_slope, self.topo.aspect, azimuth, cosz)
+        beam, diffuse = self.stoporad_bands(lut, date_time)
+
+        # calculated like stoporad instead of scaled down by the sun down
+        # nodes
+        self.assertEqual(lut.direct, 1)
+        beam0, diffuse0 = toporad.stoporad_bands(
+            date_time,
+            self.topo,
+            cosz,
+            azimuth,
+            illum_ang,
+            [self.albedo_ir, self.albedo_vis],
+            [IR_WAVELENGTHS, VISIBLE_WAVELENGTHS])
+
+        np.testing.assert_equal(beam, beam0)
+        np.testing.assert_equal(diffuse, diffuse0)
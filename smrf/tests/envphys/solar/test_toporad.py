@@ -159,3 +159,50 @@ class TestToporad(SMRFTestCaseLakes):
         np.testing.assert_allclose(56, np.mean(srad_diffuse), atol=1)
         np.testing.assert_allclose(41, np.min(srad_diffuse), atol=1)
         np.testing.assert_allclose(71, np.max(srad_diffuse), atol=1)
+
+    def test_stoporad_bands(self):
+
+        alb_vis, alb_ir = albedo(
+            20 * np.ones_like(self.dem), self.illum_ang, 500, 2000)
+
+        kwargs = {
+            'tau_elevation': self.tau_elevation,
+            'tau': self.tau,
+            'omega': self.omega,
+            'scattering_factor': self.scattering_factor
+        }
+
+        # both bands written to the buffers at once
+        shape = (2,) + self.dem.shape
+        beam = np.empty(shape)
+        diffuse = np.empty(shape)
+        out = toporad.stoporad_bands(
+            self.date_time,
+            self.topo,
+            self.cosz,
+            self.azimuth,
+            self.illum_ang,
+            [alb_vis, alb_ir],
+            [[0.28, 0.7], [0.7, 2.8]],
+            beam=beam,
+            diffuse=diffuse,
+            **kwargs)
+
+        self.assertIs(out[0], beam)
+        self.assertIs(out[1], diffuse)
+
+        for band, (alb, wavelengths) in enumerate(
+                [(alb_vis, [0.28, 0.7]), (alb_ir, [0.7, 2.8])]):
+            srad_beam, srad_diffuse = toporad.stoporad(
+                self.date_time,
+                self.topo,
+                self.cosz,
+                self.azimuth,
+                self.illum_ang,
+                alb,
+                wavelength_range=wavelengths,
+                **kwargs)
+
+            np.testing.assert_allclose(beam[band], srad_beam, rtol=1e-12)
+            np.testing.assert_allclose(
+                diffuse[band], srad_diffuse, rtol=1e-12)
@@ -53,6 +53,8 @@ class TestWinstralWindRecipes(SMRFTestCase, BaseRecipes):
             'max',
             'min',
             'idw_power',
+            'idw_neighbors',
+            'idw_search_radius',
             'station_peak',
             'station_default',
             'veg_default',
@@ -0,0 +1,60 @@
+import unittest
+
+import numpy as np
+
+from smrf.spatial.dk.dk import DK
+
+
+class TestDK(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(5)
+        mx = rng.uniform(0, 1000, 6)
+        my = rng.uniform(0, 1000, 6)
+        mz = rng.uniform(1500, 3000, 6)
+
+        x, y = np.meshgrid(np.arange(0, 1000, 50), np.arange(0, 800, 50))
+        z = rng.uniform(1500, 3000, x.shape)
+        config = {'detrend_slope': 0, 'dk_ncores': 1}
+
+        self.dk = DK(mx, my, mz, x, y, z, config)
+        self.single = DK(mx, my, mz, x, y, z, config)
+
+        self.data = rng.uniform(-10, 10, (9, 6))
+        self.data[2, 0] = np.nan
+        self.data[[4, 7], 3] = np.nan
+
+    def test_batch(self):
+        v = self.dk.calculateBatch(self.data)
+
+        self.assertEqual(v.shape, (9,) + self.dk.GridX.shape)
+        for t, d in enumerate(self.data):
+            np.testing.assert_allclose(
+                v[t], self.single.calculate(d), rtol=1e-10)
+
+    def test_weight_cache(self):
+        # alternating station outages
+        data = np.tile(self.data[:2], (4, 1))
+        data[::2, 3] = np.nan
+
+        for d in data:
+            self.dk.calculate(d)
+
+        self.assertEqual(self.dk.weight_cache.misses, 2)
+        self.assertEqual(self.dk.weight_cache.hits, 6)
+        self.assertEqual(self.dk.calculateWeights(np.isnan(data[1])).shape,
+                         self.dk.GridX.shape + (6,))
+        self.assertFalse(hasattr(self.dk, 'dgrid'))
+
+    def test_kriging_weights(self):
+        nan_val = np.zeros(6, dtype=bool)
+        nan_val[3] = True
+        w = self.dk.krigingWeights(nan_val)
+
+        # negative weights are removed and the weights sum to one
+        self.assertTrue(np.all(w >= 0))
+        np.testing.assert_allclose(w.sum(axis=1), 1, rtol=1e-10)
+
+        # threads share the factored systems without changing the weights
+        self.dk.config['dk_ncores'] = 4
+        np.testing.assert_array_equal(self.dk.krigingWeights(nan_val), w)
@@ -0,0 +1,75 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+from scipy.interpolate import griddata
+
+from smrf.spatial.grid import GRID
+
+
+class TestGRID(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(7)
+        self.mx = rng.uniform(0, 1000, 20)
+        self.my = rng.uniform(0, 1000, 20)
+        self.mz = rng.uniform(1500, 3000, 20)
+
+        self.x, self.y = np.meshgrid(
+            np.arange(0, 1000, 50), np.arange(0, 800, 50))
+        config = {'grid_local': False, 'grid_mask': False}
+        z = rng.uniform(1500, 3000, self.x.shape)
+        self.grid = GRID(config, self.mx, self.my, self.x, self.y,
+                         mz=self.mz, GridZ=z)
+
+        self.data = rng.uniform(-10, 10, (6, 20))
+        self.data[[2, 3], 4] = np.nan
+
+    def test_interpolation(self):
+        for method in ['nearest', 'linear', 'cubic']:
+            for d in self.data:
+                valid = ~np.isnan(d)
+                np.testing.assert_allclose(
+                    self.grid.calculateInterpolation(d, method),
+                    griddata((self.mx[valid], self.my[valid]), d[valid],
+                             (self.x, self.y), method=method),
+                    rtol=1e-10, atol=1e-12)
+
+    def test_weight_cache(self):
+        for d in self.data:
+            self.grid.calculateInterpolation(d, 'linear')
+
+        # two sets of stations with data
+        self.assertEqual(self.grid.weight_cache.misses, 2)
+        self.assertEqual(self.grid.weight_cache.hits, 4)
+
+    def test_local_trend(self):
+        metadata = pd.DataFrame({
+            'latitude': self.my / 1e5,
+            'longitude': self.mx / 1e5,
+            'elevation': self.mz})
+        config = {'grid_local': True, 'grid_local_n': 6, 'grid_mask': False}
+        grid = GRID(config, self.mx, self.my, self.x, self.y,
+                    mz=self.mz, GridZ=self.grid.GridZ, metadata=metadata)
+
+        d = self.data[0]
+        v = grid.detrendedInterpolation(pd.Series(d), 1, 'linear')
+
+        # polyfit of each point to the nearest points
+        slope = np.zeros(20)
+        intercept = np.zeros(20)
+        for i in range(20):
+            dist = np.hypot(self.mx - self.mx[i], self.my - self.my[i])
+            near = np.argsort(dist)[:6]
+            pv = np.polyfit(self.mz[near], d[near], 1)
+            if pv[0] >= 0:
+                slope[i], intercept[i] = pv
+
+        def interp(values):
+            return griddata((self.mx, self.my), values, (self.x, self.y))
+
+        np.testing.assert_allclose(
+            v,
+            interp(d - self.mz * slope - intercept) +
+            interp(slope) * self.grid.GridZ + interp(intercept),
+            rtol=1e-8)
@@ -0,0 +1,106 @@
+import unittest
+
+import numpy as np
+
+from smrf.spatial.idw import IDW
+
+
+class TestIDW(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(11)
+        self.mx = rng.uniform(0, 1000, 6)
+        self.my = rng.uniform(0, 1000, 6)
+        self.mz = rng.uniform(1500, 3000, 6)
+
+        x, y = np.meshgrid(np.arange(0, 1000, 50), np.arange(0, 800, 50))
+        self.idw = IDW(self.mx, self.my, x, y, mz=self.mz,
+                       GridZ=rng.uniform(1500, 3000, x.shape))
+
+        self.data = rng.uniform(-10, 10, (9, 6))
+        self.data[2, 0] = np.nan
+        self.data[[4, 7], 3] = np.nan
+
+    def test_batch(self):
+        v = self.idw.calculateIDWBatch(self.data)
+
+        self.assertEqual(v.shape, (9,) + self.idw.GridX.shape)
+        for t, d in enumerate(self.data):
+            np.testing.assert_allclose(v[t], self.idw.calculateIDW(d))
+
+    def test_weight_cache(self):
+        for d in self.data:
+            w = 1 / self.idw.distance[:, :, ~np.isnan(d)]**2
+            np.testing.assert_allclose(
+                self.idw.calculateIDW(d),
+                np.sum(w * d[~np.isnan(d)], 2) / np.sum(w, 2))
+
+        # only the weights of the stations with data are kept
+        self.assertFalse(hasattr(self.idw, 'weights'))
+
+        # three sets of stations with data
+        self.assertEqual(self.idw.weight_cache.misses, 3)
+        self.assertEqual(self.idw.weight_cache.hits, 6)
+
+    def test_detrended_batch(self):
+        v = self.idw.detrendedIDWBatch(self.data, flag=0)
+
+        for t, d in enumerate(self.data):
+            np.testing.assert_allclose(
+                v[t], self.idw.detrendedIDW(d.copy(), 0))
+
+    def test_detrend_data(self):
+        # same interface as kriging, the detrended data with the trend kept
+        d = self.data[0].copy()
+        dtrend = self.idw.detrendData(d.copy(), 0)
+        self.assertEqual(dtrend.shape, d.shape)
+
+        np.testing.assert_allclose(
+            self.idw.retrendData(self.idw.calculateIDW(dtrend)),
+            self.idw.detrendedIDW(d, 0))
+
+
+class TestNearestIDW(TestIDW):
+
+    def setUp(self):
+        super().setUp()
+        self.dense = self.idw
+        self.idw = IDW(
+            self.mx, self.my, self.dense.GridX, self.dense.GridY, mz=self.mz,
+            GridZ=self.dense.GridZ, neighbors=3)
+
+    def test_all_neighbors(self):
+        nearest = IDW(
+            self.mx, self.my, self.dense.GridX, self.dense.GridY, mz=self.mz,
+            GridZ=self.dense.GridZ, neighbors=6)
+
+        self.assertFalse(hasattr(nearest, 'distance'))
+        self.assertEqual(
+            nearest.neighbor_weights.shape, (self.dense.GridX.size, 6))
+
+        np.testing.assert_allclose(
+            nearest.calculateIDWBatch(self.data),
+            self.dense.calculateIDWBatch(self.data))
+
+    def test_weight_cache(self):
+        for d in self.data:
+            self.idw.calculateIDW(d)
+
+        self.assertEqual(self.idw.weight_cache.misses, 3)
+        self.assertEqual(self.idw.weight_cache.hits, 6)
+
+    def test_search_radius(self):
+        nearest = IDW(
+            self.mx, self.my, self.dense.GridX, self.dense.GridY,
+            neighbors=2, search_radius=100)
+
+        # only one station is available, every cell uses it
+        data = np.full(6, np.nan)
+        data[1] = 4
+        np.testing.assert_allclose(nearest.calculateIDW(data), 4)
+
+        data = self.data[0]
+        v = nearest.calculateIDW(data)
+        self.assertFalse(np.any(np.isnan(v)))
+        self.assertTrue(np.all(v >= np.nanmin(data) - 1e-10))
+        self.assertTrue(np.all(v <= np.nanmax(data) + 1e-10))
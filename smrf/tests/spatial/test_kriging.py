@@ -0,0 +1,86 @@
+import unittest
+
+import numpy as np
+from pykrige.ok import OrdinaryKriging
+
+from smrf.spatial.kriging import KRIGE
+
+
+class TestKRIGE(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(9)
+        self.mx = rng.uniform(0, 1000, 12)
+        self.my = rng.uniform(0, 1000, 12)
+        self.mz = rng.uniform(1500, 3000, 12)
+
+        self.x, self.y = np.meshgrid(
+            np.arange(0, 1000, 50.0), np.arange(0, 800, 50.0))
+        self.z = rng.uniform(1500, 3000, self.x.shape)
+
+        self.config = {
+            'krig_variogram_model': 'spherical',
+            'krig_nlags': 6,
+            'krig_weight': False,
+            'krig_anisotropy_scaling': 1.0,
+            'krig_anisotropy_angle': 0.0,
+            'krig_coordinates_type': 'euclidean',
+            'krig_calibration_steps': None,
+            'krig_n_closest_points': None,
+            'krig_variance': True,
+            'detrend': False
+        }
+
+        self.data = rng.uniform(-10, 10, (6, 12))
+        self.data[[2, 3], 4] = np.nan
+
+    def krige(self, **kwargs):
+        self.config.update(kwargs)
+        return KRIGE(self.mx, self.my, self.mz, self.x, self.y, self.z,
+                     self.config)
+
+    def pykrige(self, d, n_closest_points=None, variogram_parameters=None):
+        valid = ~np.isnan(d)
+        OK = OrdinaryKriging(self.mx[valid], self.my[valid], d[valid],
+                             variogram_model='spherical',
+                             variogram_parameters=variogram_parameters)
+        return OK.execute('grid', self.x[0, :], self.y[:, 0],
+                          backend='loop', n_closest_points=n_closest_points)
+
+    def test_calculate(self):
+        k = self.krige()
+        for d in self.data:
+            v, ss = k.calculate(d)
+            v0, ss0 = self.pykrige(d)
+            np.testing.assert_allclose(v, v0, atol=1e-10)
+            np.testing.assert_allclose(ss, ss0, atol=1e-10)
+
+    def test_moving_window(self):
+        k = self.krige(krig_n_closest_points=5)
+        for d in self.data:
+            v, ss = k.calculate(d)
+            v0, ss0 = self.pykrige(d, n_closest_points=5)
+            np.testing.assert_allclose(v, v0, atol=1e-10)
+            np.testing.assert_allclose(ss, ss0, atol=1e-10)
+
+    def test_frozen_variogram(self):
+        k = self.krige(krig_calibration_steps=2, krig_variance=False)
+
+        for d in self.data:
+            v, ss = k.calculate(d)
+            self.assertIsNone(ss)
+
+        # median of the variograms fit to the first two time steps
+        self.assertTrue(k.frozen)
+        self.assertEqual(len(k.calibration), 2)
+        np.testing.assert_allclose(
+            k.variogram_parameters, np.median(k.calibration, axis=0))
+
+        # two sets of stations with data once frozen
+        self.assertEqual(k.weight_cache.misses, 2)
+        self.assertEqual(k.weight_cache.hits, 2)
+
+        # frozen weights give the same result as pykrige with the variogram
+        v0, ss0 = self.pykrige(
+            self.data[-1], variogram_parameters=k.variogram_parameters)
+        np.testing.assert_allclose(v, v0, atol=1e-10)
@@ -0,0 +1,39 @@
+import unittest
+
+import numpy as np
+
+from smrf.spatial.trend import linear_trend
+
+
+class TestLinearTrend(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(7)
+        self.mz = rng.uniform(1500, 3000, 8)
+        self.data = rng.uniform(-10, 10, (12, 8))
+        self.data[3, 2] = np.nan
+        self.data[5, [0, 1]] = np.nan
+
+    def test_polyfit(self):
+        slope, intercept = linear_trend(self.mz, self.data)
+
+        for t, d in enumerate(self.data):
+            valid = ~np.isnan(d)
+            pv = np.polyfit(self.mz[valid], d[valid], 1)
+            np.testing.assert_allclose([slope[t], intercept[t]], pv)
+
+    def test_flag(self):
+        slope, intercept = linear_trend(self.mz, self.data)
+        positive = linear_trend(self.mz, self.data, flag=1)
+        negative = linear_trend(self.mz, self.data, flag=-1)
+
+        np.testing.assert_equal(positive[0], np.where(slope < 0, 0, slope))
+        np.testing.assert_equal(negative[0], np.where(slope > 0, 0, slope))
+        np.testing.assert_equal(
+            positive[1], np.where(slope < 0, 0, intercept))
+
+    def test_stations(self):
+        self.data[4, 1:] = np.nan
+
+        with self.assertRaises(ValueError):
+            linear_trend(self.mz, self.data)
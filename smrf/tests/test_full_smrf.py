@@ -1,8 +1,21 @@
-from inicheck.tools import cast_all_variables
+import glob
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
 
+import netCDF4 as nc
+import numpy as np
+import pandas as pd
+from inicheck.tools import cast_all_variables, get_user_config
+
+from smrf.envphys.solar.clear_sky import ClearSkyLUT
 from smrf.framework.model_framework import run_smrf
 from smrf.tests.smrf_test_case import SMRFTestCase
 from smrf.tests.check_mixin import CheckSMRFOutputs
+from smrf.utils.benchmark import benchmark_config, synthetic_basin
 
 
 class TestThreadedRME(CheckSMRFOutputs, SMRFTestCase):
@@ -16,7 +29,7 @@ class TestThreadedRME(CheckSMRFOutputs, SMRFTestCase):
 
         cls.gold_dir = cls.basin_dir.joinpath('gold')
 
-        run_smrf(cls.run_config)
+        cls.smrf = run_smrf(cls.run_config)
 
 
 class TestRME(TestThreadedRME):
@@ -33,3 +46,486 @@ class TestRME(TestThreadedRME):
 
         config.apply_recipes()
         cls.run_config = cast_all_variables(config, config.mcfg)
+
+    def test_shared_plans(self):
+        # the idw modules share one interpolator, precip uses dk
+        d = self.smrf.distribute
+        idw = d['air_temp'].idw
+        self.assertIs(d['vapor_pressure'].idw, idw)
+        self.assertIs(d['cloud_factor'].idw, idw)
+        self.assertIs(d['wind'].wind_model.idw, idw)
+
+        self.assertEqual(len(self.smrf.plans), 2)
+
+    def test_static_fields(self):
+        d = self.smrf.distribute
+        self.assertEqual(len(self.smrf.static_fields), 4)
+        self.assertFalse(d['solar'].tau_domain.flags.writeable)
+        self.assertFalse(d['solar'].veg_extinction.flags.writeable)
+        self.assertFalse(d['thermal'].canopy[0].flags.writeable)
+        self.assertFalse(d['wind'].wind_model.veg_maxus.flags.writeable)
+
+
+class TestBatchRME(TestThreadedRME):
+    """
+    Integration test for SMRF interpolating blocks of time steps
+    Runs the short simulation over reynolds mountain east
+    """
+
+    @classmethod
+    def configure(cls):
+
+        config = cls.base_config_copy()
+        config.raw_cfg['system']['threading'] = False
+        config.raw_cfg['system']['batch_time_steps'] = 3
+
+        config.apply_recipes()
+        cls.run_config = cast_all_variables(config, config.mcfg)
+
+    def test_batch(self):
+        self.assertEqual(
+            sorted(n for n, m in self.smrf.distribute.items() if m.batch),
+            ['air_temp', 'cloud_factor', 'vapor_pressure'])
+
+
+class TestWeightStoreRME(TestThreadedRME):
+    """
+    Integration test for SMRF keeping the interpolation weights between runs
+    Runs the short simulation over reynolds mountain east
+    """
+
+    @classmethod
+    def configure(cls):
+
+        config = cls.base_config_copy()
+        config.raw_cfg['system']['threading'] = False
+        config.raw_cfg['system']['weight_store'] = str(
+            cls.output_dir.joinpath('weights'))
+
+        config.apply_recipes()
+        cls.run_config = cast_all_variables(config, config.mcfg)
+
+    def test_weight_store(self):
+        store = self.smrf.distribute['air_temp'].weight_store
+        files = glob.glob(os.path.join(store.location, '*.pkl'))
+
+        # modules with the same stations and options share the weights
+        self.assertEqual(store.misses, len(files))
+        hits = store.hits
+
+        # a second run loads all the weights
+        s = run_smrf(self.run_config)
+        store = s.distribute['air_temp'].weight_store
+        self.assertEqual(store.misses, 0)
+        self.assertEqual(store.hits, hits + len(files))
+
+        self.compare_netcdf_files('air_temp.nc')
+        self.compare_netcdf_files('vapor_pressure.nc')
+
+
+class TestTimeChunksRME(TestThreadedRME):
+    """
+    Integration test for SMRF distributing time chunks in a process pool
+    Runs the short simulation over reynolds mountain east
+    """
+
+    @classmethod
+    def configure(cls):
+
+        config = cls.base_config_copy()
+        config.raw_cfg['system']['threading'] = False
+        config.raw_cfg['system']['time_chunks'] = 2
+        config.raw_cfg['system']['max_processes'] = 2
+
+        config.apply_recipes()
+        cls.run_config = cast_all_variables(config, config.mcfg)
+
+
+class TestTimeChunksSynthetic(unittest.TestCase):
+    """
+    Distribute time chunks over a synthetic basin with storms and compare
+    to a serial run
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.location = tempfile.mkdtemp()
+        basin = synthetic_basin(
+            cls.location, nx=30, ny=30, n_stations=6, time_steps=48)
+
+        cls.serial = cls.run_case(basin, 'serial', time_chunks=1)
+        cls.chunked = cls.run_case(basin, 'chunked', time_chunks=4)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.location)
+
+    @classmethod
+    def run_case(cls, basin, name, time_chunks):
+        config = get_user_config(
+            benchmark_config(basin, os.path.join(cls.location, name)),
+            modules='smrf')
+        config.raw_cfg['system']['threading'] = False
+        config.raw_cfg['system']['time_chunks'] = time_chunks
+        config.raw_cfg['system']['max_processes'] = 2
+        config.raw_cfg['output']['timing_report'] = True
+        config.raw_cfg['output']['variables'] = [
+            'air_temp', 'vapor_pressure', 'precip', 'percent_snow',
+            'snow_density', 'storm_days', 'albedo_vis', 'net_solar',
+            'thermal', 'wind_speed']
+
+        config.apply_recipes()
+        config = cast_all_variables(config, config.mcfg)
+
+        return run_smrf(config)
+
+    def test_state_modules(self):
+        self.assertEqual(
+            self.chunked.state_modules(),
+            ['air_temp', 'wind', 'vapor_pressure', 'precipitation'])
+
+    def test_distribute_once(self):
+        """
+        The chunked run is not slower than the serial run, every module
+        distributes every time step once and the state modules are not
+        distributed again by the chunks
+        """
+
+        def distributed(run):
+            records = run.timing.to_dataframe()
+            records = records[records['stage'] == 'distribute']
+            return records.groupby('name')['time_step'].apply(sorted)
+
+        serial = distributed(self.serial)
+        chunked = distributed(self.chunked)
+
+        self.assertEqual(set(chunked.index), set(serial.index))
+        for name, time_steps in serial.items():
+            self.assertEqual(len(time_steps), 48)
+            self.assertEqual(chunked[name], time_steps, msg=name)
+
+        # the chunks only left the state modules to the last chunk
+        self.assertFalse(glob.glob(os.path.join(
+            self.location, 'chunked', 'chunk_*', 'state_fields.pkl')))
+
+    def test_storm_days(self):
+        storm_days = nc.Dataset(os.path.join(
+            self.location, 'serial', 'storm_days.nc'))['storm_days'][:]
+
+        # the storm days are reset during the period
+        self.assertTrue(np.any(np.diff(storm_days, axis=0) < 0))
+
+    def test_outputs(self):
+        for file_name in glob.glob(
+                os.path.join(self.location, 'serial', '*.nc')):
+            variable = os.path.splitext(os.path.basename(file_name))[0]
+            serial = nc.Dataset(file_name)
+            chunked = nc.Dataset(os.path.join(
+                self.location, 'chunked', os.path.basename(file_name)))
+
+            np.testing.assert_array_equal(
+                serial['time'][:], chunked['time'][:])
+            np.testing.assert_array_equal(
+                serial[variable][:], chunked[variable][:],
+                err_msg=variable)
+
+            serial.close()
+            chunked.close()
+
+
+class TestTilesRME(TestThreadedRME):
+    """
+    Integration test for SMRF distributing tiles in a process pool
+    Runs the short simulation over reynolds mountain east
+    """
+
+    @classmethod
+    def configure(cls):
+
+        config = cls.base_config_copy()
+        config.raw_cfg['system']['threading'] = False
+        config.raw_cfg['system']['tile_rows'] = 2
+        config.raw_cfg['system']['tile_cols'] = 2
+        config.raw_cfg['system']['tile_halo'] = 2
+        config.raw_cfg['system']['max_processes'] = 2
+
+        config.apply_recipes()
+        cls.run_config = cast_all_variables(config, config.mcfg)
+
+    def test_net_solar(self):
+        """
+        The horizon angles of a tile only see the terrain within the halo so
+        the net solar differs from a single domain run near the tile edges
+        by up to 0.71 W/m^2.
+        The other outputs only depend on the pixel and match exactly.
+        """
+
+        gold = nc.Dataset(self.gold_dir.joinpath('net_solar.nc'))
+        test = nc.Dataset(self.output_dir.joinpath('net_solar.nc'))
+
+        np.testing.assert_allclose(
+            test.variables['net_solar'][:],
+            gold.variables['net_solar'][:],
+            rtol=0, atol=1)
+
+        gold.close()
+        test.close()
+
+
+class TestCompressRME(SMRFTestCase):
+    """
+    Integration test for SMRF distributing only the cells in the mask
+    Runs the short simulation over reynolds mountain east
+    """
+
+    @classmethod
+    def configure(cls):
+
+        config = cls.base_config_copy()
+        config.raw_cfg['system']['threading'] = False
+        config.raw_cfg['system']['compress_mask'] = True
+
+        config.apply_recipes()
+        cls.run_config = cast_all_variables(config, config.mcfg)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.gold_dir = cls.basin_dir.joinpath('gold')
+
+        cls.smrf = run_smrf(cls.run_config)
+
+    def test_compressed(self):
+        mask = self.smrf.topo.expand(self.smrf.topo.mask).astype(bool)
+        self.assertEqual(self.smrf.topo.ny, 1)
+        self.assertEqual(self.smrf.topo.nx, np.sum(mask))
+
+    def test_outputs(self):
+        """
+        The outputs match the gold within the mask and are 0 outside of it.
+        The mean albedo for stoporad is over the mask so the net solar
+        differs by up to 0.002 W/m^2.
+        """
+
+        mask = self.smrf.topo.expand(self.smrf.topo.mask).astype(bool)
+
+        for file_name in self.gold_dir.glob('*.nc'):
+            variable = file_name.stem
+            gold = nc.Dataset(file_name)
+            test = nc.Dataset(self.output_dir.joinpath(file_name.name))
+
+            g = gold.variables[variable][:]
+            t = test.variables[variable][:]
+            np.testing.assert_allclose(
+                t[:, mask], g[:, mask], rtol=1e-5, atol=0.01,
+                err_msg=variable)
+            np.testing.assert_equal(t[:, ~mask], 0, err_msg=variable)
+
+            gold.close()
+            test.close()
+
+
+class TestClearSkyLUTRME(SMRFTestCase):
+    """
+    Integration test for SMRF interpolating the clear sky radiation from
+    the look up table
+    Runs the short simulation over reynolds mountain east
+    """
+
+    @classmethod
+    def configure(cls):
+
+        config = cls.base_config_copy()
+        config.raw_cfg['system']['threading'] = False
+        config.raw_cfg['solar']['clear_sky_lut'] = str(
+            cls.output_dir.joinpath('clear_sky'))
+        config.raw_cfg['solar']['clear_sky_lut_days'] = 1
+
+        config.apply_recipes()
+        cls.run_config = cast_all_variables(config, config.mcfg)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.gold_dir = cls.basin_dir.joinpath('gold')
+
+        # sun position of the nodes for the year of the run
+        with mock.patch.object(ClearSkyLUT, 'YEAR', 1998):
+            cls.smrf = run_smrf(cls.run_config)
+
+    def test_nodes(self):
+        # the hourly time steps are on the nodes of the table
+        lut = self.smrf.distribute['solar'].clear_sky_lut
+        self.assertEqual(lut.misses, 4)
+        self.assertEqual(len(os.listdir(lut.path)), 4)
+
+    def test_outputs(self):
+        """
+        The outputs match the gold with the nodes for the year of the run
+        """
+
+        for file_name in self.gold_dir.glob('*.nc'):
+            variable = file_name.stem
+            gold = nc.Dataset(file_name)
+            test = nc.Dataset(self.output_dir.joinpath(file_name.name))
+
+            np.testing.assert_allclose(
+                test.variables[variable][:], gold.variables[variable][:],
+                rtol=1e-5, atol=1e-5, err_msg=variable)
+
+            gold.close()
+            test.close()
+
+
+class TestTimingReportRME(TestThreadedRME):
+    """
+    Integration test for SMRF writing the timing report from the threads
+    Runs the short simulation over reynolds mountain east
+    """
+
+    @classmethod
+    def configure(cls):
+
+        config = cls.base_config_copy()
+        config.raw_cfg['output']['timing_report'] = True
+
+        config.apply_recipes()
+        cls.run_config = cast_all_variables(config, config.mcfg)
+
+    def test_timing_report(self):
+        records = pd.read_csv(self.output_dir.joinpath('timing.csv'))
+
+        self.assertEqual(
+            set(records['stage']),
+            {'sun_angle', 'illum_angle', 'distribute', 'interpolation',
+             'output'})
+        # a sun angle for every time step
+        self.assertEqual(
+            len(records[records['stage'] == 'sun_angle']),
+            records['time_step'].nunique())
+        self.assertFalse(records['time_step'].isnull().any())
+
+        with open(self.output_dir.joinpath('timing.json')) as f:
+            summary = json.load(f)
+
+        self.assertIn('p90', summary[0])
+        self.assertEqual(
+            sum(row['count'] for row in summary), len(records))
+
+
+class TestTimestepWorkersRME(TestThreadedRME):
+    """
+    Integration test for SMRF running the distribute modules concurrently
+    Runs the short simulation over reynolds mountain east
+    """
+
+    @classmethod
+    def configure(cls):
+
+        config = cls.base_config_copy()
+        config.raw_cfg['system']['threading'] = False
+        config.raw_cfg['system']['timestep_workers'] = 4
+
+        config.apply_recipes()
+        cls.run_config = cast_all_variables(config, config.mcfg)
+
+
+class TestFloatPrecisionRME(TestThreadedRME):
+    """
+    Integration test for SMRF with single precision images, weights and
+    distributed values
+    Runs the short simulation over reynolds mountain east
+    """
+
+    @classmethod
+    def configure(cls):
+
+        config = cls.base_config_copy()
+        config.raw_cfg['system']['precision'] = 'float'
+
+        config.apply_recipes()
+        cls.run_config = cast_all_variables(config, config.mcfg)
+
+
+class TestFloatPrecisionSerialRME(TestThreadedRME):
+    """
+    Integration test for SMRF with single precision without threading
+    Runs the short simulation over reynolds mountain east
+    """
+
+    @classmethod
+    def configure(cls):
+
+        config = cls.base_config_copy()
+        config.raw_cfg['system']['threading'] = False
+        config.raw_cfg['system']['precision'] = 'float'
+
+        config.apply_recipes()
+        cls.run_config = cast_all_variables(config, config.mcfg)
+
+    def test_state_precision(self):
+        precip = self.smrf.distribute['precipitation']
+
+        self.assertEqual(precip.storm_days.dtype, np.float64)
+        self.assertEqual(
+            self.smrf.distribute['air_temp'].air_temp.dtype, np.float32)
+
+
+class TestCheckpointRME(TestThreadedRME):
+    """
+    Integration test for SMRF writing checkpoints in serial and restarting
+    the threaded run from the last checkpoint
+    Runs the short simulation over reynolds mountain east
+    """
+
+    @classmethod
+    def configure(cls):
+
+        config = cls.base_config_copy()
+        config.raw_cfg['system']['threading'] = False
+        config.raw_cfg['output']['checkpoint_frequency'] = 2
+
+        config.apply_recipes()
+        cls.run_config = cast_all_variables(config, config.mcfg)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        # clear the last time step, the restart has to distribute it again
+        for file_name in cls.output_dir.glob('*.nc'):
+            with nc.Dataset(file_name, 'a') as ds:
+                ds.variables[file_name.stem][-1, :] = 0
+
+        config = cls.base_config_copy()
+        config.apply_recipes()
+        config = cast_all_variables(config, config.mcfg)
+
+        cls.restart = run_smrf(config, restart=True)
+
+    def test_restart(self):
+        self.assertEqual(
+            str(self.restart.checkpoint['time_step']),
+            '1998-01-14 18:00:00+00:00')
+        self.assertEqual(self.restart.checkpoint['run_index'], 3)
+        self.assertEqual(self.restart.time_steps, 1)
+        self.assertIn(
+            'storm_days', self.restart.checkpoint['state']['precipitation'])
+
+    def test_restart_interpolators(self):
+        interpolators = self.restart.checkpoint['interpolators']['air_temp']
+
+        self.assertIs(
+            self.restart.distribute['air_temp'].idw, interpolators['idw'])
+
+    def test_threaded_checkpoint(self):
+        config = self.base_config_copy()
+        config.raw_cfg['output']['checkpoint_frequency'] = 2
+
+        config.apply_recipes()
+        config = cast_all_variables(config, config.mcfg)
+
+        with self.assertRaises(ValueError):
+            run_smrf(config)
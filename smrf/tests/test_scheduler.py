@@ -0,0 +1,114 @@
+import unittest
+
+from smrf.framework.scheduler import DistributeScheduler
+from smrf.utils.timing import Timing
+
+
+class Module():
+    """Distribute module that adds one to the sum of its inputs"""
+
+    def __init__(self, inputs, outputs):
+        self.DISTRIBUTE_INPUTS = inputs
+        self.DISTRIBUTE_OUTPUTS = frozenset(outputs)
+
+    def distribute_fields(self, fields):
+        value = sum([fields[field] for field in self.DISTRIBUTE_INPUTS]) + 1
+        return {field: value for field in self.DISTRIBUTE_OUTPUTS}
+
+
+class TestDistributeScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.modules = {
+            'solar': Module(('time', 'cloud', 'albedo'), ['net_solar']),
+            'air_temp': Module(('time',), ['air_temp']),
+            'albedo': Module(('storm_days',), ['albedo']),
+            'precip': Module(('air_temp', 'dew_point'), ['storm_days']),
+            'vapor_pressure': Module(('air_temp',), ['dew_point']),
+            'cloud_factor': Module(('time',), ['cloud']),
+        }
+
+    def test_dependencies(self):
+        scheduler = DistributeScheduler(self.modules, ['time'])
+
+        self.assertEqual(scheduler.dependencies['air_temp'], set())
+        self.assertEqual(
+            scheduler.dependencies['precip'],
+            {'air_temp', 'vapor_pressure'})
+        self.assertEqual(
+            scheduler.dependencies['solar'], {'cloud_factor', 'albedo'})
+        self.assertEqual(scheduler.input_fields, {'time'})
+
+    def test_order(self):
+        scheduler = DistributeScheduler(self.modules, ['time'])
+
+        self.assertEqual(
+            scheduler.order,
+            ['air_temp', 'cloud_factor', 'vapor_pressure', 'precip',
+             'albedo', 'solar'])
+
+    def test_critical_path(self):
+        scheduler = DistributeScheduler(self.modules, ['time'])
+
+        self.assertEqual(
+            scheduler.critical_path(),
+            ['air_temp', 'vapor_pressure', 'precip', 'albedo', 'solar'])
+
+        durations = dict.fromkeys(self.modules, 1)
+        durations['cloud_factor'] = 10
+        self.assertEqual(
+            scheduler.critical_path(durations), ['cloud_factor', 'solar'])
+
+    def test_run(self):
+        for max_workers in [1, 4]:
+            scheduler = DistributeScheduler(
+                self.modules, ['time'], max_workers)
+            fields = scheduler.run({'time': 0})
+
+            self.assertEqual(fields['air_temp'], 1)
+            self.assertEqual(fields['dew_point'], 2)
+            self.assertEqual(fields['storm_days'], 4)
+            self.assertEqual(fields['albedo'], 5)
+            self.assertEqual(fields['net_solar'], 7)
+
+    def test_executor(self):
+        scheduler = DistributeScheduler(self.modules, ['time'], 4)
+        scheduler.run({'time': 0})
+        executor = scheduler.executor
+        scheduler.run({'time': 1})
+
+        self.assertIs(scheduler.executor, executor)
+
+        scheduler.shutdown()
+        self.assertIsNone(scheduler._executor)
+
+    def test_durations(self):
+        scheduler = DistributeScheduler(
+            self.modules, ['time'], 4, timing=Timing())
+        scheduler.run({'time': 0})
+        scheduler.run({'time': 1})
+        scheduler.shutdown()
+
+        self.assertEqual(set(scheduler.durations), set(self.modules))
+        self.assertEqual(len(scheduler.timing.records), 2 * len(self.modules))
+        self.assertEqual(
+            sum(scheduler.durations.values()),
+            sum(r['seconds'] for r in scheduler.timing.records))
+
+    def test_missing_input(self):
+        self.modules['thermal'] = Module(('cloud', 'vapor'), ['thermal'])
+
+        with self.assertRaises(ValueError):
+            DistributeScheduler(self.modules, ['time'])
+
+    def test_duplicate_output(self):
+        self.modules['thermal'] = Module(('cloud',), ['air_temp'])
+
+        with self.assertRaises(ValueError):
+            DistributeScheduler(self.modules, ['time'])
+
+    def test_circular_dependency(self):
+        self.modules['air_temp'] = Module(('time', 'net_solar'), ['air_temp'])
+
+        with self.assertRaises(ValueError):
+            DistributeScheduler(self.modules, ['time'])
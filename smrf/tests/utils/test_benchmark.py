@@ -0,0 +1,45 @@
+import shutil
+import tempfile
+import unittest
+
+import netCDF4 as nc
+import pandas as pd
+
+from smrf.utils.benchmark import run_benchmark, synthetic_basin
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+
+    def test_synthetic_basin(self):
+        basin = synthetic_basin(
+            self.location, nx=12, ny=10, n_stations=5, time_steps=6)
+
+        with nc.Dataset(basin['topo']) as f:
+            self.assertEqual(f.variables['dem'].shape, (10, 12))
+
+        with nc.Dataset(basin['maxus']) as f:
+            self.assertEqual(f.variables['maxus'].shape, (72, 10, 12))
+
+        air_temp = pd.read_csv(
+            '{}/air_temp.csv'.format(basin['station_data']), index_col=0)
+        self.assertEqual(air_temp.shape, (6, 5))
+
+        metadata = pd.read_csv(
+            '{}/metadata.csv'.format(basin['station_data']))
+        self.assertEqual(list(metadata['primary_id']), list(air_temp.columns))
+
+    def test_run_benchmark(self):
+        report = run_benchmark(
+            self.location, sizes=[(12, 10)], n_stations=5, time_steps=3,
+            distributions=['idw'], wind_models=['interp'], modes=['serial'])
+
+        self.assertEqual(len(report), 1)
+        self.assertEqual(report['time_steps'][0], 3)
+        self.assertGreater(report['time_steps_per_second'][0], 0)
+        self.assertGreater(report['peak_rss_mb'][0], 0)
@@ -0,0 +1,128 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from smrf.utils.cache import (LRUCache, PlanRegistry, StaticFields,
+                              WeightStore, hash_key, mask_key)
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_get(self):
+        cache = LRUCache(maxsize=2)
+
+        self.assertEqual(cache.get('a', str.upper, 'a'), 'A')
+        self.assertEqual(cache.get('a', str.upper, 'x'), 'A')
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_evict(self):
+        cache = LRUCache(maxsize=2)
+        cache.get('a', str.upper, 'a')
+        cache.get('b', str.upper, 'b')
+
+        # a is used more recently than b
+        cache.get('a', str.upper, 'a')
+        cache.get('c', str.upper, 'c')
+
+        self.assertEqual(len(cache), 2)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+
+    def test_pickle(self):
+        cache = LRUCache(maxsize=2)
+        cache.get('a', str.upper, 'a')
+
+        cache = pickle.loads(pickle.dumps(cache))
+        self.assertEqual(cache.get('a', str.upper, 'x'), 'A')
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_mask_key(self):
+        self.assertEqual(
+            mask_key(np.array([True, False])), mask_key([1, 0]))
+        self.assertNotEqual(
+            mask_key(np.array([True, False])),
+            mask_key(np.array([False, True])))
+
+
+class TestPlanRegistry(unittest.TestCase):
+
+    def test_get(self):
+        plans = PlanRegistry()
+        plan = plans.get('a', list, 'ab')
+
+        self.assertIs(plans.get('a', list, 'xy'), plan)
+        self.assertEqual(plans.get('b', list, 'xy'), ['x', 'y'])
+        self.assertEqual((plans.hits, plans.misses), (1, 2))
+        self.assertEqual(len(plans), 2)
+
+
+class TestStaticFields(unittest.TestCase):
+
+    def test_get(self):
+        fields = StaticFields()
+        field = fields.get('a', np.ones, 3)
+
+        self.assertIs(fields.get('a', np.zeros, 3), field)
+        self.assertEqual((fields.hits, fields.misses), (1, 1))
+
+        # shared fields are read only
+        with self.assertRaises(ValueError):
+            field[0] = 2
+
+    def test_tuple(self):
+        fields = StaticFields()
+        ind, tau = fields.get('b', lambda: (np.arange(3), np.ones(3)))
+
+        self.assertFalse(ind.flags.writeable)
+        self.assertFalse(tau.flags.writeable)
+
+
+class TestWeightStore(unittest.TestCase):
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.store = WeightStore(self.location)
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+
+    def test_get(self):
+        key = hash_key('idw', np.arange(4))
+        value = self.store.get(key, np.ones, 3)
+        np.testing.assert_equal(value, np.ones(3))
+
+        # another run loads the value instead of calculating it
+        store = WeightStore(self.location)
+        value = store.get(key, np.zeros, 3)
+        np.testing.assert_equal(value, np.ones(3))
+        self.assertEqual((store.hits, store.misses), (1, 0))
+
+    def test_corrupt(self):
+        with open(self.store.path('key'), 'wb') as f:
+            f.write(b'')
+
+        np.testing.assert_equal(self.store.get('key', np.ones, 2), np.ones(2))
+        self.assertEqual(self.store.misses, 1)
+
+    def test_evict(self):
+        # about 0.8 MB each
+        self.store.max_size = 2
+        for i in range(3):
+            self.store.get(str(i), np.ones, 100000)
+            os.utime(self.store.path(str(i)), (i, i))
+
+        self.store.get('3', np.ones, 100000)
+
+        self.assertEqual(
+            sorted(os.listdir(self.location)), ['2.pkl', '3.pkl'])
+
+    def test_hash_key(self):
+        self.assertEqual(
+            hash_key('idw', {'a': 1, 'b': 2}, np.arange(3)),
+            hash_key('idw', {'b': 2, 'a': 1}, np.arange(3)))
+        self.assertNotEqual(
+            hash_key(np.arange(3)), hash_key(np.arange(3.0)))
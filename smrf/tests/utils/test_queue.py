@@ -0,0 +1,97 @@
+import threading
+import unittest
+from queue import Full
+
+import numpy as np
+
+from smrf.utils.queue import DateQueueThreading, QueueCleaner
+
+
+class TestDateQueueThreading(unittest.TestCase):
+
+    def test_release_after_last_consumer(self):
+        q = DateQueueThreading(consumers=2)
+        q.put([1, 'a'])
+
+        self.assertEqual(q.qsize(), 1)
+        self.assertEqual(q.get(1), 'a')
+        self.assertEqual(q.qsize(), 1)
+        self.assertEqual(q.get(1), 'a')
+        self.assertEqual(q.qsize(), 0)
+        self.assertEqual(q.queue, {})
+
+    def test_no_consumers(self):
+        q = DateQueueThreading(maxsize=1, consumers=0)
+        q.put([1, 'a'])
+        q.put([2, 'b'])
+
+        self.assertEqual(q.qsize(), 0)
+        self.assertEqual(q.queue, {})
+
+    def test_release_before_put(self):
+        q = DateQueueThreading(consumers=1)
+        q.release(1)
+        q.put([1, 'a'])
+
+        self.assertEqual(q.qsize(), 0)
+        self.assertEqual(q.queue, {})
+
+    def test_none_value(self):
+        q = DateQueueThreading(timeout=1)
+        q.put([1, None])
+
+        self.assertIsNone(q.get(1))
+
+    def test_dtype(self):
+        q = DateQueueThreading(consumers=3, dtype=np.float32)
+        q.put([1, np.ones(3)])
+        q.put([2, np.ones(3, dtype=int)])
+        q.put([3, 1.0])
+
+        self.assertEqual(q.get(1).dtype, np.float32)
+        self.assertEqual(q.get(2).dtype, int)
+        self.assertEqual(q.get(3), 1.0)
+
+    def test_get_waits_for_put(self):
+        q = DateQueueThreading(timeout=5)
+        values = []
+
+        consumer = threading.Thread(target=lambda: values.append(q.get(2)))
+        consumer.start()
+        q.put([1, 'a'])
+        q.put([2, 'b'])
+        consumer.join()
+
+        self.assertEqual(values, ['b'])
+        self.assertEqual(q.qsize(), 1)
+
+    def test_maxsize(self):
+        q = DateQueueThreading(maxsize=2, timeout=5)
+        q.put([1, 'a'])
+        q.put([2, 'b'])
+
+        with self.assertRaises(Full):
+            q.put([3, 'c'], block=False)
+
+        producer = threading.Thread(target=q.put, args=([3, 'c'],))
+        producer.start()
+        self.assertEqual(q.get(1), 'a')
+        producer.join()
+
+        self.assertEqual(q.qsize(), 2)
+        self.assertEqual(q.get(3), 'c')
+
+
+class TestQueueCleaner(unittest.TestCase):
+
+    def test_deprecated(self):
+        q = {'air_temp': DateQueueThreading(consumers=1)}
+        q['air_temp'].put([1, 'a'])
+
+        with self.assertWarns(DeprecationWarning):
+            cleaner = QueueCleaner([1], q)
+
+        cleaner.start()
+        cleaner.join()
+
+        self.assertEqual(q['air_temp'].qsize(), 1)
@@ -0,0 +1,75 @@
+import threading
+import unittest
+
+import pandas as pd
+
+from smrf.utils.timing import Timing
+
+
+class TestTiming(unittest.TestCase):
+
+    def setUp(self):
+        self.timing = Timing()
+        self.time_step = pd.Timestamp('2020-01-01 00:00')
+
+    def test_nested_time_step(self):
+        with self.timing.time('distribute', 'air_temp', self.time_step):
+            with self.timing.time('interpolation', 'air_temp'):
+                pass
+
+        with self.timing.time('output', 'air_temp'):
+            pass
+
+        records = self.timing.records
+        self.assertEqual(
+            [r['stage'] for r in records],
+            ['interpolation', 'distribute', 'output'])
+        self.assertEqual(records[0]['time_step'], self.time_step)
+        self.assertEqual(records[1]['time_step'], self.time_step)
+        self.assertIsNone(records[2]['time_step'])
+        self.assertEqual(records[0]['thread'], 'MainThread')
+
+    def test_threads(self):
+
+        def target():
+            with self.timing.time('distribute', 'thermal', self.time_step):
+                pass
+
+        thread = threading.Thread(target=target, name='thermal')
+        thread.start()
+        thread.join()
+
+        self.assertEqual(self.timing.records[0]['thread'], 'thermal')
+
+    def test_disabled(self):
+        timing = Timing(enabled=False)
+
+        with timing.time('distribute', 'air_temp', self.time_step):
+            pass
+
+        self.assertEqual(timing.records, [])
+
+    def test_summary(self):
+        for seconds in [1, 2, 3, 4]:
+            self.timing.add('distribute', 'air_temp', None, seconds)
+        self.timing.add('output', 'air_temp', None, 20)
+
+        summary = self.timing.summary()
+
+        self.assertEqual(list(summary['stage']), ['output', 'distribute'])
+
+        row = summary.iloc[1]
+        self.assertEqual(row['count'], 4)
+        self.assertEqual(row['total'], 10)
+        self.assertEqual(row['mean'], 2.5)
+        self.assertEqual(row['p50'], 2.5)
+        self.assertEqual(row['max'], 4)
+
+    def test_totals(self):
+        for seconds in [1, 2, 3]:
+            self.timing.add('distribute', 'air_temp', None, seconds)
+        self.timing.add('distribute', 'precip', None, 5)
+        self.timing.add('output', 'air_temp', None, 20)
+
+        self.assertEqual(
+            self.timing.totals('distribute'), {'air_temp': 6, 'precip': 5})
@@ -0,0 +1,461 @@
+"""
+The module :mod:`~smrf.utils.benchmark` runs SMRF end to end over synthetic
+basins of any size to measure how a run scales with the grid size, the
+number of stations and the number of time steps. Each benchmark case
+generates a topo, maxus and station data, runs
+:func:`~smrf.framework.model_framework.run_smrf` in a separate process and
+reports the time steps per second and the peak resident memory of the run.
+
+Example:
+    >>> report = run_benchmark(
+    ...     '/tmp/benchmark', sizes=[(100, 100), (200, 200)],
+    ...     distributions=['idw', 'dk'], modes=['serial', 'threaded'])
+    >>> report.to_csv('benchmark.csv')
+
+"""
+
+import itertools
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+import netCDF4 as nc
+import numpy as np
+import pandas as pd
+import utm
+
+# UTM zone 11 coordinates of the synthetic basins
+ORIGIN_X = 519000.0
+ORIGIN_Y = 4767000.0
+ZONE_NUMBER = 11
+
+SPATIAL_REF = (
+    'PROJCS["WGS 84 / UTM zone 11N",GEOGCS["WGS 84",DATUM["WGS_1984",'
+    'SPHEROID["WGS 84",6378137,298.257223563,AUTHORITY["EPSG","7030"]],'
+    'AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,'
+    'AUTHORITY["EPSG","8901"]],UNIT["degree",0.0174532925199433,'
+    'AUTHORITY["EPSG","9122"]],AUTHORITY["EPSG","4326"]],'
+    'PROJECTION["Transverse_Mercator"],'
+    'PARAMETER["latitude_of_origin",0],PARAMETER["central_meridian",-117],'
+    'PARAMETER["scale_factor",0.9996],PARAMETER["false_easting",500000],'
+    'PARAMETER["false_northing",0],UNIT["metre",1,AUTHORITY["EPSG","9001"]],'
+    'AXIS["Easting",EAST],AXIS["Northing",NORTH],'
+    'AUTHORITY["EPSG","32611"]]')
+
+VEG_TYPES = [3011, 3061, 3123, 3140]
+VEG_HEIGHT = [0.25, 7.5, 17.5, 37.5]
+VEG_K = [0.025, 0.033, 0.04, 0.074]
+VEG_TAU = [0.16, 0.2, 0.3, 0.44]
+
+DISTRIBUTIONS = ['idw', 'dk', 'grid', 'kriging']
+WIND_MODELS = ['interp', 'winstral']
+MODES = ['serial', 'threaded']
+
+CONFIG = """
+[topo]
+filename: {topo}
+
+[time]
+time_step: 60
+start_date: {start_date}
+end_date: {end_date}
+time_zone: utc
+
+[csv]
+air_temp: {station_data}/air_temp.csv
+vapor_pressure: {station_data}/vapor_pressure.csv
+precip: {station_data}/precip.csv
+wind_speed: {station_data}/wind_speed.csv
+wind_direction: {station_data}/wind_direction.csv
+cloud_factor: {station_data}/cloud_factor.csv
+metadata: {station_data}/metadata.csv
+
+[air_temp]
+distribution: {distribution}
+
+[vapor_pressure]
+distribution: {distribution}
+
+[wind]
+wind_model: {wind_model}
+distribution: {distribution}
+maxus_netcdf: {maxus}
+
+[precip]
+distribution: {distribution}
+
+[albedo]
+
+[cloud_factor]
+distribution: {distribution}
+
+[solar]
+
+[thermal]
+
+[soil_temp]
+
+[output]
+out_location: {out_location}
+input_backup: False
+
+[system]
+log_file: {out_location}/log.txt
+threading: {threading}
+time_out: 300
+"""
+
+
+def synthetic_topo(filename, nx, ny, dx=50.0, seed=0):
+    """
+    Write a synthetic topo with rolling hills, a basin mask and vegetation
+
+    Args:
+        filename (str): topo netcdf file to write
+        nx (int): number of columns
+        ny (int): number of rows
+        dx (float, optional): grid spacing in meters. Defaults to 50.
+        seed (int, optional): random seed. Defaults to 0.
+
+    Returns:
+        tuple: x, y, dem and mask of the topo
+    """
+
+    rng = np.random.RandomState(seed)
+
+    x = ORIGIN_X + dx * np.arange(nx)
+    y = ORIGIN_Y + dx * np.arange(ny)
+    X, Y = np.meshgrid(np.linspace(0, 1, nx), np.linspace(0, 1, ny))
+
+    dem = 2000 + 300 * X + 200 * Y
+    for _ in range(5):
+        cx, cy = rng.uniform(0, 1, 2)
+        width = rng.uniform(0.1, 0.3)
+        dem += rng.uniform(100, 400) * \
+            np.exp(-((X - cx)**2 + (Y - cy)**2) / (2 * width**2))
+
+    mask = ((X - 0.5)**2 + (Y - 0.5)**2 < 0.2).astype(np.float32)
+
+    veg = rng.randint(0, len(VEG_TYPES), size=(ny, nx))
+
+    images = {
+        'dem': dem,
+        'mask': mask,
+        'veg_type': np.array(VEG_TYPES)[veg],
+        'veg_height': np.array(VEG_HEIGHT)[veg],
+        'veg_k': np.array(VEG_K)[veg],
+        'veg_tau': np.array(VEG_TAU)[veg],
+    }
+
+    with nc.Dataset(filename, 'w') as f:
+        f.createDimension('y', ny)
+        f.createDimension('x', nx)
+
+        f.createVariable('y', 'f4', ('y',))[:] = y
+        f.createVariable('x', 'f4', ('x',))[:] = x
+
+        for name, image in images.items():
+            v = f.createVariable(name, 'f4', ('y', 'x'))
+            v.grid_mapping = 'projection'
+            v[:] = image
+
+        projection = f.createVariable('projection', 'S1')
+        projection.utm_zone_number = ZONE_NUMBER
+        projection.grid_mapping_name = 'universal_transverse_mercator'
+        projection.semi_major_axis = 6378137.0
+        projection.inverse_flattening = 298.257223563
+        projection.spatial_ref = SPATIAL_REF
+
+    return x, y, dem, mask
+
+
+def synthetic_maxus(filename, x, y, dem):
+    """
+    Write a synthetic maxus library from the slope of the dem in each wind
+    direction. The values have the range of a real library but are not an
+    upwind search like :mod:`smrf.utils.wind.model`, which is too slow for
+    large benchmark grids.
+
+    Args:
+        filename (str): maxus netcdf file to write
+        x (array): x coordinates
+        y (array): y coordinates
+        dem (array): dem
+    """
+
+    dx = np.mean(np.diff(x))
+    dz_dy, dz_dx = np.gradient(dem, dx)
+    directions = np.arange(0, 360, 5)
+
+    with nc.Dataset(filename, 'w') as f:
+        f.createDimension('Direction', len(directions))
+        f.createDimension('y', len(y))
+        f.createDimension('x', len(x))
+
+        f.createVariable('direction', 'i4', ('Direction',))[:] = directions
+        f.createVariable('y', 'f4', ('y',))[:] = y
+        f.createVariable('x', 'f4', ('x',))[:] = x
+
+        maxus = f.createVariable('maxus', 'f4', ('Direction', 'y', 'x'))
+        for i, d in enumerate(np.radians(directions)):
+            # slope facing into the wind coming from direction d
+            slope = dz_dx * np.sin(d) + dz_dy * np.cos(d)
+            maxus[i, :] = np.clip(np.degrees(np.arctan(slope)), -15, 18)
+
+
+def synthetic_stations(location, x, y, dem, mask, n_stations, start_date,
+                       time_steps, seed=0):
+    """
+    Write station metadata and hourly station data for stations in the
+    corners of the domain and randomly placed in the mask. Air temperature
+    follows a diurnal cycle and the lapse rate, the other variables vary
+    randomly about typical values.
+
+    Args:
+        location (str): directory to write the csv files to
+        x (array): x coordinates
+        y (array): y coordinates
+        dem (array): dem
+        mask (array): basin mask
+        n_stations (int): number of stations
+        start_date (str): first time step
+        time_steps (int): number of hourly time steps
+        seed (int, optional): random seed. Defaults to 0.
+    """
+
+    rng = np.random.RandomState(seed)
+
+    dx = np.mean(np.diff(x))
+    rows, cols = np.argwhere(mask)[
+        rng.randint(0, int(mask.sum()), n_stations)].T
+
+    # offset from the cell centers as a station on a cell center is
+    # distributed with an infinite weight by idw
+    offset_x = rng.uniform(-0.4, 0.4, n_stations)
+    offset_y = rng.uniform(-0.4, 0.4, n_stations)
+
+    # the first stations are in the corners, just outside of the cell
+    # centers so the grid distribution covers the whole domain
+    corners = min(n_stations, 4)
+    rows[:corners] = [0, 0, len(y) - 1, len(y) - 1][:corners]
+    cols[:corners] = [0, len(x) - 1, 0, len(x) - 1][:corners]
+    offset_x[:corners] = [-0.4, 0.4, -0.4, 0.4][:corners]
+    offset_y[:corners] = [-0.4, -0.4, 0.4, 0.4][:corners]
+
+    stations = ['STA{:04d}'.format(i) for i in range(n_stations)]
+
+    metadata = pd.DataFrame({
+        'primary_id': stations,
+        'elevation': dem[rows, cols],
+        'utm_x': x[cols] + offset_x * dx,
+        'utm_y': y[rows] + offset_y * dx,
+        'zone': ZONE_NUMBER
+    })
+    metadata['latitude'], metadata['longitude'] = zip(*[
+        utm.to_latlon(sx, sy, ZONE_NUMBER, northern=True)
+        for sx, sy in zip(metadata['utm_x'], metadata['utm_y'])])
+    metadata.to_csv(os.path.join(location, 'metadata.csv'), index=False)
+
+    date_time = pd.date_range(start_date, periods=time_steps, freq='H')
+    hour = date_time.hour.values[:, np.newaxis]
+    shape = (time_steps, n_stations)
+    elevation = metadata['elevation'].values
+
+    air_temp = 5 + 8 * np.sin(2 * np.pi * (hour - 15) / 24) - \
+        0.0065 * (elevation - 2000) + rng.normal(0, 0.5, shape)
+
+    # relative humidity of the saturation vapor pressure
+    saturation = 611 * np.exp(17.27 * air_temp / (air_temp + 237.3))
+
+    data = {
+        'air_temp': air_temp,
+        'vapor_pressure': rng.uniform(0.4, 0.9, shape) * saturation,
+        'precip': np.where(rng.uniform(size=shape) < 0.3,
+                           rng.uniform(0, 2, shape), 0),
+        'wind_speed': rng.uniform(1, 8, shape),
+        'wind_direction': rng.uniform(0, 360, shape),
+        'cloud_factor': rng.uniform(0.3, 1, shape),
+    }
+
+    for variable, values in data.items():
+        df = pd.DataFrame(values, index=date_time, columns=stations)
+        df.index.name = 'date_time'
+        df.to_csv(os.path.join(location, '{}.csv'.format(variable)))
+
+
+def synthetic_basin(location, nx, ny, n_stations=10, time_steps=24,
+                    start_date='2020-04-01 12:00', dx=50.0, seed=0):
+    """
+    Generate the topo, maxus and station data of a synthetic basin
+
+    Args:
+        location (str): directory for the basin
+        nx (int): number of columns
+        ny (int): number of rows
+        n_stations (int, optional): number of stations. Defaults to 10.
+        time_steps (int, optional): number of hourly time steps. Defaults
+            to 24.
+        start_date (str, optional): first time step in UTC. Defaults to
+            2020-04-01 12:00.
+        dx (float, optional): grid spacing in meters. Defaults to 50.
+        seed (int, optional): random seed. Defaults to 0.
+
+    Returns:
+        dict: topo and maxus files, station data directory and the dates of
+            the basin
+    """
+
+    station_data = os.path.join(location, 'station_data')
+    os.makedirs(station_data, exist_ok=True)
+
+    basin = {
+        'topo': os.path.join(location, 'topo.nc'),
+        'maxus': os.path.join(location, 'maxus.nc'),
+        'station_data': station_data,
+        'start_date': pd.Timestamp(start_date),
+        'end_date': pd.Timestamp(start_date) +
+        pd.Timedelta(hours=time_steps - 1)
+    }
+
+    x, y, dem, mask = synthetic_topo(
+        basin['topo'], nx, ny, dx=dx, seed=seed)
+    synthetic_maxus(basin['maxus'], x, y, dem)
+    synthetic_stations(station_data, x, y, dem, mask, n_stations,
+                       start_date, time_steps, seed=seed)
+
+    return basin
+
+
+def benchmark_config(basin, out_location, distribution='idw',
+                     wind_model='interp', mode='serial'):
+    """
+    Write the config file for a benchmark case
+
+    Args:
+        basin (dict): basin from
+            :func:`~smrf.utils.benchmark.synthetic_basin`
+        out_location (str): output directory for the case
+        distribution (str, optional): distribution method for the station
+            data. Defaults to idw.
+        wind_model (str, optional): wind model. Defaults to interp.
+        mode (str, optional): serial or threaded. Defaults to serial.
+
+    Returns:
+        str: path to the config file
+    """
+
+    os.makedirs(out_location, exist_ok=True)
+
+    config_file = os.path.join(out_location, 'config.ini')
+    with open(config_file, 'w') as f:
+        f.write(CONFIG.format(
+            distribution=distribution,
+            wind_model=wind_model,
+            threading=mode == 'threaded',
+            out_location=out_location,
+            **basin))
+
+    return config_file
+
+
+def run_case(config_file):
+    """
+    Run SMRF for a benchmark case, meant to be run in a new process so the
+    peak memory is only for the case
+
+    Args:
+        config_file (str): config file for the case
+
+    Returns:
+        dict: number of time steps, seconds and peak resident memory in MB
+            of the run
+    """
+
+    from smrf.framework.model_framework import run_smrf
+
+    start = perf_counter()
+    s = run_smrf(config_file, external_logger=logging.getLogger(__name__))
+    seconds = perf_counter() - start
+
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss /= 1024**2 if sys.platform == 'darwin' else 1024
+
+    return {
+        'time_steps': len(s.date_time),
+        'seconds': seconds,
+        'peak_rss_mb': peak_rss
+    }
+
+
+def run_benchmark(location, sizes=((100, 100),), n_stations=10,
+                  time_steps=24, distributions=DISTRIBUTIONS,
+                  wind_models=WIND_MODELS, modes=MODES):
+    """
+    Run every combination of basin size, distribution method, wind model
+    and mode. Each case is run in a new process.
+
+    Args:
+        location (str): directory for the basins and case outputs
+        sizes (list, optional): (nx, ny) of each basin. Defaults to a 100 by
+            100 basin.
+        n_stations (int, optional): number of stations. Defaults to 10.
+        time_steps (int, optional): number of hourly time steps. Defaults
+            to 24.
+        distributions (list, optional): distribution methods. Defaults to
+            :py:attr:`DISTRIBUTIONS`.
+        wind_models (list, optional): wind models. Defaults to
+            :py:attr:`WIND_MODELS`.
+        modes (list, optional): serial and/or threaded. Defaults to
+            :py:attr:`MODES`.
+
+    Returns:
+        pandas.DataFrame: a row for each case with the time steps per
+            second and peak resident memory
+    """
+
+    log = logging.getLogger(__name__)
+
+    results = []
+    for nx, ny in sizes:
+        basin_location = os.path.join(location, 'basin_{}x{}'.format(nx, ny))
+        basin = synthetic_basin(
+            basin_location, nx, ny, n_stations=n_stations,
+            time_steps=time_steps)
+
+        for distribution, wind_model, mode in itertools.product(
+                distributions, wind_models, modes):
+
+            case = {
+                'nx': nx,
+                'ny': ny,
+                'stations': n_stations,
+                'distribution': distribution,
+                'wind_model': wind_model,
+                'mode': mode
+            }
+            log.info('Benchmark case {}'.format(case))
+
+            config_file = benchmark_config(
+                basin,
+                os.path.join(basin_location, '{}_{}_{}'.format(
+                    distribution, wind_model, mode)),
+                distribution=distribution,
+                wind_model=wind_model,
+                mode=mode)
+
+            with ProcessPoolExecutor(
+                    max_workers=1,
+                    mp_context=multiprocessing.get_context('spawn')
+            ) as executor:
+                case.update(executor.submit(run_case, config_file).result())
+
+            case['time_steps_per_second'] = \
+                case['time_steps'] / case['seconds']
+            results.append(case)
+
+    return pd.DataFrame(results)
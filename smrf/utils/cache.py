@@ -0,0 +1,344 @@
+import glob
+import hashlib
+import logging
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def mask_key(mask):
+    """Hashable key of a boolean mask, i.e. the stations with data
+
+    Args:
+        mask (np.ndarray): boolean mask
+
+    Returns:
+        bytes: key of the mask
+    """
+
+    return np.asarray(mask, dtype=bool).tobytes()
+
+
+def hash_key(*parts):
+    """Hash of arrays and values, i.e. the topo, station locations and
+    interpolation options that determine the interpolation weights
+
+    Args:
+        parts: numpy arrays, dicts or values with a stable repr
+
+    Returns:
+        str: hex digest of the parts
+    """
+
+    h = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            part = np.ascontiguousarray(part)
+            h.update(repr((part.dtype.str, part.shape)).encode())
+            h.update(part.tobytes())
+        elif isinstance(part, dict):
+            h.update(repr(sorted(part.items())).encode())
+        else:
+            h.update(repr(part).encode())
+
+    return h.hexdigest()
+
+
+class LRUCache():
+    """
+    Least recently used cache of calculated values, like interpolation
+    weights for the stations with data. Once ``maxsize`` values are cached
+    the least recently used value is removed. The cache can be shared
+    between threads, a value may be calculated twice when two threads miss
+    at once.
+
+    Args:
+        maxsize (int): number of values to keep
+
+    Attributes:
+        hits: number of values found in the cache
+        misses: number of values calculated
+    """
+
+    def __init__(self, maxsize=8):
+        self.maxsize = maxsize
+        self.values = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def get(self, key, function, *args):
+        """
+        Get the value for the key, calculating it with ``function(*args)``
+        when not in the cache
+
+        Args:
+            key: hashable key of the value
+            function (callable): calculates the value
+            args: arguments to the function
+
+        Returns:
+            the cached or calculated value
+        """
+
+        with self._lock:
+            if key in self.values:
+                self.hits += 1
+                self.values.move_to_end(key)
+                return self.values[key]
+
+            self.misses += 1
+
+        value = function(*args)
+
+        with self._lock:
+            self.values[key] = value
+
+            if len(self.values) > self.maxsize:
+                self.values.popitem(last=False)
+
+        return value
+
+    def clear(self):
+        """Remove all the cached values"""
+        with self._lock:
+            self.values.clear()
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, key):
+        return key in self.values
+
+
+class PlanRegistry():
+    """
+    Interpolation plans, like an :mod:`smrf.spatial.idw.IDW` instance and
+    its weights, shared by the distribute modules. Modules that distribute
+    the same stations over the same topo with the same distribution method
+    and options get the same plan instead of each calculating and keeping
+    a copy of the weights.
+
+    Attributes:
+        plans: plan by key
+        hits: number of plans shared with another module
+        misses: number of plans created
+    """
+
+    def __init__(self):
+        self.plans = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, function, *args):
+        """
+        Get the plan for the key, creating it with ``function(*args)`` for
+        the first module
+
+        Args:
+            key (str): key of the plan
+            function (callable): creates the plan
+            args: arguments to the function
+
+        Returns:
+            the shared plan
+        """
+
+        if key in self.plans:
+            self.hits += 1
+            return self.plans[key]
+
+        self.misses += 1
+        plan = function(*args)
+        self.plans[key] = plan
+
+        return plan
+
+    def __len__(self):
+        return len(self.plans)
+
+    def __contains__(self, key):
+        return key in self.plans
+
+
+class StaticFields():
+    """
+    Derived fields that do not change over the run, like the optical depth
+    over the DEM or the vegetation transmissivity terms. The distribute
+    modules declare the fields when initializing, each field is calculated
+    once for the first module and shared with the others. The arrays are
+    made read only so a module can not change the field of another.
+
+    Attributes:
+        fields: field by key
+        hits: number of fields shared with another module
+        misses: number of fields calculated
+    """
+
+    def __init__(self):
+        self.fields = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, function, *args):
+        """
+        Get the field for the key, calculating it with ``function(*args)``
+        for the first module
+
+        Args:
+            key (str): key of the field
+            function (callable): calculates the field, an array or a tuple
+                of arrays
+            args: arguments to the function
+
+        Returns:
+            the shared field
+        """
+
+        if key in self.fields:
+            self.hits += 1
+            return self.fields[key]
+
+        self.misses += 1
+        field = function(*args)
+
+        for value in field if isinstance(field, tuple) else (field,):
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+
+        self.fields[key] = field
+
+        return field
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __contains__(self, key):
+        return key in self.fields
+
+
+class WeightStore():
+    """
+    Store of calculated values, like interpolation weights, kept on disk
+    between runs. Each value is pickled to a file named by the key, which is
+    usually a :func:`hash_key` of everything the value is calculated from.
+    Once the files are larger than ``max_size`` the least recently used
+    files are removed. Writes are atomic so processes can share the store.
+
+    Args:
+        location (str): directory of the store
+        max_size (int): maximum size of the store in MB
+
+    Attributes:
+        hits: number of values loaded from the store
+        misses: number of values calculated
+    """
+
+    def __init__(self, location, max_size=1024):
+        self.location = location
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        self._logger = logging.getLogger(__name__)
+
+        os.makedirs(location, exist_ok=True)
+
+    def path(self, key):
+        """File of the value for the key"""
+        return os.path.join(self.location, '{}.pkl'.format(key))
+
+    def get(self, key, function, *args):
+        """
+        Load the value for the key, calculating and storing it with
+        ``function(*args)`` when not in the store
+
+        Args:
+            key (str): key of the value
+            function (callable): calculates the value
+            args: arguments to the function
+
+        Returns:
+            the stored or calculated value
+        """
+
+        path = self.path(key)
+
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+
+            # the modified time orders the files for removal
+            os.utime(path)
+            self.hits += 1
+            self._logger.debug('Loaded {} from the weight store'.format(key))
+            return value
+
+        except FileNotFoundError:
+            pass
+
+        except (EOFError, pickle.UnpicklingError):
+            self._logger.warning(
+                'Could not load {} from the weight store'.format(key))
+
+        self.misses += 1
+        value = function(*args)
+        self.put(key, value)
+
+        return value
+
+    def put(self, key, value):
+        """
+        Store the value for the key
+
+        Args:
+            key (str): key of the value
+            value: picklable value
+        """
+
+        path = self.path(key)
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used values until the store is smaller
+        than ``max_size``, the most recent value is always kept"""
+
+        files = []
+        for path in glob.glob(os.path.join(self.location, '*.pkl')):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        files.sort()
+        size = sum(f[1] for f in files)
+
+        for mtime, file_size, path in files[:-1]:
+            if size <= self.max_size * 1024**2:
+                break
+
+            try:
+                os.remove(path)
+                self._logger.debug('Removed {} from the weight store'.format(
+                    os.path.basename(path)))
+            except FileNotFoundError:
+                pass
+            size -= file_size
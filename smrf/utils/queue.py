@@ -7,198 +7,187 @@ Create classes for running on multiple threads
 import logging
 import sys
 import threading
-from queue import Empty, Full, Queue
-from time import time as _time
+import warnings
+from queue import Empty, Full
 
 import numpy as np
 
+from smrf.utils.timing import Timing
 
-class DateQueueThreading(Queue):
+
+class DateSlot():
+    """
+    Holds the value for a single date time in a
+    :mod:`~smrf.utils.queue.DateQueueThreading`. The event is set once the
+    value has been put so only the consumers waiting on that date time are
+    woken.
+
+    Args:
+        consumers: number of consumers that will get or release the value
     """
-    DateQueue extends queue.Queue module
-    Stores the items in a dictionary with date_time keys
-    When values are retrieved, it will not remove them and will
-    require cleaning at the end to not have to many values
 
-    20160323 Scott Havens
+    def __init__(self, consumers):
+        self.event = threading.Event()
+        self.value = None
+        self.consumers = consumers
+
+
+class DateQueueThreading():
+    """
+    Stores a value for each date time in a :mod:`~smrf.utils.queue.DateSlot`.
+    Every value is read by a known number of consumers and is released as
+    soon as the last consumer has read it. A value that has no consumers is
+    not stored.
+
+    Producers will block while ``maxsize`` values are stored and waiting to
+    be read.
+
+    Args:
+        maxsize: maximum number of values stored at once, 0 is no limit
+        timeout: seconds to wait on a get or put, None is forever
+        name: name of the queue for logging
+        consumers: number of consumers that will get or release each value
+        dtype: floating point arrays are stored as this type, None stores
+            the value as is
     """
 
-    def __init__(self, maxsize=0, timeout=None, name=None):
-        # extend the base class
-        Queue.__init__(self, maxsize)
+    def __init__(self, maxsize=0, timeout=None, name=None, consumers=1,
+                 dtype=None):
+        self.maxsize = maxsize
         self.timeout = timeout
-        logger_name = __name__
+        self.consumers = consumers
         self.name = name
+        self.dtype = dtype
+
+        logger_name = __name__
         if name is not None:
             logger_name = '{}.{}'.format(logger_name, name)
 
         self._logger = logging.getLogger(logger_name)
 
-    # The following override the methods in Queue to use
-    # a date approach to the queue
+        self.mutex = threading.Lock()
+        self.not_full = threading.Condition(self.mutex)
 
-    # Initialize the queue representation
-    def _init(self, maxsize):
+        # slots for each date time and the number of values being held
         self.queue = {}
+        self.stored = 0
 
-    def _qsize(self, len=len):
-        return len(self.queue)
+    def qsize(self):
+        """Number of values stored and waiting to be read"""
+        with self.mutex:
+            return self.stored
 
-    # Put a new item in the queue
-    def _put(self, item):
-        # self.queue.append(item)
-        self.queue.update({item[0]: item[1]})
-
-    # Get an item from the queue
-    def _get(self, index):
+    def _slot(self, index):
+        """Get or create the slot for a date time, must hold the mutex"""
+        if index not in self.queue:
+            self.queue[index] = DateSlot(self.consumers)
         return self.queue[index]
 
-    def clean(self, index):
-        """
-        Need to clean it out so mimic the original get
-        """
-        self.not_empty.acquire()
-        try:
-            if index in self.queue:
-                del self.queue[index]
-                self.not_full.notifyAll()
-        finally:
-            self.not_empty.release()
+    def _consume(self, index, slot):
+        """Remove a consumer from the slot and release the value once all
+        consumers are done, must hold the mutex. A slot released by all
+        consumers before the value is put is kept so the put is dropped."""
+        slot.consumers -= 1
+        if slot.consumers <= 0 and slot.event.is_set():
+            del self.queue[index]
+            self.stored -= 1
+            self.not_full.notify()
 
     def get(self, index, block=True, timeout=None):
         """
-        Remove and return an item from the queue.
-
-        If optional args 'block' is true and 'timeout' is None (the default),
-        block if necessary until an item is available. If 'timeout' is
-        a non-negative number, it blocks at most 'timeout' seconds and raises
-        the Empty exception if no item was available within that time.
-        Otherwise ('block' is false), return an item if one is immediately
-        available, else raise the Empty exception ('timeout' is ignored
-        in that case).
-
-        This is from queue.Queue but with modifcation for supplying what to get
+        Return the value for a date time, blocking until it has been put. The
+        value is released once all the consumers have read it.
 
         Args:
             index: datetime object representing the date/time being processed
-            block: whether to wait for a variable to become available
+            block: whether to wait for the value to become available
             timeout: Seconds to wait before dropping error, none is forever.
         """
-        timed_out = False
-        # see if timeout was passed
-        if timeout is not None:
-            self.timeout = timeout
 
-        self.not_empty.acquire()
+        if timeout is None:
+            timeout = self.timeout
 
-        try:
-            if not block:
-                if not self._qsize():
-                    raise Empty
+        with self.mutex:
+            slot = self._slot(index)
 
-            # No timeout specified.
-            elif self.timeout is None:
-                while index not in self.queue.keys():
-                    self.not_empty.wait()
+        if not block and not slot.event.is_set():
+            raise Empty
 
-            #  Timeout in seconds was specified
-            else:
-                endtime = _time() + self.timeout
-
-                while index not in self.queue.keys():
-                    self.remaining = endtime - _time()
-                    # Time out has occurred
-                    if self.remaining <= 0.0:
-                        self._logger.error(
-                            "Timeout occurred while retrieving"
-                            " an item at {} from queue".format(index))
-                        timed_out = True
-                        raise Empty
+        if not slot.event.wait(timeout):
+            self._logger.error(
+                "Timeout occurred while retrieving"
+                " an item at {} from queue".format(index))
+            sys.exit()
 
-                    self.not_empty.wait(self.remaining)
+        with self.mutex:
+            self._consume(index, slot)
 
-            item = self._get(index)
+        return slot.value
 
-            self.not_full.notifyAll()
-            return item
+    def release(self, index):
+        """
+        Release the value for a date time without reading it, for consumers
+        that skip a date time
 
-        except Exception as e:
-            self._logger.error(e)
+        Args:
+            index: datetime object representing the date/time being processed
+        """
 
-        finally:
-            self.not_empty.release()
-            if timed_out:
-                sys.exit()
+        with self.mutex:
+            self._consume(index, self._slot(index))
 
     def put(self, item, block=True, timeout=None):
-        """Put an item into the queue.
-
-        If optional args 'block' is true and 'timeout' is None (the default),
-        block if necessary until a free slot is available. If 'timeout' is
-        a non-negative number, it blocks at most 'timeout' seconds and raises
-        the Full exception if no free slot was available within that time.
-        Otherwise ('block' is false), put an item on the queue if a free slot
-        is immediately available, else raise the Full exception ('timeout'
-        is ignored in that case).
         """
-        timed_out = False
-
-        # see if timeout was passed
-        timeout = None
-        if timeout is not None:
-            self.timeout = timeout
-
-        self.not_full.acquire()
+        Put the value for a date time into the queue, blocking while
+        ``maxsize`` values are stored.
 
-        try:
-            # Is there anything in the Queue
-            if self.maxsize > 0:
-
-                # Working with a thread set to block other threads
-                # until complete
-                if not block:
-                    if self._qsize() == self.maxsize:
-                        raise Full
+        Args:
+            item: list of the date time and value
+            block: whether to wait for a free slot
+            timeout: Seconds to wait before dropping error, none is forever.
+        """
 
-                # Never timeout
-                elif self.timeout is None:
-                    while self._qsize() == self.maxsize:
-                        self.not_full.wait()
+        index, value = item
 
-                # Timeout is set
-                else:
-                    endtime = _time() + self.timeout
+        if self.dtype is not None and isinstance(value, np.ndarray) and \
+                value.dtype.kind == 'f':
+            value = value.astype(self.dtype, copy=False)
 
-                    while self._qsize() == self.maxsize:
-                        self.remaining = endtime - _time()
+        if timeout is None:
+            timeout = self.timeout
 
-                        if self.remaining <= 0.0:
-                            self._logger.error(
-                                "Timeout occurred while putting"
-                                " {} in the queue.".format(item[0]))
-                            timed_out = True
-                            raise Full
+        with self.not_full:
+            slot = self._slot(index)
 
-                        self.not_full.wait(self.remaining)
-            self._put(item)
+            # nothing will read the value
+            if slot.consumers <= 0:
+                del self.queue[index]
+                return
 
-            self.unfinished_tasks += 1
-            self.not_empty.notifyAll()
+            if self.maxsize > 0:
+                if not block and self.stored >= self.maxsize:
+                    raise Full
 
-        except Exception as e:
-            self._logger.error(e)
+                if not self.not_full.wait_for(
+                        lambda: self.stored < self.maxsize, timeout):
+                    self._logger.error(
+                        "Timeout occurred while putting"
+                        " {} in the queue.".format(index))
+                    sys.exit()
 
-        finally:
-            self.not_full.release()
-            if timed_out:
-                sys.exit()
+            slot.value = value
+            self.stored += 1
+            slot.event.set()
 
 
 class QueueCleaner(threading.Thread):
     """
-    QueueCleaner that will go through all the queues and check
-    if they all have a date in common.  When this occurs, all the
-    threads will have processed that time step and it's not longer needed
+    Deprecated, the values in a
+    :mod:`~smrf.utils.queue.DateQueueThreading` are released once all the
+    consumers have read them. Threads outside of SMRF that read the values
+    are counted with the ``consumers`` argument of
+    :func:`~smrf.framework.model_framework.SMRF.create_distributed_threads`.
+    The thread does nothing.
     """
 
     def __init__(self, date_time, queue):
@@ -208,31 +197,13 @@ class QueueCleaner(threading.Thread):
             queue: dict of the queue
         """
         threading.Thread.__init__(self, name='cleaner')
-        self.queues = queue
-        self.date_time = date_time
-        lname = "{}.{}".format(__name__, 'clean')
-        self._logger = logging.getLogger(lname)
-        self._logger.debug('Initialized cleaner thread')
+        warnings.warn(
+            'QueueCleaner is deprecated and does nothing, count the threads '
+            'reading the queues with the consumers argument of '
+            'create_distributed_threads', DeprecationWarning, stacklevel=2)
 
     def run(self):
-        """
-        Go through the date times and look for when all the queues
-        have that date_time
-        """
-
-        for t in self.date_time:
-
-            # first do a get on all the data, this will ensure that
-            # there is data there to be had
-            for v in self.queues.keys():
-                self.queues[v].get(t)
-
-            # now that we know there is data in all of the queues
-            # that have the same time, clean up those times
-            for v in self.queues.keys():
-                self.queues[v].clean(t)
-
-            self._logger.debug('%s Cleaned from queues' % t)
+        pass
 
 
 class QueueOutput(threading.Thread):
@@ -240,11 +211,17 @@ class QueueOutput(threading.Thread):
     Takes values from the queue and outputs using 'out_func'
     """
 
-    def __init__(self, queue, date_time, out_func, out_frequency, nx, ny):
+    def __init__(self, queue, date_time, out_func, out_frequency, nx, ny,
+                 timing=None, start_index=0):
         """
         Args:
             date_time: array of date_time
             queue: dict of the queue
+            timing: :mod:`~smrf.utils.timing.Timing` to record the wall time
+                of each output, optional
+            start_index: index of the first date_time in the full run, the
+                output frequency is counted from the start of the full run
+                when restarting from a checkpoint
         """
 
         threading.Thread.__init__(self, name='output')
@@ -254,6 +231,8 @@ class QueueOutput(threading.Thread):
         self.out_frequency = out_frequency
         self.nx = nx
         self.ny = ny
+        self.timing = timing if timing is not None else Timing(enabled=False)
+        self.start_index = start_index
         lname = "{}.{}".format(__name__, 'output')
         self._logger = logging.getLogger(lname)
         self._logger.debug('Initialized output thread')
@@ -269,7 +248,8 @@ class QueueOutput(threading.Thread):
         for output_count, t in enumerate(self.date_time):
 
             # output at the frequency and the last time step
-            if (output_count % self.out_frequency == 0) or \
+            if ((self.start_index + output_count) %
+                    self.out_frequency == 0) or \
                (output_count == len(self.date_time)):
 
                 # get the output variables then pass to the function
@@ -284,14 +264,18 @@ class QueueOutput(threading.Thread):
                         self._logger.debug(
                             "{} threaded output for {}".format(
                                 t, v['variable']))
-                        self.out_func.output(v['variable'], data, t)
+                        with self.timing.time('output', v['variable'], t):
+                            self.out_func.output(v['variable'], data, t)
 
                     else:
                         self._logger.warning(
                             '{0} Output variable {1} not in queue'
                             .format(t, v['variable']))
 
-                # put the value into the output queue so clean knows it's done
-                self.queues['output'].put([t, True])
-
                 self._logger.debug('%s Variables output from queues' % t)
+
+            else:
+                # release the time step for the variables not output
+                for v in self.out_func.variable_dict.values():
+                    if v['variable'] in self.queues.keys():
+                        self.queues[v['variable']].release(t)
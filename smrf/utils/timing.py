@@ -0,0 +1,204 @@
+"""
+The module :mod:`~smrf.utils.timing` records the wall time of the stages of
+a SMRF run (sun angle, illumination angle, each distribute module, each
+spatial interpolation and each output) for every time step and thread. The
+records are summarized by percentiles and written to a report at the end of
+:func:`~smrf.framework.model_framework.run_smrf`.
+
+Example:
+    >>> timing = Timing()
+    >>> with timing.time('distribute', 'air_temp', t):
+    ...     s.distribute['air_temp'].distribute(data)
+    >>> timing.summary()
+
+"""
+
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+
+class Timing():
+    """
+    Thread safe recorder of the wall time of the model stages. Timers that
+    are nested within a timer for a time step, like a spatial interpolation
+    within a distribute call, are recorded for the same time step.
+
+    Args:
+        enabled (bool, optional): record the stages. Defaults to True, a
+            disabled recorder only runs the timed code.
+
+    Attributes:
+        records: list of dict with the stage, name, time step, thread and
+            seconds of every timed stage
+    """
+
+    FIELDS = ['stage', 'name', 'time_step', 'thread', 'seconds']
+    PERCENTILES = [50, 90, 99]
+
+    def __init__(self, enabled=True):
+
+        self._logger = logging.getLogger(__name__)
+
+        self.enabled = enabled
+        self.records = []
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def time(self, stage, name=None, time_step=None):
+        """
+        Time the code run within the context
+
+        Args:
+            stage (str): stage of the model, i.e. ``distribute``
+            name (str, optional): name within the stage, i.e. the variable.
+                Defaults to None.
+            time_step (datetime, optional): time step being distributed.
+                Defaults to the time step of the enclosing timer.
+        """
+
+        if not self.enabled:
+            yield
+            return
+
+        outer_time_step = getattr(self._local, 'time_step', None)
+        if time_step is None:
+            time_step = outer_time_step
+        self._local.time_step = time_step
+
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, name, time_step, perf_counter() - start)
+            self._local.time_step = outer_time_step
+
+    def add(self, stage, name, time_step, seconds, thread=None):
+        """
+        Add a record
+
+        Args:
+            stage (str): stage of the model
+            name (str): name within the stage
+            time_step (datetime): time step being distributed
+            seconds (float): wall time of the stage
+            thread (str, optional): thread name. Defaults to the current
+                thread.
+        """
+
+        if thread is None:
+            thread = threading.current_thread().name
+
+        with self._lock:
+            self.records.append({
+                'stage': stage,
+                'name': name,
+                'time_step': time_step,
+                'thread': thread,
+                'seconds': seconds
+            })
+
+    def extend(self, records):
+        """
+        Add the records from another recorder, i.e. from a worker process
+
+        Args:
+            records (list): records to add
+        """
+
+        with self._lock:
+            self.records.extend(records)
+
+    def totals(self, stage):
+        """
+        Total seconds of each name within a stage
+
+        Args:
+            stage (str): stage of the model
+
+        Returns:
+            dict: seconds by name
+        """
+
+        totals = {}
+        with self._lock:
+            for record in self.records:
+                if record['stage'] == stage:
+                    totals[record['name']] = \
+                        totals.get(record['name'], 0.0) + record['seconds']
+
+        return totals
+
+    def to_dataframe(self):
+        """
+        Returns:
+            pandas.DataFrame: a row for every record
+        """
+
+        return pd.DataFrame(self.records, columns=self.FIELDS)
+
+    def summary(self):
+        """
+        Summarize the wall time of each stage and name
+
+        Returns:
+            pandas.DataFrame: count, total, mean, percentiles and maximum
+                seconds for each stage and name, sorted by the total
+        """
+
+        df = self.to_dataframe()
+        df['name'] = df['name'].fillna('')
+
+        summary = []
+        for (stage, name), group in df.groupby(['stage', 'name'], sort=False):
+            seconds = group['seconds'].values
+            row = {
+                'stage': stage,
+                'name': name,
+                'count': len(seconds),
+                'total': seconds.sum(),
+                'mean': seconds.mean()
+            }
+            for p, value in zip(self.PERCENTILES,
+                                np.percentile(seconds, self.PERCENTILES)):
+                row['p{}'.format(p)] = value
+            row['max'] = seconds.max()
+            summary.append(row)
+
+        columns = ['stage', 'name', 'count', 'total', 'mean'] + \
+            ['p{}'.format(p) for p in self.PERCENTILES] + ['max']
+
+        return pd.DataFrame(summary, columns=columns).sort_values(
+            'total', ascending=False).reset_index(drop=True)
+
+    def write(self, out_location):
+        """
+        Write every record to ``timing.csv`` and the summary to
+        ``timing.json`` in the out_location
+
+        Args:
+            out_location (str): directory to write the report to
+
+        Returns:
+            tuple: paths to the csv and json files
+        """
+
+        csv_file = os.path.join(out_location, 'timing.csv')
+        json_file = os.path.join(out_location, 'timing.json')
+
+        self.to_dataframe().to_csv(csv_file, index=False)
+
+        with open(json_file, 'w') as f:
+            json.dump(self.summary().to_dict(orient='records'), f, indent=2)
+
+        self._logger.info('Timing report written to {}'.format(csv_file))
+
+        return csv_file, json_file
@@ -243,8 +243,8 @@ def backup_input(data, config_obj):
         backup_config_obj.cfg['csv'][k] = fname
 
     # Copy topo files over to backup
-    ignore = ['northern_hemisphere',
-              'gradient_method', 'sky_view_factor_angles']
+    ignore = ['northern_hemisphere', 'gradient_method',
+              'sky_view_factor_angles', 'derived_cache', 'horizon_increment']
     for s in backup_config_obj.cfg['topo'].keys():
         src = backup_config_obj.cfg['topo'][s]
         # make not a list if lenth is 1